@@ -1,6 +1,23 @@
 import streamlit as st
 import os
-import pyperclip
+import sys
+
+# Shared helpers (tree_walker, ...) live one level up, next to print_files.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from file_reader import iter_file_contents
+from file_sniffer import load_file
+from token_budget import TokenCounter, fit_to_budget
+from node_table import NO_NODE
+from tree_selection import PARTIAL
+from live_tree import LiveTree
+from document_writer import BufferSink, ClipboardSink, PreviewSink, TeeSink, write_document
+from git_source import GitError, GitRepo
+from diff_scope import DiffScope
+from outline import Outline, Outliner, get_extractor
+from dedup import DigestCache, find_duplicates
+from search_index import SearchIndex, pick_top
+import run_stats
+from run_stats import RunStats
 
 ###############################################################################
 # 1) CONFIG / GLOBALS
@@ -15,258 +32,549 @@ EXCLUDE_DIRS = {
     ".git", ".ipynb_checkpoints", "__pycache__",
     "venv", ".ropeproject"
 }
+# Also skip whatever .gitignore / .contextignore files say (pruned during the walk)
+USE_IGNORE_FILES = True
 
-# A global map from absolute path -> node
-ABS_PATH_TO_NODE = {}
+# Binary-looking files are skipped; files over this size keep only their head and tail
+LARGE_FILE_BYTES = 1024 * 1024
+
+# The tree is shown this many rows at a time
+TREE_PAGE_ROWS = 100
+
+# The generated context goes to the clipboard in full; the preview shows at most this much
+PREVIEW_CHARS = 200_000
+
+# Unchanged lines shown around each hunk when only changed hunks are included
+HUNK_CONTEXT_LINES = 3
+
+# Token estimation for the generated context ("approx" or e.g. "tiktoken:cl100k_base")
+TOKENIZER = "approx"
+
+# Search index for "Select best matches" (relative to where the app runs), and how many matches to select
+SEARCH_INDEX_FILE = ".files_explanation_index.sqlite"
+SEARCH_TOP_K = 20
 
 ###############################################################################
 # 2) DIRECTORY STRUCTURE BUILDING
 ###############################################################################
 
-def get_directory_structure(root_path, base_path=None):
+def get_directory_structure(root_path):
     """
-    Recursively build a tree of dictionaries for directories/files under 'root_path'.
-    Each node has:
-      - name (str)
-      - abs_path (str) : absolute path
-      - rel_path (str) : path relative to the original root
-      - type: 'dir' or 'file'
-      - parent_abs_path (str)
-      - children: list of child nodes
+    Scan 'root_path' into a LiveTree (see live_tree.py): a NodeTable plus
+    selection, kept current by a filesystem watcher. Node 0 is root_path
+    itself; its children are the top level of the tree.
     """
-    if base_path is None:
-        base_path = root_path
+    return LiveTree(root_path, ALLOWED_EXTENSIONS, EXCLUDE_DIRS, use_ignore_files=USE_IGNORE_FILES)
 
-    tree = []
-    try:
-        entries = sorted(os.listdir(root_path))
-        for entry in entries:
-            if entry in EXCLUDE_DIRS:
-                continue
-
-            abs_path = os.path.join(root_path, entry)
-            rel_path = os.path.relpath(abs_path, base_path)
-
-            if os.path.isdir(abs_path):
-                children = get_directory_structure(abs_path, base_path=base_path)
-                tree.append({
-                    "name": entry,
-                    "abs_path": abs_path,
-                    "rel_path": rel_path,
-                    "type": "dir",
-                    "parent_abs_path": root_path,
-                    "children": children
-                })
-            else:
-                _, ext = os.path.splitext(entry)
-                if ext.lower() in ALLOWED_EXTENSIONS:
-                    tree.append({
-                        "name": entry,
-                        "abs_path": abs_path,
-                        "rel_path": rel_path,
-                        "type": "file",
-                        "parent_abs_path": root_path,
-                        "children": []
-                    })
-    except PermissionError:
-        pass
 
-    return tree
+def refresh_tree():
+    """
+    Apply whatever changed on disk since the last rerun (usually nothing,
+    which costs one non-blocking read). Expanded folders follow their new ids.
+    """
+    live = st.session_state.get("live_tree")
+    if live is None:
+        return
+    remap = live.refresh()
+    if remap is not None:
+        st.session_state["expanded_nodes"] = {node for node in map(remap, get_expanded())
+                                              if node is not None and live.table.isdir(node)}
+
 
+###############################################################################
+# 3) SELECTION LOGIC
+###############################################################################
 
-def index_tree_nodes(nodes):
+def get_selection():
     """
-    Populate the global dictionary ABS_PATH_TO_NODE,
-    so we can quickly look up any node to find its parent, etc.
+    The TreeSelection (see tree_selection.py) for the scanned tree, or None.
+    Folder states are derived from it, so toggling a folder never touches
+    the session keys of its descendants.
     """
-    for node in nodes:
-        ABS_PATH_TO_NODE[node["abs_path"]] = node
-        if node["type"] == "dir":
-            index_tree_nodes(node["children"])
+    live = st.session_state.get("live_tree")
+    return live.selection if live is not None else None
+
+
+def toggle_selection(selection, node, selected_key):
+    """
+    on_change callback of a node's checkbox: check/uncheck it and its subtree.
+    Runs before the rerun, so the tree renders with the new state.
+    """
+    selection.set(node, st.session_state[selected_key])
 
 
 ###############################################################################
-# 3) SELECTION LOGIC
+# 4) TREE RENDERING
 ###############################################################################
 
-def propagate_selection_down(node, value):
+def get_expanded():
     """
-    Selecting (or unselecting) a folder also selects/unselects *all its children*.
+    Ids of the expanded folders in the scanned tree.
     """
-    for child in node["children"]:
-        child_sel_key = f"selected_{child['abs_path']}"
-        st.session_state[child_sel_key] = value
+    return st.session_state.setdefault("expanded_nodes", set())
 
-        if child["type"] == "dir":
-            # Recurse
-            propagate_selection_down(child, value)
 
+def toggle_expanded(node):
+    expanded = get_expanded()
+    if node in expanded:
+        expanded.discard(node)
+    else:
+        expanded.add(node)
 
-def propagate_selection_up(abs_path):
+
+def visible_rows(table, expanded):
     """
-    If a file is checked => mark its parent directory as checked,
-    and continue upward until the root is reached.
-    (Unchecking a file does *not* uncheck the parent, to avoid messing up siblings.)
+    Ids of the rows the tree shows, in order: the top level, plus the
+    contents of expanded folders whose parents are expanded too. Collapsed
+    folders are skipped as one id range, so this costs one step per row.
     """
-    if abs_path not in ABS_PATH_TO_NODE:
-        return
+    rows = []
+    end_of, dir_flags = table.subtree_end, table.dir_flags
+    node, n = 1, len(table)
+    while node < n:
+        rows.append(node)
+        if dir_flags[node] and node not in expanded:
+            node = end_of[node]
+        else:
+            node += 1
+    return rows
 
-    node = ABS_PATH_TO_NODE[abs_path]
-    parent_path = node.get("parent_abs_path")
-    if not parent_path or parent_path == abs_path:
-        # Reached the top or no parent
-        return
 
-    parent_sel_key = f"selected_{parent_path}"
-    st.session_state[parent_sel_key] = True
+def filtered_rows(table, query):
+    """
+    Rows for a name filter: every match, plus the folders leading to it.
+    """
+    rows = set()
+    for node in table.search(query):
+        while node > 0 and node not in rows:
+            rows.add(node)
+            node = table.parent[node]
+    return sorted(rows)
 
-    propagate_selection_up(parent_path)
 
+def row_prefix(table, node):
+    """
+    The '│   ' / '├── ' drawing in front of a row, from its ancestors' positions.
+    """
+    parts = ["└── " if table.next_sibling[node] == NO_NODE else "├── "]
+    parent = table.parent[node]
+    while parent > 0:
+        parts.append("    " if table.next_sibling[parent] == NO_NODE else "│   ")
+        parent = table.parent[parent]
+    return "".join(reversed(parts))
 
-###############################################################################
-# 4) TREE RENDERING
-###############################################################################
 
-def render_tree_nodes(nodes, prefix=""):
+def render_tree_window(selection, rows, expandable=True):
     """
-    Render an ASCII-style tree in the Streamlit UI.
-    - prefix: leading spaces/lines (e.g. '│   ') to show hierarchy
+    Render only one page of 'rows' (TREE_PAGE_ROWS of them), so the number
+    of widgets per rerun stays the same however large the tree is.
     """
-    for i, node in enumerate(nodes):
-        is_last = (i == len(nodes) - 1)
-        branch = "└── " if is_last else "├── "
-        # For children, use either "    " or "│   "
-        child_prefix = prefix + ("    " if is_last else "│   ")
+    pages = max(1, -(-len(rows) // TREE_PAGE_ROWS))
+    # Collapsing folders or filtering can leave the current page out of range
+    st.session_state["tree_page"] = min(st.session_state.get("tree_page", 1), pages)
+    page = st.number_input(f"Page (of {pages}, {len(rows)} rows):", min_value=1, max_value=pages,
+                           step=1, key="tree_page")
+    start = (page - 1) * TREE_PAGE_ROWS
+    for node in rows[start:start + TREE_PAGE_ROWS]:
+        render_tree_row(selection, node, expandable)
 
-        expanded_key = f"expanded_{node['abs_path']}"
-        selected_key = f"selected_{node['abs_path']}"
-
-        # Ensure keys exist in st.session_state
-        if expanded_key not in st.session_state:
-            st.session_state[expanded_key] = False
-        if selected_key not in st.session_state:
-            st.session_state[selected_key] = False
-
-        # UI layout for each line
-        col_arrow, col_label = st.columns([0.07, 0.93])
-
-        with col_arrow:
-            # Show an arrow button for directories
-            if node["type"] == "dir":
-                arrow_symbol = "▼" if st.session_state[expanded_key] else "►"
-                if st.button(arrow_symbol, key=f"arrow_btn_{node['abs_path']}",
-                             help="Expand/Collapse folder"):
-                    st.session_state[expanded_key] = not st.session_state[expanded_key]
-            else:
-                st.write("")  # no arrow for files
 
-        with col_label:
-            old_val = st.session_state[selected_key]
-            label_text = prefix + branch + node["name"]
-            new_val = st.checkbox(label_text, key=selected_key)
+def render_tree_row(selection, node, expandable=True):
+    """
+    One line of the tree: expand arrow, checkbox, and a comment box for selected files.
+    """
+    table = selection.table
+    abs_path = table.abs_path(node)
+    is_dir = table.isdir(node)
+    selected_key = f"selected_{abs_path}"
+    # The checkbox mirrors the selection model (set before the widget is created)
+    st.session_state[selected_key] = selection.is_checked(node)
+
+    # UI layout for each line
+    col_arrow, col_label = st.columns([0.07, 0.93])
+
+    with col_arrow:
+        # Show an arrow button for directories
+        if is_dir and expandable:
+            arrow_symbol = "▼" if node in get_expanded() else "►"
+            st.button(arrow_symbol, key=f"arrow_btn_{abs_path}", help="Expand/Collapse folder",
+                      on_click=toggle_expanded, args=(node,))
+        else:
+            st.write("")  # no arrow for files
 
-            # If user just toggled this directory => propagate to children
-            if node["type"] == "dir" and new_val != old_val:
-                propagate_selection_down(node, new_val)
+    with col_label:
+        label_text = row_prefix(table, node) + table.name(node)
+        if selection.state(node) == PARTIAL:
+            selected, total = selection.counts(node)
+            label_text += f"  ({selected}/{total} selected)"
+        checked = st.checkbox(label_text, key=selected_key,
+                              on_change=toggle_selection, args=(selection, node, selected_key))
 
-            # If user *just checked* a file => propagate upward to parents
-            if node["type"] == "file" and (not old_val) and new_val:
-                propagate_selection_up(node["abs_path"])
+        # If it's a file and is selected => show a comment box
+        if not is_dir and checked:
+            comment_key = f"comment_{abs_path}"
+            st.text_input("Comment:", key=comment_key, placeholder="(Optional comment...)")
 
-            # If it's a file and is selected => show a comment box
-            if node["type"] == "file" and new_val:
-                comment_key = f"comment_{node['abs_path']}"
-                st.text_input("Comment:", key=comment_key, placeholder="(Optional comment...)")
 
-        # If directory is expanded, render children
-        if node["type"] == "dir" and st.session_state[expanded_key]:
-            render_tree_nodes(node["children"], prefix=child_prefix)
+def render_tree(selection):
+    """
+    The tree, or the matches for the filter box, one page at a time.
+    """
+    query = st.text_input("Filter by name:", key="tree_filter", placeholder="(e.g. test_ or .yml)")
+    if query.strip():
+        rows = filtered_rows(selection.table, query.strip())
+        if not rows:
+            st.info("No names match the filter.")
+            return
+        # Matches are shown with all their folders open, so the arrows don't apply
+        render_tree_window(selection, rows, expandable=False)
+    else:
+        render_tree_window(selection, visible_rows(selection.table, get_expanded()))
 
 
 ###############################################################################
 # 5) BUILDING THE FINAL TEXT
 ###############################################################################
 
-def build_selected_tree_text(nodes, prefix=""):
+def iter_selected_tree_lines(selection, node=0, prefix="", token_counts=None, included=None, dir_path=None,
+                             duplicates=None):
     """
-    Create an ASCII tree of only the selected items (folders or files).
+    Yield the lines of an ASCII tree of only the selected items (folders or files) below 'node'.
+    Subtrees without anything selected are skipped without being visited.
+    With 'token_counts', each file shows its estimated tokens; files left
+    out of 'included' (to fit a token budget) are marked as omitted.
+    Files in 'duplicates' are marked with the file they repeat.
     """
-    lines = []
-    for i, node in enumerate(nodes):
-        is_last = (i == len(nodes) - 1)
+    table = selection.table
+    if dir_path is None:
+        dir_path = table.abs_path(node)
+    children = list(table.children(node))
+    for i, child in enumerate(children):
+        if not selection.shows(child):
+            continue
+        is_last = (i == len(children) - 1)
         branch = "└── " if is_last else "├── "
         child_prefix = prefix + ("    " if is_last else "│   ")
+        name = table.name(child)
+        abs_path = os.path.join(dir_path, name)
 
-        selected_key = f"selected_{node['abs_path']}"
-        is_selected = st.session_state.get(selected_key, False)
-
-        if node["type"] == "dir":
-            # Look at children
-            subtree = build_selected_tree_text(node["children"], child_prefix)
-            # If directory or any child is selected => show it
-            if is_selected or subtree.strip():
-                lines.append(prefix + branch + node["name"] + "/")
-            if subtree.strip():
-                lines.append(subtree)
+        if table.isdir(child):
+            yield prefix + branch + name + "/"
+            yield from iter_selected_tree_lines(selection, child, child_prefix, token_counts, included, abs_path,
+                                                duplicates)
         else:
-            if is_selected:
-                lines.append(prefix + branch + node["name"])
+            line = prefix + branch + name
+            if token_counts is not None:
+                note = "" if included is None or abs_path in included else ", omitted"
+                line += f" ({token_counts.get(abs_path, 0)} tokens{note})"
+            if duplicates and abs_path in duplicates:
+                line += f" (identical to {table.rel_path(table.find(duplicates[abs_path]))})"
+            yield line
+
+
+def build_selected_tree_text(selection, node=0, prefix="", token_counts=None, included=None):
+    return "\n".join(iter_selected_tree_lines(selection, node, prefix, token_counts, included))
 
-    return "\n".join(lines)
 
+def load_for_context(abs_path):
+    return load_file(abs_path, LARGE_FILE_BYTES, large_policy="truncate")
 
-def assemble_file_contents(nodes):
+
+def collect_selected_files(selection):
+    """
+    List the selected files as (node id, abs_path), in tree order.
     """
-    Gather file contents for each selected file.
+    table = selection.table
+    return [(node, table.abs_path(node)) for node in selection.selected_files()]
+
+
+def iter_file_blocks(selection, included=None, scope=None, duplicates=None):
+    """
+    Yield the contents block of each selected file.
     Skip printing 'COMMENT:' if it's empty.
+    Files are read concurrently by the shared reader, but blocks stay in tree order.
+    If 'included' is given, only those abs paths are printed.
+    With a DiffScope, changed files show only their changed hunks.
+    Files wants_outline() picks are shown as outlines.
+    Files in 'duplicates' aren't read: they refer to the identical file before them.
     """
-    output_list = []
-    for node in nodes:
-        sel_key = f"selected_{node['abs_path']}"
-        if node["type"] == "dir":
-            # Recurse
-            child_text = assemble_file_contents(node["children"])
-            if child_text.strip():
-                output_list.append(child_text)
+    table = selection.table
+    duplicates = duplicates or {}
+    by_path = {abs_path: node for node, abs_path in collect_selected_files(selection)
+               if included is None or abs_path in included}
+    # Changed files only show their hunks, so there's no point reading them whole
+    hunked = {abs_path for abs_path in by_path if scope is not None and scope.is_changed(abs_path)}
+    fresh = iter_file_contents([abs_path for abs_path in by_path
+                                if abs_path not in duplicates and abs_path not in hunked], read=load_for_context)
+
+    for abs_path in by_path:
+        comment = st.session_state.get(f"comment_{abs_path}", "").strip()
+        if abs_path in duplicates:
+            original = table.rel_path(by_path[duplicates[abs_path]])
+            lines = [f"FILE: {table.rel_path(by_path[abs_path])} (identical to {original})"]
+            if comment:
+                lines.append(f"COMMENT: {comment}")
+            yield "\n".join(lines) + "\n"
+            continue
+        if abs_path in hunked:
+            content = scope.hunks(abs_path)
         else:
-            if st.session_state.get(sel_key, False):
-                comment_key = f"comment_{node['abs_path']}"
-                comment = st.session_state.get(comment_key, "").strip()
+            _, content = next(fresh)
+            if wants_outline(abs_path):
+                content = get_outliner().outline(abs_path, content)
 
-                try:
-                    with open(node["abs_path"], "r", encoding="utf-8", errors="replace") as f:
-                        content = f.read()
-                except Exception as e:
-                    content = f"Error reading file: {e}"
+        lines = []
+        note = " (outline)" if isinstance(content, Outline) else ""
+        lines.append(f"FILE: {table.rel_path(by_path[abs_path])}{note}")
+        if comment:
+            lines.append(f"COMMENT: {comment}")
+        lines.append("```")
+        lines.append(content)
+        lines.append("```")
+        yield "\n".join(lines) + "\n"
 
-                lines = []
-                lines.append(f"FILE: {node['rel_path']}")
-                if comment:
-                    lines.append(f"COMMENT: {comment}")
-                lines.append("```")
-                lines.append(content)
-                lines.append("```")
-                output_list.append("\n".join(lines) + "\n")
 
-    return "\n".join(output_list)
+def assemble_file_contents(selection, included=None):
+    return "\n".join(iter_file_blocks(selection, included))
 
 
-def assemble_final_text(tree):
+def get_digest_cache():
     """
-    1) ASCII Tree of selected items
-    2) Then file contents
+    File digests for the session, by stat, so only changed files are hashed again.
+    """
+    if "digest_cache" not in st.session_state:
+        st.session_state["digest_cache"] = DigestCache()
+    return st.session_state["digest_cache"]
+
+
+def selected_duplicates(selection, scope=None):
+    """
+    {abs path: abs path of the identical file before it} for the selected
+    files that repeat an earlier one. Changed files under a DiffScope show
+    their own hunks, so they're never references.
+    """
+    paths = [abs_path for _, abs_path in collect_selected_files(selection)
+             if scope is None or not scope.is_changed(abs_path)]
+    return find_duplicates(paths, cache=get_digest_cache())
+
+
+def get_token_counter(key="token_counter"):
     """
-    tree_part = build_selected_tree_text(tree)
-    files_part = assemble_file_contents(tree)
+    One TokenCounter per session: counts are cached by stat, so recounting
+    the selection on every rerun only reads files that changed.
+    (Outlined files are counted by a second one, under another key.)
+    """
+    if key not in st.session_state:
+        st.session_state[key] = TokenCounter(TOKENIZER)
+    return st.session_state[key]
 
-    out = []
-    out.append("=== SELECTED FILES TREE ===")
-    out.append(tree_part if tree_part.strip() else "(No items selected)")
-    out.append("")
-    out.append("=== FILE CONTENTS ===\n")
-    out.append(files_part if files_part.strip() else "(No file contents)")
 
-    return "\n".join(out)
+def get_outliner():
+    """
+    One Outliner per session, so outlines are only worked out once per file content.
+    """
+    if "outliner" not in st.session_state:
+        st.session_state["outliner"] = Outliner()
+    return st.session_state["outliner"]
+
+
+def wants_outline(abs_path):
+    """
+    With "outline files without a comment" on, files nobody commented on are
+    outlined; the commented ones are under discussion, so they stay whole.
+    """
+    if not st.session_state.get("outline_uncommented"):
+        return False
+    if st.session_state.get(f"comment_{abs_path}", "").strip():
+        return False
+    return get_extractor(abs_path) is not None
+
+
+def load_outline(abs_path):
+    return get_outliner().outline(abs_path, load_for_context(abs_path))
+
+
+def selected_token_counts(selection, scope=None, duplicates=None):
+    duplicates = duplicates or {}
+    table = selection.table
+    selected = [abs_path for _, abs_path in collect_selected_files(selection)]
+    counter = get_token_counter()
+    # Changed files are printed as hunks, so those are counted instead of the whole files
+    hunked = {abs_path for abs_path in selected if scope is not None and scope.is_changed(abs_path)}
+    outlined = {abs_path for abs_path in selected
+                if wants_outline(abs_path) and abs_path not in duplicates and abs_path not in hunked}
+    whole = [abs_path for abs_path in selected
+             if abs_path not in outlined and abs_path not in duplicates and abs_path not in hunked]
+    counts = counter.count_files(whole, read=load_for_context)
+    if outlined:
+        # Outlines are counted separately, so switching back and forth doesn't recount everything
+        counts.update(get_token_counter("outline_token_counter").count_files(outlined, read=load_outline))
+    for abs_path in hunked:
+        counts[abs_path] = counter.count_text(scope.hunks(abs_path))
+    # A repeated file only costs its reference
+    for abs_path, original in duplicates.items():
+        counts[abs_path] = counter.count_text(
+            f"FILE: {table.rel_path(table.find(abs_path))} (identical to {table.rel_path(table.find(original))})")
+    return {abs_path: counts[abs_path] for abs_path in selected}
+
+
+def select_changed_files(selection, root, base):
+    """
+    Check every file changed since the git revision 'base' (compared with
+    the working tree) that is in the tree. Returns how many were checked.
+    """
+    with GitRepo(root) as repo:
+        changed = DiffScope(repo, base).files_under(root)
+    table = selection.table
+    checked = 0
+    for path in changed:
+        node = table.find(path)
+        if node is not None and not table.isdir(node):
+            selection.set(node, True)
+            checked += 1
+    return checked
+
+
+def select_best_matches(selection, root, query, k, max_tokens=0):
+    """
+    Replace the selection with the 'k' files that best match 'query' (and,
+    with 'max_tokens', only as many as fit in it). The search index is
+    brought up to date first; only files that changed since are read.
+    Returns the selected abs paths, best first.
+    """
+    table = selection.table
+    files = [path for node, path in table.iter_paths() if not table.isdir(node)]
+    with SearchIndex(SEARCH_INDEX_FILE) as index:
+        index.update(files, read=load_for_context, prune=[root])
+        ranked = index.search(query, files)
+    counter = get_token_counter()
+    cost = lambda abs_path: counter.count_files([abs_path], read=load_for_context)[abs_path]
+    picked = pick_top(ranked, k, max_tokens or None, cost)
+    selection.clear()
+    for abs_path in picked:
+        selection.set(table.find(abs_path), True)
+    return picked
+
+
+def selected_stamps(selection):
+    """
+    (abs path, mtime, size) of every selected file, to tell when they changed on disk.
+    """
+    stamps = []
+    for _, abs_path in collect_selected_files(selection):
+        try:
+            stat = os.stat(abs_path)
+        except OSError:
+            continue
+        stamps.append((abs_path, stat.st_mtime_ns, stat.st_size))
+    return tuple(stamps)
+
+
+def drop_diff_scope():
+    """
+    Forget the session's DiffScope, closing its repository.
+    """
+    held = st.session_state.pop("diff_scope", None)
+    if held is not None:
+        held["repo"].close()
+
+
+def get_diff_scope(selection, root):
+    """
+    The DiffScope when "changed hunks only" is on, else None (also after
+    showing a git error). Kept for the session, with its repository and git
+    process, so reruns reuse the diff and the hunks already split out of it;
+    it is made again when the root, the base revision, HEAD, the context
+    lines or a selected file change.
+    """
+    base = st.session_state.get("diff_base", "").strip()
+    if not base or not st.session_state.get("hunks_only"):
+        drop_diff_scope()
+        return None
+    context_lines = st.session_state.get("hunk_context", HUNK_CONTEXT_LINES)
+    held = st.session_state.get("diff_scope")
+    if held is not None and held["root"] != root:
+        drop_diff_scope()
+        held = None
+    try:
+        if held is None:
+            held = {"root": root, "repo": GitRepo(root), "key": None, "scope": None}
+            st.session_state["diff_scope"] = held
+        repo = held["repo"]
+        key = (repo.resolve(base), repo.resolve("HEAD"), context_lines, selected_stamps(selection))
+        if key != held["key"]:
+            held["scope"] = DiffScope(repo, base, context_lines=context_lines)
+            held["key"] = key
+    except GitError as e:
+        st.error(f"git: {e}")
+        drop_diff_scope()
+        return None
+    return held["scope"]
+
+
+def choose_files_for_budget(selection, token_counts, max_tokens):
+    """
+    Pick which selected files fit in 'max_tokens'.
+    Files with a comment are the ones under discussion, so they go first.
+    """
+    items = []
+    for _, abs_path in collect_selected_files(selection):
+        comment = st.session_state.get(f"comment_{abs_path}", "").strip()
+        items.append((abs_path, token_counts.get(abs_path, 0), 2 if comment else 1))
+    return fit_to_budget(items, max_tokens)
+
+
+def iter_final_text(selection, max_tokens=None, scope=None):
+    """
+    The final text as a stream of chunks, in one pass over the selection:
+    1) ASCII Tree of selected items (with token estimates)
+    2) Then file contents
+    With 'max_tokens', only the files that fit the budget get their contents included.
+    With a DiffScope, changed files contribute only their changed hunks.
+    Identical files are printed once; later copies refer to the first.
+    """
+    with run_stats.phase("dedupe"):
+        duplicates = selected_duplicates(selection, scope)
+    with run_stats.phase("tokens"):
+        token_counts = selected_token_counts(selection, scope, duplicates)
+    included = None
+    if max_tokens:
+        included = choose_files_for_budget(selection, token_counts, max_tokens)
+        # A reference is no use without the file it points to
+        included = {path for path in included if path not in duplicates or duplicates[path] in included}
+
+    yield "=== SELECTED FILES TREE ===\n"
+    empty = True
+    for line in iter_selected_tree_lines(selection, token_counts=token_counts, included=included,
+                                         duplicates=duplicates):
+        empty = False
+        yield line + "\n"
+    if empty:
+        yield "(No items selected)\n"
+
+    if token_counts:
+        kept = [path for path in token_counts if included is None or path in included]
+        total_line = f"Total: ~{sum(token_counts[path] for path in kept)} tokens in {len(kept)} files"
+        if len(kept) < len(token_counts):
+            total_line += f" ({len(token_counts) - len(kept)} omitted to fit {max_tokens} tokens)"
+        yield total_line + "\n"
+    yield "\n"
+    yield "=== FILE CONTENTS ===\n\n"
+
+    empty = True
+    for block in iter_file_blocks(selection, included, scope, duplicates):
+        if not empty:
+            yield "\n"
+        empty = False
+        yield block
+    if empty:
+        yield "(No file contents)"
+
+
+def assemble_final_text(selection, max_tokens=None, scope=None):
+    sink = BufferSink()
+    write_document(iter_final_text(selection, max_tokens, scope), sink)
+    return sink.getvalue()
 
 
 ###############################################################################
@@ -292,30 +600,81 @@ def main():
         # ...but we do NOT wipe out the old session keys (comments, selections)
         # in case they're relevant for the same root directory.
 
-        # Clear global map and rebuild it
-        ABS_PATH_TO_NODE.clear()
-        new_tree = get_directory_structure(root_dir)
-        st.session_state["directory_tree"] = new_tree
-        index_tree_nodes(new_tree)
-        st.success("Directory scanned! (Previous comments/selections preserved if same path)")
+        old = st.session_state.get("live_tree")
+        if old is not None and old.root == root_dir:
+            # Already watched: changes are picked up on every rerun anyway
+            st.success("Directory is up to date (changes on disk are applied as they happen)")
+        else:
+            live = get_directory_structure(root_dir)
+            expanded = get_expanded()
+            if old is not None:
+                live.selection.carry_over(old.selection)
+                # Keep the same folders open, by path
+                open_paths = {old.table.abs_path(node) for node in expanded if node < len(old.table)}
+                st.session_state["expanded_nodes"] = {node for node, path in live.table.iter_paths()
+                                                      if path in open_paths and live.table.isdir(node)}
+                old.close()
+            st.session_state["live_tree"] = live
+            st.success("Directory scanned! (Previous comments/selections preserved if same path)")
+
+    refresh_tree()
 
     # Render the tree if it exists
-    if "directory_tree" in st.session_state:
-        render_tree_nodes(st.session_state["directory_tree"], prefix="")
+    selection = get_selection()
+    if selection is not None:
+        render_tree(selection)
+
+        # For review: check the files changed since a git revision, optionally printing only their hunks
+        root = st.session_state["live_tree"].root
+        diff_base = st.text_input("Changed since (git revision):", key="diff_base", placeholder="(e.g. HEAD or main)")
+        if st.button("Select changed files") and diff_base.strip():
+            try:
+                st.success(f"Selected {select_changed_files(selection, root, diff_base.strip())} changed files")
+            except GitError as e:
+                st.error(f"git: {e}")
+        if st.checkbox("Only changed hunks for changed files", key="hunks_only"):
+            st.number_input("Context lines around hunks:", min_value=0, value=HUNK_CONTEXT_LINES, key="hunk_context")
+        scope = get_diff_scope(selection, root)
+
+        # Full text for the files under discussion, outlines for the rest
+        st.checkbox("Outline files without a comment (imports, signatures, docstrings)", key="outline_uncommented")
+
+        token_counts = selected_token_counts(selection, scope, selected_duplicates(selection, scope))
+        st.caption(f"Selected: {len(token_counts)} files, ~{sum(token_counts.values())} tokens")
+        max_tokens = st.number_input("Max tokens (0 = no limit):", min_value=0, value=0, step=1000)
+
+        # Or let a search pick the files: the best matches for a description, within the budget above
+        query = st.text_input("Find files about:", key="search_query", placeholder="(e.g. retry logic in the uploader)")
+        top_k = st.number_input("How many matches:", min_value=1, value=SEARCH_TOP_K, key="search_top_k")
+        if st.button("Select best matches (replaces the selection)") and query.strip():
+            picked = select_best_matches(selection, root, query.strip(), top_k, max_tokens)
+            if picked:
+                best = ", ".join(selection.table.rel_path(selection.table.find(path)) for path in picked[:3])
+                st.success(f"Selected {len(picked)} files (best: {best})")
+            else:
+                st.warning("No files match.")
 
         if st.button("Generate & Copy Context"):
-            final_text = assemble_final_text(st.session_state["directory_tree"])
-            if final_text.strip():
-                try:
-                    pyperclip.copy(final_text)
-                    st.success("Context generated and copied to clipboard!")
-                except Exception as e:
-                    st.error(f"Could not copy to clipboard: {e}")
-
-                st.subheader("Context Preview")
-                st.text_area("Final Context", value=final_text, height=400)
-            else:
+            if selection.count[0] == 0:
                 st.warning("No files selected or empty context.")
+                return
+            # Streamed straight to the clipboard; only the start is kept for the preview
+            preview = PreviewSink(PREVIEW_CHARS)
+            stats = RunStats()
+            stats.watch_cache("tokens", get_token_counter())
+            try:
+                with run_stats.collecting(stats), stats.phase("generate"):
+                    write_document(iter_final_text(selection, max_tokens, scope), TeeSink(ClipboardSink(), preview))
+                st.success("Context generated and copied to clipboard!")
+            except Exception as e:
+                st.error(f"Could not copy to clipboard: {e}")
+            with st.expander("Where the time went"):
+                st.text(stats.format_summary())
+
+            st.subheader("Context Preview")
+            st.text_area("Final Context", value=preview.getvalue(), height=400)
+            if preview.truncated:
+                st.caption(f"Preview shows the first {PREVIEW_CHARS} characters; the clipboard has everything.")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,214 @@
+"""
+Tree scans and blocking iterators as asyncio tasks, for the async server
+(flask app in progress/async_server.py).
+
+scan_tree_async() walks a root like tree_walker.scan_tree(), with the same
+result, but every directory read is a job on an executor the caller passes
+in, so one bounded pool serves every scan a server runs and the event loop
+never blocks on the disk. A scan has at most 'max_in_flight' reads queued
+at a time: scans sharing a pool take turns, instead of a huge tree queueing
+all its directories ahead of a small one. Cancelling the task stops the
+scan; reads that haven't started are dropped, running ones are discarded.
+
+ScanHub runs at most one scan per root (and ignore-file base) at a time.
+Everyone asking for a root that is being scanned waits on the same task and
+sees the same progress, and when the last of them goes away the scan is
+cancelled.
+
+iterate_in_executor() drives a blocking iterator (such as a document being
+assembled) from a coroutine, one item per executor job.
+"""
+import asyncio
+import contextlib
+import os
+import time
+
+from ignore_rules import IGNORE_FILES, load_ignore_rules
+from tree_walker import read_directory
+
+DEFAULT_IN_FLIGHT = 8
+
+
+async def scan_tree_async(root, allowed_extensions=None, exclude_dirs=(), ignore=None, listing_cache=None,
+                          executor=None, max_in_flight=DEFAULT_IN_FLIGHT, progress=None):
+    """
+    tree_walker.scan_tree() as a coroutine, reading directories on
+    'executor' (None for the loop's default one). progress(dirs listed,
+    files seen, dirs still to read) is called as listings come in.
+    """
+    loop = asyncio.get_running_loop()
+    listings = {}
+    waiting = [(root, ignore)]
+    running = {}  # future -> dir path
+    finished = asyncio.Queue()
+    files = 0
+    try:
+        while waiting or running:
+            while waiting and len(running) < max_in_flight:
+                path, rules = waiting.pop()
+                future = loop.run_in_executor(executor, read_directory, path, allowed_extensions, exclude_dirs,
+                                              rules, listing_cache)
+                running[future] = path
+                future.add_done_callback(finished.put_nowait)
+            # Take every listing that's in, so progress is reported once per batch
+            batch = [await finished.get()]
+            while not finished.empty():
+                batch.append(finished.get_nowait())
+            for future in batch:
+                path = running.pop(future)
+                entries, rules = future.result()
+                listings[path] = entries
+                for name, is_dir in entries:
+                    if is_dir:
+                        waiting.append((os.path.join(path, name), rules and rules.descend(name)))
+                    else:
+                        files += 1
+            if progress is not None:
+                progress(len(listings), files, len(waiting) + len(running))
+    finally:
+        for future in running:
+            future.cancel()
+    return listings
+
+
+class Scan:
+    """
+    One scan run by a ScanHub: its task, its progress so far and how many
+    are waiting on it. 'base' is where ignore files start to apply outside a
+    git repository (see ignore_rules.load_ignore_rules).
+    """
+
+    def __init__(self, root, base=None):
+        self.root = root
+        self.base = base
+        self.started = time.perf_counter()
+        self.dirs = 0
+        self.files = 0
+        self.pending = 1
+        self.users = 0
+        self.cancelled = False
+        self.task = None
+
+    def update(self, dirs, files, pending):
+        self.dirs, self.files, self.pending = dirs, files, pending
+
+    def snapshot(self):
+        return {
+            "root": self.root,
+            "dirs": self.dirs,
+            "files": self.files,
+            "pending": self.pending,
+            "seconds": round(time.perf_counter() - self.started, 3),
+            "done": self.task.done(),
+        }
+
+
+class ScanHub:
+    """
+    Full scans of roots, with the given filters, shared between everyone
+    who asks for the same root while it is being scanned. Use from the
+    event loop's thread only.
+    """
+
+    def __init__(self, executor, allowed_extensions=None, exclude_dirs=(), use_ignore_files=True,
+                 listing_cache=None, max_in_flight=DEFAULT_IN_FLIGHT):
+        self.executor = executor
+        self.allowed_extensions = allowed_extensions
+        self.exclude_dirs = exclude_dirs
+        self.use_ignore_files = use_ignore_files
+        self.listing_cache = listing_cache
+        self.max_in_flight = max_in_flight
+        self.scans = {}  # (root, base) -> Scan in progress
+
+    def running(self):
+        return [scan.snapshot() for scan in self.scans.values()]
+
+    async def _run(self, scan):
+        try:
+            ignore = None
+            if self.use_ignore_files:
+                loop = asyncio.get_running_loop()
+                ignore = await loop.run_in_executor(self.executor, load_ignore_rules, scan.root, IGNORE_FILES,
+                                                    scan.base)
+            return await scan_tree_async(scan.root, self.allowed_extensions, self.exclude_dirs, ignore,
+                                         self.listing_cache, self.executor, self.max_in_flight, scan.update)
+        finally:
+            if self.scans.get((scan.root, scan.base)) is scan:
+                del self.scans[scan.root, scan.base]
+
+    @contextlib.asynccontextmanager
+    async def joined(self, root, base=None):
+        """
+        The Scan of 'root' (started unless one is running), kept going for
+        the 'with' block; if it's still running when the last block using
+        it exits, it is cancelled. 'base' is the root of the tree 'root' is
+        a folder of, whose ignore files apply to it even outside git.
+        """
+        root = os.path.normpath(root)
+        base = os.path.normpath(base) if base is not None else None
+        if base == root:
+            # The same rules as no base at all, so the same scan
+            base = None
+        key = (root, base)
+        scan = self.scans.get(key)
+        # A scan that was just cancelled may not have wound down yet
+        if scan is None or scan.cancelled:
+            scan = Scan(root, base)
+            scan.task = asyncio.ensure_future(self._run(scan))
+            self.scans[key] = scan
+        scan.users += 1
+        try:
+            yield scan
+        finally:
+            scan.users -= 1
+            if not scan.users and not scan.task.done():
+                scan.cancelled = True
+                scan.task.cancel()
+                # A task cancelled before it started never gets to remove itself
+                if self.scans.get(key) is scan:
+                    del self.scans[key]
+
+    async def scan(self, root, base=None):
+        """
+        {dir_path: entries} for everything under 'root' (see
+        tree_walker.scan_tree), from the scan in progress if there is one.
+        """
+        async with self.joined(root, base) as scan:
+            # Shielded: one waiter being cancelled mustn't cancel it for the others
+            return await asyncio.shield(scan.task)
+
+    async def watch(self, root, interval=0.25):
+        """
+        Yield Scan.snapshot()s of the scan of 'root' every 'interval'
+        seconds, and a last one (with "done" true) when it's finished.
+        Raises whatever the scan raised.
+        """
+        async with self.joined(root) as scan:
+            while True:
+                done, _ = await asyncio.wait({scan.task}, timeout=interval)
+                yield scan.snapshot()
+                if done:
+                    scan.task.result()
+                    return
+
+
+async def iterate_in_executor(iterable, executor):
+    """
+    Yield the items of the blocking 'iterable', each fetched by a job on
+    'executor'. If the consumer stops early or is cancelled, the iterator
+    is closed on the executor as soon as the item it's working on is done.
+    """
+    iterator = iter(iterable)
+    end = object()
+    job = None
+    try:
+        while True:
+            job = executor.submit(next, iterator, end)
+            item = await asyncio.wrap_future(job)
+            if item is end:
+                return
+            yield item
+    finally:
+        close = getattr(iterator, "close", None)
+        if close is not None and job is not None:
+            job.add_done_callback(lambda _: executor.submit(close))
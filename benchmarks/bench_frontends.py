@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+"""
+Benchmark: print_files.py, the Streamlit app and the Flask app on a synthetic repository.
+
+Generates a deterministic repository (see synthetic_repo.py), then runs each
+front end on it in a fresh process, timing every phase separately (walk,
+read, assemble, serve; cold and warm caches) and recording the process's
+peak RSS after each phase. Results go to a JSON file that can be compared
+with one from another commit. Everything runs offline: the Flask app is
+driven through its test client. A front end whose framework isn't
+installed is reported as skipped.
+
+    python benchmarks/bench_frontends.py
+    python benchmarks/bench_frontends.py --entries 1000000 --median-bytes 256 --output big.json
+    python benchmarks/bench_frontends.py --frontends cli,flask --compare before.json
+"""
+import argparse
+import contextlib
+import importlib.util
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from synthetic_repo import add_generator_arguments, generator_params, make_synthetic_repo
+
+FRONTENDS = ["cli", "streamlit", "flask"]
+
+
+def peak_rss_mb():
+    """
+    The most memory this process has held so far, in MB (None where the
+    resource module doesn't exist).
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Bytes on macOS, kilobytes elsewhere
+    return round(rss / 1048576 if sys.platform == "darwin" else rss / 1024, 1)
+
+
+class Phases:
+    """
+    Named timings, each with the peak RSS reached by the end of it.
+    """
+
+    def __init__(self):
+        self.results = {}
+
+    @contextlib.contextmanager
+    def __call__(self, name):
+        start = time.perf_counter()
+        yield
+        self.results[name] = {"seconds": round(time.perf_counter() - start, 4), "peak_rss_mb": peak_rss_mb()}
+
+
+def load_app(folder):
+    # The apps live in folders with spaces in their names, so they're loaded by path
+    path = os.path.join(REPO_DIR, folder, "context_manager.py")
+    spec = importlib.util.spec_from_file_location(f"bench_{folder.split()[0].lower()}_app", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def bench_cli(root, scratch, phases):
+    import print_files
+    from file_reader import iter_file_contents
+    from file_sniffer import load_file, DEFAULT_LARGE_FILE_BYTES
+
+    # print_files keeps its caches and output in the working directory
+    os.chdir(scratch)
+    with phases("walk"):
+        print_files.tree_lines(root)
+    files = list(print_files.all_files)
+    print_files.all_files.clear()
+    with phases("read"):
+        read = lambda path: load_file(path, DEFAULT_LARGE_FILE_BYTES, large_policy="truncate")
+        for _ in iter_file_contents(files, read=read, size_of=lambda path: DEFAULT_LARGE_FILE_BYTES):
+            pass
+
+    output = os.path.join(scratch, "files_explanation.txt")
+    print_files.paths = [root]
+    for name, extra in [("assemble", []), ("assemble_warm", []), ("assemble_tokens", ["--tokens"])]:
+        sys.argv = ["print_files.py", "--output", output] + extra
+        with phases(name):
+            print_files.run(print_files.parse_args())
+        print_files.all_files.clear()
+    return {"files": len(files), "output_bytes": os.path.getsize(output)}
+
+
+def bench_streamlit(root, scratch, phases):
+    app = load_app("Streamlit app in progress")
+    os.chdir(scratch)
+    with phases("walk"):
+        live = app.get_directory_structure(root)
+    try:
+        selection = live.selection
+        selection.set(0, True)
+        with phases("assemble"):
+            text = app.assemble_final_text(selection)
+        with phases("assemble_warm"):
+            app.assemble_final_text(selection)
+        return {"files": selection.count[0], "output_bytes": len(text.encode("utf-8"))}
+    finally:
+        live.close()
+
+
+def bench_flask(root, scratch, phases):
+    app = load_app("flask app in progress")
+    os.chdir(scratch)
+    client = app.app.test_client()
+
+    def get(url, **query):
+        resp = client.get(url, query_string=query)
+        if resp.status_code != 200:
+            raise RuntimeError(f"{url}: HTTP {resp.status_code}")
+        return resp.get_json()
+
+    def submit(**options):
+        # Read the stream as a browser would, without keeping it
+        resp = client.post("/api/submit", json=dict(root=root, selected=[root], **options))
+        if resp.status_code != 200:
+            raise RuntimeError(f"/api/submit: HTTP {resp.status_code}")
+        size = sum(len(chunk) for chunk in resp.iter_encoded())
+        resp.close()
+        return size
+
+    with phases("tree"):
+        get("/api/tree", root=root)
+    with phases("tree_warm"):
+        get("/api/tree", root=root)
+    with phases("children"):
+        get("/api/children", path=root, root=root)
+    with phases("submit"):
+        size = submit()
+    with phases("submit_gzip"):
+        gzip_size = submit(gzip=True)
+    return {"output_bytes": size, "gzip_bytes": gzip_size}
+
+
+WORKERS = {"cli": bench_cli, "streamlit": bench_streamlit, "flask": bench_flask}
+
+
+def run_worker(frontend, root):
+    """
+    In the child process: benchmark one front end, print the results as JSON.
+    """
+    phases = Phases()
+    scratch = tempfile.mkdtemp(prefix=f"bench_{frontend}_")
+    try:
+        info = WORKERS[frontend](root, scratch, phases)
+        result = {"phases": phases.results, "info": info, "peak_rss_mb": peak_rss_mb()}
+    except ImportError as e:
+        result = {"skipped": f"{e.name or e} is not installed"}
+    finally:
+        os.chdir(REPO_DIR)
+        shutil.rmtree(scratch, ignore_errors=True)
+    print(json.dumps(result))
+
+
+def run_frontend(frontend, root, repeat):
+    """
+    Benchmark one front end 'repeat' times, each in a fresh process; keeps
+    the best time and the highest peak RSS seen for every phase.
+    """
+    best = None
+    for _ in range(repeat):
+        proc = subprocess.run([sys.executable, os.path.abspath(__file__), "--worker", frontend, "--root", root],
+                              capture_output=True, text=True)
+        if proc.returncode != 0:
+            return {"error": proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else "failed"}
+        result = json.loads(proc.stdout.strip().splitlines()[-1])
+        if "skipped" in result or best is None:
+            best = result
+            if "skipped" in result:
+                break
+            continue
+        for name, phase in result["phases"].items():
+            kept = best["phases"][name]
+            kept["seconds"] = min(kept["seconds"], phase["seconds"])
+            if phase["peak_rss_mb"] is not None:
+                kept["peak_rss_mb"] = max(kept["peak_rss_mb"], phase["peak_rss_mb"])
+        if result["peak_rss_mb"] is not None:
+            best["peak_rss_mb"] = max(best["peak_rss_mb"], result["peak_rss_mb"])
+    return best
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "describe", "--always", "--dirty"], cwd=REPO_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_results(results, previous=None):
+    for frontend, result in results["frontends"].items():
+        if "phases" not in result:
+            print(f"{frontend}: {result.get('skipped') or result.get('error')}")
+            continue
+        print(f"{frontend}: peak RSS {result['peak_rss_mb']} MB, {result['info']}")
+        old_phases = ((previous or {}).get("frontends", {}).get(frontend) or {}).get("phases", {})
+        for name, phase in result["phases"].items():
+            line = f"  {name:<16} {phase['seconds']:9.3f}s  {phase['peak_rss_mb']} MB"
+            old = old_phases.get(name)
+            if old and phase["seconds"]:
+                line += f"   was {old['seconds']:.3f}s ({old['seconds'] / phase['seconds']:.2f}x)"
+            print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    add_generator_arguments(parser)
+    parser.add_argument("--root", help="benchmark an existing directory instead of generating one")
+    parser.add_argument("--frontends", default=",".join(FRONTENDS),
+                        help=f"comma-separated, from {', '.join(FRONTENDS)} (default: all)")
+    parser.add_argument("--repeat", type=int, default=1, help="runs per front end; best time is reported")
+    parser.add_argument("--output", default="bench_results.json", help="where to write the JSON results")
+    parser.add_argument("--compare", metavar="JSON", help="results from an earlier run to compare against")
+    parser.add_argument("--keep", action="store_true", help="don't delete the generated repository")
+    parser.add_argument("--worker", choices=FRONTENDS, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args.worker, args.root)
+        return
+
+    frontends = [name.strip() for name in args.frontends.split(",") if name.strip()]
+    unknown = set(frontends) - set(FRONTENDS)
+    if unknown:
+        parser.error(f"unknown front ends: {', '.join(sorted(unknown))}")
+    previous = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            previous = json.load(f)
+
+    tmp = None
+    root = args.root
+    results = {
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "started": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+    if root is None:
+        tmp = tempfile.mkdtemp(prefix="bench_frontends_")
+        root = os.path.join(tmp, "repo")
+        results["params"] = generator_params(args)
+        results["generated"] = make_synthetic_repo(root, **results["params"])
+        generated = results["generated"]
+        print(f"generated {generated['files']} files and {generated['dirs']} directories "
+              f"({generated['bytes'] / 1048576:.1f} MB) in {generated['seconds']:.1f}s under {root}")
+    else:
+        root = os.path.abspath(root)
+        results["root"] = root
+
+    try:
+        results["frontends"] = {frontend: run_frontend(frontend, root, args.repeat) for frontend in frontends}
+    finally:
+        if tmp is not None and not args.keep:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=1)
+    print_results(results, previous)
+    print(f"results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Benchmark: old listdir+isdir recursion vs. the shared scandir walker.
+
+Builds a synthetic tree (300k entries by default) in a temp directory, times
+both walkers on it, and checks that they print the same tree.
+
+    python benchmarks/bench_tree_walker.py
+    python benchmarks/bench_tree_walker.py --entries 500000 --workers 16
+    python benchmarks/bench_tree_walker.py --root /mnt/nfs/some/repo
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from tree_walker import scan_tree, iter_tree
+
+ALLOWED_EXTENSIONS = {".py", ".js", ".json", ".md", ".txt"}
+EXCLUDE_DIRS = {".git", "__pycache__"}
+FILE_EXTENSIONS = [".py", ".js", ".json", ".md", ".txt", ".png", ".lock"]
+
+
+def make_synthetic_tree(root, entries, fanout):
+    """
+    Create roughly 'entries' files and directories under 'root'.
+    Each directory gets 'fanout' files and a few subdirectories, breadth first.
+    Files are empty: the walk only cares about names and types.
+    """
+    created = 0
+    queue = [root]
+    while created < entries:
+        parent = queue.pop(0)
+        for i in range(fanout):
+            ext = FILE_EXTENSIONS[i % len(FILE_EXTENSIONS)]
+            open(os.path.join(parent, f"file_{i}{ext}"), "w").close()
+            created += 1
+        for i in range(max(2, fanout // 8)):
+            child = os.path.join(parent, f"dir_{i}")
+            os.mkdir(child)
+            queue.append(child)
+            created += 1
+    return created
+
+
+def legacy_print_tree(root, lines, prefix=""):
+    """
+    The walker print_files.py used before: os.listdir + os.path.isdir per entry.
+    """
+    items = os.listdir(root)
+    items.sort()
+    visible = []
+    for item in items:
+        if item in EXCLUDE_DIRS:
+            continue
+        path = os.path.join(root, item)
+        if os.path.isdir(path):
+            visible.append((item, path, True))
+        elif os.path.splitext(item)[1].lower() in ALLOWED_EXTENSIONS:
+            visible.append((item, path, False))
+    for i, (item, path, is_dir) in enumerate(visible):
+        last = i == len(visible) - 1
+        lines.append(prefix + ("└── " if last else "├── ") + item)
+        if is_dir:
+            legacy_print_tree(path, lines, prefix + ("    " if last else "│   "))
+
+
+def legacy_tree_lines(root):
+    lines = []
+    legacy_print_tree(root, lines)
+    return lines
+
+
+def scandir_tree_lines(root, workers):
+    listings = scan_tree(root, ALLOWED_EXTENSIONS, EXCLUDE_DIRS, workers=workers)
+    return [line_prefix + name for line_prefix, name, _, _ in iter_tree(listings, root)]
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--entries", type=int, default=300_000)
+    parser.add_argument("--fanout", type=int, default=24)
+    parser.add_argument("--workers", type=int, default=None,
+                        help="thread count for the parallel walker (default: tree_walker.DEFAULT_WORKERS)")
+    parser.add_argument("--root", help="walk an existing directory instead of generating one")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per walker; best time is reported")
+    args = parser.parse_args()
+
+    tmp = None
+    root = args.root
+    if root is None:
+        tmp = tempfile.mkdtemp(prefix="bench_tree_walker_")
+        root = tmp
+        start = time.perf_counter()
+        created = make_synthetic_tree(root, args.entries, args.fanout)
+        print(f"generated {created} entries in {time.perf_counter() - start:.1f}s under {root}")
+
+    try:
+        runs = [
+            ("listdir+isdir (old)", legacy_tree_lines, ()),
+            ("scandir, 1 thread", scandir_tree_lines, (1,)),
+            ("scandir, parallel", scandir_tree_lines, (args.workers,)),
+        ]
+        results = {}
+        legacy_lines = None
+        for label, fn, extra in runs:
+            best = None
+            for _ in range(args.repeat):
+                elapsed, lines = timed(fn, root, *extra)
+                best = elapsed if best is None else min(best, elapsed)
+            if legacy_lines is None:
+                legacy_lines = lines
+            elif lines != legacy_lines:
+                sys.exit(f"{label}: output differs from the legacy walker")
+            results[label] = best
+        legacy_time = results["listdir+isdir (old)"]
+
+        print(f"{len(legacy_lines)} tree lines (identical for every walker)")
+        for label, elapsed in results.items():
+            print(f"  {label:<22} {elapsed:8.3f}s   {legacy_time / elapsed:5.2f}x")
+    finally:
+        if tmp is not None:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+Deterministic synthetic repositories for the benchmarks.
+
+The same arguments (and seed) always give the same tree, byte for byte, so
+timings taken on different commits or machines are comparable. Directories
+are filled breadth first down to a maximum depth; file sizes follow a
+log-normal distribution (most files small, a few large enough to hit the
+large-file handling); a share of the files are binary or exact copies of an
+earlier file. File text looks roughly like code, with snake_case and
+camelCase identifiers, so search, outlines and token counts have something
+realistic to chew on. A .gitignore at the top ignores the *.log files.
+
+    python benchmarks/synthetic_repo.py /tmp/synthetic --entries 100000
+"""
+import argparse
+import os
+import random
+import time
+
+FILE_EXTENSIONS = [".py", ".py", ".py", ".py", ".js", ".json", ".md", ".txt", ".yml", ".png", ".log"]
+BINARY_EXTENSIONS = [".json", ".txt", ".py"]  # binary files that only the sniffer can weed out
+WORDS = ("upload retry cache user session token request response buffer stream parse render tree node "
+         "file path index query score config client server worker queue batch limit timeout count").split()
+
+DEFAULTS = {
+    "entries": 20_000,
+    "depth": 6,
+    "fanout": 16,
+    "subdirs": 4,
+    "median_bytes": 2048,
+    "size_sigma": 1.0,
+    "max_bytes": 4 * 1024 * 1024,
+    "binary_ratio": 0.02,
+    "duplicate_ratio": 0.05,
+    "seed": 1,
+}
+
+
+def _line_pool(rng, count=400):
+    # Code-ish lines to build files from
+    def ident():
+        words = rng.sample(WORDS, rng.randint(1, 3))
+        if rng.random() < 0.3:
+            return words[0] + "".join(word.title() for word in words[1:])
+        return "_".join(words)
+
+    templates = [
+        lambda: f"def {ident()}({ident()}, {ident()}=None):",
+        lambda: f"class {ident().title().replace('_', '')}:",
+        lambda: f"    {ident()} = {ident()}.{ident()}({rng.randint(0, 999)})",
+        lambda: f"    if {ident()} > {rng.randint(0, 99)}:",
+        lambda: f"        return {ident()} + {ident()}",
+        lambda: f"    # {' '.join(rng.choices(WORDS, k=rng.randint(3, 9)))}",
+        lambda: f"import {ident()}",
+        lambda: "",
+    ]
+    return [rng.choice(templates)() + "\n" for _ in range(count)]
+
+
+def _file_size(rng, params):
+    size = rng.lognormvariate(0, params["size_sigma"]) * params["median_bytes"]
+    return max(0, min(int(size), params["max_bytes"]))
+
+
+def _text(rng, pool, size):
+    lines = []
+    length = 0
+    while length < size:
+        line = pool[rng.randrange(len(pool))]
+        lines.append(line)
+        length += len(line)
+    return "".join(lines).encode("utf-8")[:size]
+
+
+def make_synthetic_repo(root, **params):
+    """
+    Generate a repository under 'root' (created if missing) with about
+    'entries' files and directories; see DEFAULTS for the other parameters.
+    Returns what was made: counts of files, dirs, binary and duplicate
+    files, total bytes, and the seconds it took.
+    """
+    params = dict(DEFAULTS, **params)
+    rng = random.Random(params["seed"])
+    pool = _line_pool(rng)
+    start = time.perf_counter()
+    os.makedirs(root, exist_ok=True)
+    with open(os.path.join(root, ".gitignore"), "w") as f:
+        f.write("*.log\n")
+
+    stats = {"files": 0, "dirs": 0, "binary": 0, "duplicates": 0, "bytes": 0}
+    recent = []  # contents a duplicate can copy
+    dirs = [(root, 0)]
+    queue = [(root, 0)]
+    batch = 0
+    created = 0
+    while created < params["entries"]:
+        if not queue:
+            # Every directory is as deep as allowed: give them all another batch of files
+            batch += 1
+            queue = list(dirs)
+        parent, depth = queue.pop(0)
+        for i in range(params["fanout"]):
+            if created >= params["entries"]:
+                break
+            ext = rng.choice(FILE_EXTENSIONS)
+            roll = rng.random()
+            if roll < params["binary_ratio"]:
+                ext = rng.choice(BINARY_EXTENSIONS)
+                data = rng.randbytes(_file_size(rng, params)) + b"\0"
+                stats["binary"] += 1
+            elif roll < params["binary_ratio"] + params["duplicate_ratio"] and recent:
+                data = rng.choice(recent)
+                stats["duplicates"] += 1
+            else:
+                data = _text(rng, pool, _file_size(rng, params))
+                if len(recent) < 256:
+                    recent.append(data)
+                else:
+                    recent[rng.randrange(256)] = data
+            name = f"{rng.choice(WORDS)}_{batch}_{i}{ext}"
+            with open(os.path.join(parent, name), "wb") as f:
+                f.write(data)
+            stats["files"] += 1
+            stats["bytes"] += len(data)
+            created += 1
+        if batch == 0 and depth < params["depth"]:
+            for i in range(params["subdirs"]):
+                if created >= params["entries"]:
+                    break
+                child = os.path.join(parent, f"{rng.choice(WORDS)}_{i}")
+                os.mkdir(child)
+                dirs.append((child, depth + 1))
+                queue.append((child, depth + 1))
+                stats["dirs"] += 1
+                created += 1
+    stats["seconds"] = round(time.perf_counter() - start, 3)
+    return stats
+
+
+def add_generator_arguments(parser):
+    """
+    The generator's parameters as --options (shared with the benchmarks).
+    """
+    group = parser.add_argument_group("synthetic repository")
+    group.add_argument("--entries", type=int, default=DEFAULTS["entries"], help="files + directories (up to ~1M)")
+    group.add_argument("--depth", type=int, default=DEFAULTS["depth"], help="deepest directory level")
+    group.add_argument("--fanout", type=int, default=DEFAULTS["fanout"], help="files per directory (per batch)")
+    group.add_argument("--subdirs", type=int, default=DEFAULTS["subdirs"], help="subdirectories per directory")
+    group.add_argument("--median-bytes", type=int, default=DEFAULTS["median_bytes"], help="median file size")
+    group.add_argument("--size-sigma", type=float, default=DEFAULTS["size_sigma"],
+                       help="spread of the log-normal file sizes (0 = all the median)")
+    group.add_argument("--max-bytes", type=int, default=DEFAULTS["max_bytes"], help="largest file size")
+    group.add_argument("--binary-ratio", type=float, default=DEFAULTS["binary_ratio"], help="share of binary files")
+    group.add_argument("--duplicate-ratio", type=float, default=DEFAULTS["duplicate_ratio"],
+                       help="share of files that copy an earlier one")
+    group.add_argument("--seed", type=int, default=DEFAULTS["seed"])
+
+
+def generator_params(args):
+    return {name: getattr(args, name) for name in DEFAULTS}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("root", help="directory to generate into")
+    add_generator_arguments(parser)
+    args = parser.parse_args()
+    stats = make_synthetic_repo(args.root, **generator_params(args))
+    print(f"generated {stats['files']} files and {stats['dirs']} directories "
+          f"({stats['bytes'] / 1048576:.1f} MB, {stats['binary']} binary, {stats['duplicates']} duplicates) "
+          f"in {stats['seconds']:.1f}s under {args.root}")
+
+
+if __name__ == "__main__":
+    main()
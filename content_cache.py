@@ -0,0 +1,192 @@
+"""
+Persistent cache of rendered file blocks, so reruns only re-read what changed.
+
+Entries live in a small SQLite file, keyed by absolute path plus a 'variant'
+string (anything else that affects the rendered block, e.g. the path shown
+in the FILE: header). An entry is only valid while the file's size, mtime
+and inode still match what was stored. The cache is bounded by total block
+size; when it grows past the limit the least recently used entries are dropped.
+
+The same file also keeps content digests (see dedup.py), under the same
+stat validity rule, so unchanged files never have to be hashed again.
+
+Several processes (or threads, each with its own ContentCache) can share
+one file. Writes are committed at close, on commit(), or every
+'commit_every' writes, so that others aren't kept waiting on the write
+lock for a whole run.
+"""
+import os
+import sqlite3
+import time
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS blocks (
+    path      TEXT NOT NULL,
+    variant   TEXT NOT NULL,
+    size      INTEGER NOT NULL,
+    mtime_ns  INTEGER NOT NULL,
+    inode     INTEGER NOT NULL,
+    block     TEXT NOT NULL,
+    nbytes    INTEGER NOT NULL,
+    last_used REAL NOT NULL,
+    PRIMARY KEY (path, variant)
+);
+CREATE INDEX IF NOT EXISTS blocks_last_used ON blocks (last_used);
+CREATE TABLE IF NOT EXISTS digests (
+    path      TEXT PRIMARY KEY,
+    size      INTEGER NOT NULL,
+    mtime_ns  INTEGER NOT NULL,
+    inode     INTEGER NOT NULL,
+    digest    TEXT NOT NULL
+);
+"""
+
+
+def stat_key(st):
+    """
+    The part of os.stat() that decides whether a cached block is still valid.
+    """
+    return (st.st_size, st.st_mtime_ns, st.st_ino)
+
+
+class ContentCache:
+    """
+    Rendered-block cache backed by SQLite.
+    Use as a context manager (or call close()) so LRU timestamps and
+    evictions get written out at the end of a run.
+    """
+
+    def __init__(self, db_path, max_bytes=DEFAULT_MAX_BYTES, commit_every=None):
+        self.db_path = db_path
+        self.max_bytes = max_bytes
+        self.commit_every = commit_every
+        self._writes = 0
+        self.hits = 0
+        self.misses = 0
+        self._touched = {}
+        self._conn = sqlite3.connect(db_path, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+        row = self._conn.execute("SELECT COALESCE(SUM(nbytes), 0) FROM blocks").fetchone()
+        self._total_bytes = row[0]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def get(self, path, st, variant=""):
+        """
+        Return the cached block for 'path' if 'st' (its os.stat result) still
+        matches, else None.
+        """
+        abs_path = os.path.abspath(path)
+        row = self._conn.execute(
+            "SELECT size, mtime_ns, inode, block FROM blocks WHERE path = ? AND variant = ?",
+            (abs_path, variant),
+        ).fetchone()
+        if row is None or tuple(row[:3]) != stat_key(st):
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._touched[(abs_path, variant)] = time.time()
+        return row[3]
+
+    def contains(self, path, st, variant=""):
+        """
+        Like get(), but only checks validity (no block is loaded and no hit is counted).
+        """
+        row = self._conn.execute(
+            "SELECT size, mtime_ns, inode FROM blocks WHERE path = ? AND variant = ?",
+            (os.path.abspath(path), variant),
+        ).fetchone()
+        return row is not None and tuple(row) == stat_key(st)
+
+    def put(self, path, st, block, variant=""):
+        abs_path = os.path.abspath(path)
+        nbytes = len(block.encode("utf-8"))
+        if nbytes > self.max_bytes:
+            return
+        old = self._conn.execute(
+            "SELECT nbytes FROM blocks WHERE path = ? AND variant = ?", (abs_path, variant)
+        ).fetchone()
+        if old is not None:
+            self._total_bytes -= old[0]
+        size, mtime_ns, inode = stat_key(st)
+        self._conn.execute(
+            "INSERT OR REPLACE INTO blocks VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (abs_path, variant, size, mtime_ns, inode, block, nbytes, time.time()),
+        )
+        self._total_bytes += nbytes
+        self._touched.pop((abs_path, variant), None)
+        if self._total_bytes > self.max_bytes:
+            self._evict()
+        self._wrote()
+
+    def get_digest(self, path, st):
+        """
+        The content digest stored for 'path', if 'st' still matches, else None.
+        """
+        row = self._conn.execute(
+            "SELECT size, mtime_ns, inode, digest FROM digests WHERE path = ?", (os.path.abspath(path),)
+        ).fetchone()
+        if row is None or tuple(row[:3]) != stat_key(st):
+            return None
+        return row[3]
+
+    def put_digest(self, path, st, digest):
+        self._conn.execute("INSERT OR REPLACE INTO digests VALUES (?, ?, ?, ?, ?)",
+                           (os.path.abspath(path), *stat_key(st), digest))
+        self._wrote()
+
+    def commit(self):
+        """
+        Write out what's pending now, releasing the write lock for other connections.
+        """
+        self._flush_touched()
+        self._conn.commit()
+        self._writes = 0
+
+    def _wrote(self):
+        self._writes += 1
+        if self.commit_every and self._writes >= self.commit_every:
+            self.commit()
+
+    def _flush_touched(self):
+        if self._touched:
+            self._conn.executemany(
+                "UPDATE blocks SET last_used = ? WHERE path = ? AND variant = ?",
+                [(ts, path, variant) for (path, variant), ts in self._touched.items()],
+            )
+            self._touched.clear()
+
+    def _evict(self):
+        """
+        Drop least recently used entries until we're at 90% of max_bytes,
+        so we don't evict again on the very next put.
+        """
+        self._flush_touched()
+        target = int(self.max_bytes * 0.9)
+        rows = self._conn.execute(
+            "SELECT rowid, nbytes FROM blocks ORDER BY last_used"
+        )
+        doomed = []
+        for rowid, nbytes in rows:
+            if self._total_bytes <= target:
+                break
+            doomed.append((rowid,))
+            self._total_bytes -= nbytes
+        self._conn.executemany("DELETE FROM blocks WHERE rowid = ?", doomed)
+
+    def close(self):
+        if self._conn is None:
+            return
+        self._flush_touched()
+        if self._total_bytes > self.max_bytes:
+            self._evict()
+        self._conn.commit()
+        self._conn.close()
+        self._conn = None
@@ -0,0 +1,186 @@
+"""
+The tree-plus-contents document print_files.py writes, as reusable pieces.
+
+iter_document() produces the whole document as a generator of str chunks
+(tree section, FILE CONTENTS header, then one block per file), so a caller
+can stream it to a file or an HTTP response without ever holding all of it.
+Large files under the "stream" policy are passed through chunk by chunk.
+With raw=True, files loaded as a RawFile are passed through as that object
+instead of text, for a writer that can copy their bytes as they are (see
+document_writer.py).
+"""
+import os
+
+from file_reader import iter_file_contents
+from file_sniffer import RawFile, StreamedFile, load_file, DEFAULT_LARGE_FILE_BYTES
+from ignore_rules import load_ignore_rules
+from outline import Outline
+from tree_walker import scan_tree
+
+FILE_CONTENTS_HEADER = "========== FILE CONTENTS ==========\n"
+
+
+def guess_code_block_language(filename):
+    _, ext = os.path.splitext(filename)
+    ext = ext.lower()
+    if ext == '.py':
+        return 'python'
+    elif ext == '.js':
+        return 'javascript'
+    elif ext == '.json':
+        return 'json'
+    elif ext in ['.yml', '.yaml']:
+        return 'yaml'
+    elif ext == '.sh':
+        return 'bash'
+    elif ext == '.md':
+        return 'md'
+    elif ext == '.html':
+        return 'html'
+    elif ext == '.css':
+        return 'css'
+    else:
+        return ''  # no specific language
+
+
+def render_file_block(fpath, content, lang=None):
+    if lang is None:
+        lang = guess_code_block_language(fpath)
+    note = " (outline)" if isinstance(content, Outline) else ""
+    return f"FILE: {fpath}{note}\n```{lang}\n{content}\n```\n\n"
+
+
+def render_duplicate_block(fpath, original):
+    """
+    The short reference printed instead of a file identical to 'original'.
+    """
+    return f"FILE: {fpath} (identical to {original})\n\n"
+
+
+def iter_file_block(fpath, content, raw=False, lang=None):
+    """
+    Yield the block for one file; 'content' is a str or a StreamedFile.
+    With 'raw', a RawFile is yielded as is rather than as text.
+    """
+    if isinstance(content, StreamedFile):
+        if lang is None:
+            lang = guess_code_block_language(fpath)
+        yield f"FILE: {fpath}\n```{lang}\n"
+        if raw and isinstance(content, RawFile):
+            yield content
+        else:
+            yield from content
+        yield "\n```\n\n"
+    else:
+        yield render_file_block(fpath, content, lang)
+
+
+def iter_document(tree_sections, files, load=load_file, size_cap=DEFAULT_LARGE_FILE_BYTES, raw=False, lang=None,
+                  duplicates=None):
+    """
+    Yield the document in chunks.
+    'tree_sections' is a list of line iterables (each printed followed by a
+    blank line; lines are passed through as they come), 'files' the paths
+    whose contents follow, in order. Files are read ahead concurrently;
+    'size_cap' is the most a single file can hold in memory under 'load',
+    for the reader's in-flight budget. With 'raw' (and a 'load' that
+    returns RawFiles), chunks can also be RawFiles. 'lang' overrides the
+    code fence language of every block (e.g. "diff" when 'load' gives
+    changed hunks). Files in 'duplicates' ({path: identical earlier path},
+    see dedup.py) aren't read; they get a reference to the earlier file.
+    See document_writer.py for writing the chunks out.
+    """
+    for lines in tree_sections:
+        for line in lines:
+            yield line + "\n"
+        yield "\n"
+    yield FILE_CONTENTS_HEADER + "\n"
+
+    def capped_size(path):
+        try:
+            return min(os.stat(path).st_size, size_cap)
+        except OSError:
+            return 0
+
+    duplicates = duplicates or {}
+    fresh = iter_file_contents([fpath for fpath in files if fpath not in duplicates], read=load,
+                               size_of=capped_size)
+    for fpath in files:
+        if fpath in duplicates:
+            yield render_duplicate_block(fpath, duplicates[fpath])
+        else:
+            yield from iter_file_block(*next(fresh), raw, lang)
+
+
+def selection_listings(root, selected, allowed_extensions=None, exclude_dirs=(), use_ignore_files=True,
+                       listing_cache=None, scanned=None):
+    """
+    Listings (as returned by tree_walker.scan_tree) covering just a selection
+    under 'root': every selected file, everything under every selected
+    directory, and the directories leading to them. Paths outside root are
+    ignored. Feed the result to tree_walker.iter_tree to print the selection.
+    'scanned' maps selected directories (as os.path.join(root, relative
+    path)) to scans of them already made with the same filters, which are
+    used instead of walking them again.
+    """
+    root = os.path.normpath(root)
+    merged = {root: set()}
+    add_with_parents = lambda path, is_dir: _add_with_parents(merged, root, path, is_dir)
+
+    for path in selected:
+        rel = _relative_to(root, path)
+        if rel is None:
+            continue
+        # Keyed the way iter_tree(listings, root) looks directories up
+        path = os.path.join(root, rel) if rel != os.curdir else root
+        listings = scanned.get(path) if scanned else None
+        if listings is None and os.path.isdir(path):
+            ignore = load_ignore_rules(path, base=root) if use_ignore_files else None
+            listings = scan_tree(path, allowed_extensions, exclude_dirs, ignore=ignore,
+                                 listing_cache=listing_cache)
+        if listings is not None:
+            for dir_path, entries in listings.items():
+                merged.setdefault(dir_path, set()).update(entries)
+            add_with_parents(path, True)
+        elif os.path.exists(path):
+            add_with_parents(path, False)
+
+    return {dir_path: sorted(entries) for dir_path, entries in merged.items()}
+
+
+def file_listings(root, files):
+    """
+    Listings covering just 'files' (all below 'root') and the directories
+    leading to them, built from the paths alone without touching the disk.
+    """
+    root = os.path.normpath(root)
+    merged = {root: set()}
+    for path in files:
+        _add_with_parents(merged, root, path, False)
+    return {dir_path: sorted(entries) for dir_path, entries in merged.items()}
+
+
+def _relative_to(root, path):
+    """
+    'path' relative to 'root' (os.curdir for root itself), or None if it
+    isn't inside root. Compared as absolute paths, so a root of "." works.
+    """
+    rel = os.path.relpath(os.path.abspath(path), os.path.abspath(root))
+    if rel == os.pardir or rel.startswith(os.pardir + os.sep):
+        return None
+    return rel
+
+
+def _add_with_parents(merged, root, path, is_dir):
+    rel = _relative_to(root, path)
+    if rel is None or rel == os.curdir:
+        return
+    parts = rel.split(os.sep)
+    for depth in range(len(parts) - 1, -1, -1):
+        # Directories are keyed os.path.join(root, ...), as iter_tree(listings, root) looks them up
+        entries = merged.setdefault(os.path.join(root, *parts[:depth]), set())
+        entry = (parts[depth], is_dir)
+        if entry in entries:
+            return
+        entries.add(entry)
+        is_dir = True
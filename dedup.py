@@ -0,0 +1,102 @@
+"""
+Finding files with identical contents, so each body is printed only once.
+
+Only files whose size matches another file's are hashed at all (a file
+with a unique size can't have a twin), and those are hashed in a streaming
+pass on the shared reader's threads. Digests can be cached by stat metadata
+(ContentCache keeps them next to the rendered blocks), so reruns only hash
+files that changed. Files under min_size bytes (an empty __init__.py, a
+one-line config) are left alone: a reference would be about as long as them.
+"""
+import hashlib
+import os
+
+from content_cache import stat_key
+from file_reader import iter_file_contents
+
+HASH_CHUNK_BYTES = 1024 * 1024
+DEFAULT_MIN_SIZE = 64
+
+
+def file_digest(path):
+    """
+    SHA-1 of the file's bytes, read in chunks (None if it can't be read).
+    """
+    digest = hashlib.sha1()
+    try:
+        with open(path, "rb") as f:
+            while True:
+                chunk = f.read(HASH_CHUNK_BYTES)
+                if not chunk:
+                    break
+                digest.update(chunk)
+    except OSError:
+        return None
+    return digest.hexdigest()
+
+
+class DigestCache:
+    """
+    In-memory digests by (size, mtime, inode), with the same get_digest() /
+    put_digest() as ContentCache, for callers without a cache file.
+    """
+
+    def __init__(self):
+        self._digests = {}
+
+    def get_digest(self, path, st):
+        entry = self._digests.get(os.path.abspath(path))
+        if entry is not None and entry[0] == stat_key(st):
+            return entry[1]
+        return None
+
+    def put_digest(self, path, st, digest):
+        self._digests[os.path.abspath(path)] = (stat_key(st), digest)
+
+
+def find_duplicates(paths, digest=file_digest, stat=os.stat, cache=None, min_size=DEFAULT_MIN_SIZE):
+    """
+    {path: the first earlier path with identical contents} for every path in
+    'paths' that repeats an earlier one. 'digest' and 'stat' stand in for
+    file_digest and os.stat (e.g. GitTree.digest / GitTree.stat for a commit);
+    'cache' is anything with get_digest(path, st) / put_digest(path, st, digest).
+    """
+    stats = {}
+    by_size = {}
+    for path in dict.fromkeys(paths):
+        try:
+            st = stat(path)
+        except OSError:
+            continue
+        if st.st_size >= min_size:
+            stats[path] = st
+            by_size.setdefault(st.st_size, []).append(path)
+
+    candidates = [path for group in by_size.values() if len(group) > 1 for path in group]
+    digests = {}
+    to_hash = []
+    for path in candidates:
+        cached = cache.get_digest(path, stats[path]) if cache is not None else None
+        if cached is None:
+            to_hash.append(path)
+        else:
+            digests[path] = cached
+    # Hashing holds no more than a chunk per file, so the reader's byte budget doesn't apply
+    for path, value in iter_file_contents(to_hash, read=digest, size_of=lambda path: 0):
+        if value is not None:
+            digests[path] = value
+            if cache is not None:
+                cache.put_digest(path, stats[path], value)
+
+    first = {}
+    duplicates = {}
+    for path in dict.fromkeys(paths):
+        value = digests.get(path)
+        if value is None:
+            continue
+        key = (stats[path].st_size, value)
+        if key in first:
+            duplicates[path] = first[key]
+        else:
+            first[key] = path
+    return duplicates
@@ -0,0 +1,100 @@
+"""
+Limit context to what changed in git, for review.
+
+A DiffScope holds the files that differ between two commits (or between a
+commit and the working tree), found with one `git diff --name-status`, so
+building the context costs about as much as the change, not the repository.
+files_under(root) gives the changed files below a directory, as paths under
+that root, for a caller to select or print. With context_lines, hunks(path)
+gives just the changed hunks of a file (with that many unchanged lines
+around each), from a single `git diff` run for the whole change, to print
+instead of the whole file.
+
+Deleted files are not part of the scope: there is nothing left to show.
+"""
+import os
+
+from file_sniffer import decode_text, load_file
+
+HUNK_LANGUAGE = "diff"
+
+
+class DiffScope:
+
+    def __init__(self, repo, base, head=None, context_lines=None):
+        self.repo = repo
+        self.base = repo.resolve(base)
+        self.head = repo.resolve(head) if head else None
+        self.context_lines = context_lines
+        self.changes = repo.changes(self.base, self.head)
+        self._changed = {path: status for status, path in self.changes if status != "D"}
+        self._hunks = None
+
+    def __len__(self):
+        return len(self._changed)
+
+    def files_under(self, root):
+        """
+        The changed files below 'root' (or 'root' itself, if it is a changed
+        file), as os.path.join(root, ...) paths, in path order.
+        """
+        top = self.repo.repo_path(root)
+        if top is None:
+            return []
+        if top in self._changed:
+            return [root]
+        prefix = top + "/" if top else ""
+        return [os.path.join(root, *path[len(prefix):].split("/"))
+                for path in self._changed if path.startswith(prefix)]
+
+    def is_changed(self, path):
+        return self.repo.repo_path(path) in self._changed
+
+    def hunks(self, path):
+        """
+        The changed hunks of the file at 'path' as text ("@@" headers and
+        +/-/context lines). An untracked file is all one added hunk.
+        """
+        rel = self.repo.repo_path(path)
+        if self._changed.get(rel) == "?":
+            return _added_hunk(load_file(path))
+        if self._hunks is None:
+            self._hunks = self._split_diff()
+        text = self._hunks.get(rel)
+        if text is None:
+            text = _section_hunks(self.repo.diff(self.base, self.head, self.context_lines, [":(literal)" + rel]))
+        return text
+
+    def _split_diff(self):
+        """
+        {repo path: hunks} from one diff of the whole change. Its per-file
+        sections come in the same order as the name-status listing, so they
+        are matched up by position; if the counts disagree, nothing is matched
+        and hunks() falls back to one diff per file.
+        """
+        data = self.repo.diff(self.base, self.head, self.context_lines)
+        sections = data.split(b"\ndiff --git ")
+        tracked = [path for status, path in self.changes if status != "?"]
+        if not data or len(sections) != len(tracked):
+            return {}
+        return {path: _section_hunks(section) for path, section in zip(tracked, sections)}
+
+
+def _section_hunks(section):
+    start = section.find(b"\n@@")
+    if start == -1:
+        if b"\nBinary files " in section:
+            return "(binary file changed)"
+        renamed = section.find(b"\nrename from ")
+        if renamed != -1:
+            source = section[renamed + len(b"\nrename from "):].split(b"\n", 1)[0]
+            return f"(renamed from {decode_text(source)}, no content changes)"
+        return "(no content changes)"
+    return decode_text(section[start + 1:]).rstrip("\n")
+
+
+def _added_hunk(text):
+    if not isinstance(text, str):
+        text = "".join(text)  # a streamed large file
+    lines = text.splitlines()
+    return f"@@ -0,0 +1,{len(lines)} @@\n" + "\n".join("+" + line for line in lines)
@@ -0,0 +1,380 @@
+"""
+Writes a context document, produced as a stream of str chunks (see
+context_document.py), to wherever it has to go, one chunk at a time.
+
+A sink is anything with write(str) and close(). The ones here cover a
+file (or stdout), a socket, an in-memory buffer, the clipboard, a capped
+preview, and several of those at once. write_document() only ever holds the
+current chunk, so memory stays bounded by the largest chunk (one file
+block, or one piece of a streamed large file) rather than by the whole
+document. The exceptions are BufferSink, whose whole point is to keep
+everything, and the clipboard when no streaming clipboard command exists.
+
+Chunks can also be RawFiles (file_sniffer.py): files whose bytes are already
+the text to output. Sinks with a write_raw() take those bytes as they are;
+FileSink hands large ones to the kernel (copy_file_range, else sendfile), so
+they never pass through Python at all. Other sinks get the decoded text.
+
+Time spent writing, and the bytes written, are reported to the active
+run_stats.RunStats, if any.
+"""
+import errno
+import io
+import os
+import shutil
+import subprocess
+import sys
+import time
+
+import run_stats
+from file_sniffer import RawFile
+
+DEFAULT_CHUNK_BYTES = 64 * 1024
+
+
+# copy_file_range / sendfile refuse some pairs of files (pipes, other
+# filesystems, old kernels); those fall back to the next way of copying
+_NO_KERNEL_COPY = {errno.EINVAL, errno.ENOSYS, errno.EXDEV, errno.EBADF, errno.EOPNOTSUPP,
+                   errno.ENOTSUP, errno.ESPIPE}
+
+
+def write_document(chunks, sink, close=True):
+    """
+    Drain 'chunks' (str or RawFile) into 'sink'. Returns the number of
+    characters written, counting a RawFile by its size in bytes. The sink is
+    closed afterwards (which is when a clipboard sink copies) unless close=False.
+    """
+    stats = run_stats.active()
+    written = 0
+    try:
+        for chunk in chunks:
+            start = time.perf_counter()
+            if isinstance(chunk, RawFile):
+                write_raw(sink, chunk)
+                written += chunk.size
+                if stats is not None:
+                    stats.add("bytes_written", chunk.size)
+            else:
+                sink.write(chunk)
+                written += len(chunk)
+                if stats is not None:
+                    size = len(chunk) if chunk.isascii() else len(chunk.encode("utf-8", "replace"))
+                    stats.add("bytes_written", size)
+            if stats is not None:
+                stats.record("write", time.perf_counter() - start)
+    finally:
+        if close:
+            start = time.perf_counter()
+            sink.close()
+            run_stats.record("write", time.perf_counter() - start)
+    return written
+
+
+def write_raw(sink, raw):
+    """
+    Give a RawFile to 'sink': as bytes if it takes them, otherwise as text.
+    """
+    if hasattr(sink, "write_raw"):
+        sink.write_raw(raw)
+    else:
+        for text in raw:
+            sink.write(text)
+
+
+def encode_chunks(chunks, chunk_bytes=DEFAULT_CHUNK_BYTES):
+    """
+    UTF-8 encode str chunks and regroup them into pieces of about chunk_bytes,
+    so a socket or HTTP response isn't thousands of tiny writes. RawFile
+    chunks are passed through as their bytes.
+    """
+    buffer = []
+    buffered = 0
+    for chunk in chunks:
+        pieces = chunk.iter_bytes() if isinstance(chunk, RawFile) else (chunk.encode("utf-8"),)
+        for data in pieces:
+            buffer.append(data)
+            buffered += len(data)
+            if buffered >= chunk_bytes:
+                yield b"".join(buffer)
+                buffer = []
+                buffered = 0
+    if buffer:
+        yield b"".join(buffer)
+
+
+def copy_file_to_fd(path, out_fd, size):
+    """
+    Copy the first 'size' bytes of 'path' to out_fd at its current position.
+    The kernel does the copying where it can (copy_file_range between regular
+    files, sendfile otherwise); if neither works, it goes through a buffer.
+    Returns the number of bytes copied (less than 'size' if the file shrank).
+    """
+    with open(path, "rb") as src:
+        in_fd = src.fileno()
+        copied = 0
+        for copy in (_copy_file_range, _sendfile):
+            try:
+                while copied < size:
+                    n = copy(in_fd, out_fd, copied, size - copied)
+                    if n == 0:
+                        return copied
+                    copied += n
+                return copied
+            except OSError as e:
+                if copied or e.errno not in _NO_KERNEL_COPY:
+                    raise
+        src.seek(copied)
+        while copied < size:
+            data = src.read(min(DEFAULT_CHUNK_BYTES, size - copied))
+            if not data:
+                break
+            view = memoryview(data)
+            while view:
+                view = view[os.write(out_fd, view):]
+            copied += len(data)
+        return copied
+
+
+def _copy_file_range(in_fd, out_fd, offset, count):
+    if not hasattr(os, "copy_file_range"):
+        raise OSError(errno.ENOSYS, "copy_file_range is not available")
+    return os.copy_file_range(in_fd, out_fd, count, offset)
+
+
+def _sendfile(in_fd, out_fd, offset, count):
+    if not hasattr(os, "sendfile"):
+        raise OSError(errno.ENOSYS, "sendfile is not available")
+    return os.sendfile(out_fd, in_fd, offset, count)
+
+
+class FileSink:
+    """
+    A path (opened for writing, closed at the end) or an already open text
+    file such as sys.stdout (left open). Where the output is UTF-8 without
+    newline translation, text is encoded here and written to the binary
+    stream underneath, so RawFile bytes can go in between without flushing.
+    """
+
+    def __init__(self, target, encoding="utf-8"):
+        self._owned = isinstance(target, (str, os.PathLike))
+        if self._owned:
+            binary = encoding.lower().replace("-", "") == "utf8" and os.linesep == "\n"
+            self._file = open(target, "wb") if binary else open(target, "w", encoding=encoding)
+            self._text = None if binary else self._file
+        else:
+            self._text = target
+            self._file = _binary_stream(target)
+            if self._file is None:
+                self._file = target
+            else:
+                self._text = None
+                target.flush()
+
+    def write(self, text):
+        if self._text is not None:
+            self._text.write(text)
+        else:
+            self._file.write(text.encode("utf-8"))
+
+    def write_raw(self, raw):
+        if self._text is not None:
+            for text in raw:
+                self._text.write(text)
+        elif raw.data is not None:
+            self._file.write(raw.data)
+        else:
+            self._file.flush()
+            copy_file_to_fd(raw.path, self._file.fileno(), raw.size)
+
+    def close(self):
+        if self._owned:
+            self._file.close()
+        else:
+            self._file.flush()
+
+
+def _binary_stream(text_file):
+    """
+    The binary stream under an open text file, if bytes written there come
+    out exactly as the same text would (UTF-8, no newline translation).
+    """
+    buffer = getattr(text_file, "buffer", None)
+    encoding = (getattr(text_file, "encoding", None) or "").lower().replace("-", "")
+    if buffer is None or encoding != "utf8" or os.linesep != "\n":
+        return None
+    try:
+        buffer.fileno()
+    except (AttributeError, OSError, io.UnsupportedOperation):
+        return None
+    return buffer
+
+
+class SocketSink:
+    """
+    UTF-8 over a connected socket, sent in pieces of about chunk_bytes.
+    The socket itself is left open.
+    """
+
+    def __init__(self, sock, chunk_bytes=DEFAULT_CHUNK_BYTES):
+        self._sock = sock
+        self._chunk_bytes = chunk_bytes
+        self._buffer = []
+        self._buffered = 0
+
+    def write(self, text):
+        self._write_bytes(text.encode("utf-8"))
+
+    def write_raw(self, raw):
+        if raw.data is not None:
+            self._write_bytes(raw.data)
+            return
+        self.flush()
+        with open(raw.path, "rb") as f:
+            self._sock.sendfile(f, 0, raw.size)
+
+    def _write_bytes(self, data):
+        self._buffer.append(data)
+        self._buffered += len(data)
+        if self._buffered >= self._chunk_bytes:
+            self.flush()
+
+    def flush(self):
+        if self._buffer:
+            self._sock.sendall(b"".join(self._buffer))
+            self._buffer = []
+            self._buffered = 0
+
+    def close(self):
+        self.flush()
+
+
+class BufferSink:
+    """
+    Keeps the whole document in memory; getvalue() returns it.
+    """
+
+    def __init__(self):
+        self._buffer = io.StringIO()
+
+    def write(self, text):
+        self._buffer.write(text)
+
+    def getvalue(self):
+        return self._buffer.getvalue()
+
+    def close(self):
+        pass
+
+
+class PreviewSink:
+    """
+    Keeps only the first 'limit' characters, e.g. for showing in a UI.
+    'truncated' says whether anything was cut off.
+    """
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.truncated = False
+        self._parts = []
+        self._size = 0
+
+    def write(self, text):
+        room = self.limit - self._size
+        if room <= 0:
+            self.truncated = self.truncated or bool(text)
+            return
+        if len(text) > room:
+            text = text[:room]
+            self.truncated = True
+        self._parts.append(text)
+        self._size += len(text)
+
+    def getvalue(self):
+        return "".join(self._parts)
+
+    def close(self):
+        pass
+
+
+def _clipboard_command():
+    if sys.platform == "darwin" and shutil.which("pbcopy"):
+        return ["pbcopy"]
+    if os.environ.get("WAYLAND_DISPLAY") and shutil.which("wl-copy"):
+        return ["wl-copy"]
+    if os.environ.get("DISPLAY"):
+        if shutil.which("xclip"):
+            return ["xclip", "-selection", "clipboard"]
+        if shutil.which("xsel"):
+            return ["xsel", "--clipboard", "--input"]
+    return None
+
+
+class ClipboardSink:
+    """
+    Copies the document to the clipboard. Where a clipboard command exists
+    (pbcopy, wl-copy, xclip, xsel) the text is piped into it as it is
+    written; otherwise it is collected and handed to pyperclip on close().
+    close() raises if copying failed.
+    """
+
+    def __init__(self):
+        command = _clipboard_command()
+        self._proc = None
+        self._buffer = None
+        if command is not None:
+            self._proc = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL,
+                                          stderr=subprocess.PIPE)
+        else:
+            self._buffer = io.StringIO()
+
+    def write(self, text):
+        if self._proc is not None:
+            self._proc.stdin.write(text.encode("utf-8"))
+        else:
+            self._buffer.write(text)
+
+    def write_raw(self, raw):
+        if self._proc is None:
+            write_raw(self._buffer, raw)
+            return
+        for data in raw.iter_bytes():
+            self._proc.stdin.write(data)
+
+    def close(self):
+        if self._proc is not None:
+            self._proc.stdin.close()
+            err = self._proc.stderr.read()
+            if self._proc.wait() != 0:
+                raise RuntimeError(f"clipboard command failed: {err.decode(errors='replace').strip()}")
+            return
+        import pyperclip  # only needed when no clipboard command is available
+        pyperclip.copy(self._buffer.getvalue())
+        self._buffer = io.StringIO()
+
+
+class TeeSink:
+    """
+    Writes to several sinks at once (e.g. the clipboard and a preview).
+    """
+
+    def __init__(self, *sinks):
+        self.sinks = sinks
+
+    def write(self, text):
+        for sink in self.sinks:
+            sink.write(text)
+
+    def write_raw(self, raw):
+        for sink in self.sinks:
+            write_raw(sink, raw)
+
+    def close(self):
+        # Close every sink even if one fails, then report the first failure
+        error = None
+        for sink in self.sinks:
+            try:
+                sink.close()
+            except Exception as e:
+                error = error or e
+        if error is not None:
+            raise error
@@ -0,0 +1,82 @@
+"""
+Shared file content reader for print_files.py and the apps.
+
+Files are read ahead on a bounded thread pool, but results are always handed
+back in the order they were asked for, so callers can write them out exactly
+as before. How far ahead we read is capped both by a number of files and by
+an in-flight byte budget (based on stat sizes), so a run of huge files can't
+pile up in memory while the output is being written.
+"""
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import run_stats
+
+DEFAULT_WORKERS = min(16, (os.cpu_count() or 1) * 4)
+DEFAULT_MAX_INFLIGHT_BYTES = 64 * 1024 * 1024
+
+
+def read_text(path):
+    """
+    Read a file the way print_files.py always has: UTF-8 with replacement
+    characters, and an error message instead of an exception.
+    """
+    try:
+        with open(path, 'r', encoding='utf-8', errors='replace') as f:
+            return f.read()
+    except Exception as e:
+        return f"Error reading file: {e}"
+
+
+def stat_size(path):
+    try:
+        return os.stat(path).st_size
+    except OSError:
+        return 0
+
+
+def iter_file_contents(paths, read=read_text, workers=None,
+                       max_inflight_bytes=DEFAULT_MAX_INFLIGHT_BYTES, size_of=stat_size):
+    """
+    Yield (path, read(path)) for every path, in the order given.
+    Up to 'workers' reads run at once. A new read is only started while the
+    files already queued add up to less than 'max_inflight_bytes' (the next
+    file is always started if nothing else is queued, however big it is).
+    """
+    workers = workers or DEFAULT_WORKERS
+    if workers <= 1:
+        for path in paths:
+            yield path, read(path)
+        return
+
+    max_pending = workers * 2
+    pending = deque()  # (path, size, future), in output order
+    inflight = 0
+    upcoming = iter(paths)
+    next_item = None  # (path, size) that didn't fit the budget yet
+
+    read = run_stats.carried(read)
+    pool = ThreadPoolExecutor(max_workers=workers)
+    try:
+        while True:
+            while len(pending) < max_pending:
+                if next_item is None:
+                    path = next(upcoming, None)
+                    if path is None:
+                        break
+                    next_item = (path, size_of(path))
+                path, size = next_item
+                if pending and inflight + size > max_inflight_bytes:
+                    break
+                pending.append((path, size, pool.submit(read, path)))
+                inflight += size
+                next_item = None
+
+            if not pending:
+                return
+            path, size, future = pending.popleft()
+            inflight -= size
+            yield path, future.result()
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
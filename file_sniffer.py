@@ -0,0 +1,232 @@
+"""
+Look at a file before reading all of it.
+
+The first few KB are checked for NUL bytes and invalid UTF-8 (binary files
+are skipped), and the stat size decides whether a file is "large". What
+happens to large files is a policy:
+  - "skip":     leave a one-line note instead of the contents
+  - "truncate": keep the head and the tail, with an elision marker in between
+  - "stream":   include everything, but read it in chunks at write time
+                (load_file returns a StreamedFile instead of a str)
+so memory use is bounded by the threshold / chunk size, not by the largest file.
+
+With raw=True, a file whose bytes are already exactly the text to output
+(valid UTF-8, no carriage returns to translate) comes back as a RawFile, so
+a writer can copy the bytes without decoding and re-encoding them. Only
+files that fail that check take the decoding path.
+
+Each load, the bytes it read, its decoding and the files it skipped are
+reported to the active run_stats.RunStats, if any.
+"""
+import codecs
+import os
+import time
+
+import run_stats
+
+SNIFF_BYTES = 8192
+DEFAULT_LARGE_FILE_BYTES = 1024 * 1024
+CHUNK_SIZE = 256 * 1024
+LARGE_FILE_POLICIES = ("skip", "truncate", "stream")
+
+
+def looks_binary(head, truncated=True):
+    """
+    True if 'head' (the first bytes of a file) has NUL bytes or isn't valid UTF-8.
+    With 'truncated', a multi-byte character cut off at the very end is allowed.
+    """
+    if b"\0" in head:
+        return True
+    try:
+        head.decode("utf-8")
+    except UnicodeDecodeError as e:
+        return not (truncated and e.end == len(head) and e.reason == "unexpected end of data")
+    return False
+
+
+def decode_text(data):
+    """
+    Decode like open(path, 'r', encoding='utf-8', errors='replace').read(),
+    including universal newline translation.
+    """
+    return _normalize_newlines(data.decode("utf-8", errors="replace"))
+
+
+def _normalize_newlines(text):
+    if "\r" in text:
+        text = text.replace("\r\n", "\n").replace("\r", "\n")
+    return text
+
+
+class StreamedFile:
+    """
+    Stand-in for the contents of a large file under the "stream" policy.
+    Iterating it yields the decoded text in chunks.
+    """
+
+    def __init__(self, path, size, chunk_size=CHUNK_SIZE):
+        self.path = path
+        self.size = size
+        self.chunk_size = chunk_size
+
+    def __iter__(self):
+        with open(self.path, "r", encoding="utf-8", errors="replace") as f:
+            while True:
+                chunk = f.read(self.chunk_size)
+                if not chunk:
+                    return
+                yield chunk
+
+
+class RawFile(StreamedFile):
+    """
+    Contents of a file that can be output byte for byte. 'data' holds the
+    bytes if the file was small enough to read up front; otherwise they are
+    read (or copied by the kernel, see document_writer.py) at write time,
+    'size' bytes of them. Iterating it still yields str chunks.
+    """
+
+    def __init__(self, path, size, data=None, chunk_size=CHUNK_SIZE):
+        super().__init__(path, size, chunk_size)
+        self.data = data
+
+    def iter_bytes(self):
+        if self.data is not None:
+            yield self.data
+            return
+        with open(self.path, "rb") as f:
+            left = self.size
+            while left > 0:
+                data = f.read(min(self.chunk_size, left))
+                if not data:
+                    return
+                left -= len(data)
+                yield data
+
+    def __iter__(self):
+        decoder = codecs.getincrementaldecoder("utf-8")("replace")
+        for data in self.iter_bytes():
+            text = decoder.decode(data)
+            if text:
+                yield text
+        text = decoder.decode(b"", final=True)
+        if text:
+            yield text
+
+
+class SkippedFile(str):
+    """
+    The note returned in place of a file's text when it isn't read: a binary
+    file, a large one under the "skip" policy, or a read error.
+    """
+
+
+def is_clean_text(data):
+    """
+    True if 'data' decodes as UTF-8 to exactly what decode_text() gives,
+    i.e. it is valid and has no carriage returns.
+    """
+    if b"\r" in data:
+        return False
+    if data.isascii():
+        return True
+    try:
+        data.decode("utf-8")
+    except UnicodeDecodeError:
+        return False
+    return True
+
+
+def _is_clean_file(f, head):
+    """
+    is_clean_text() for a whole file too big to hold, read in chunks after 'head'.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")("strict")
+    data = head
+    try:
+        while data:
+            if b"\r" in data:
+                return False
+            if not data.isascii():
+                decoder.decode(data)
+            data = f.read(CHUNK_SIZE)
+        decoder.decode(b"", final=True)
+    except UnicodeDecodeError:
+        return False
+    return True
+
+
+def _truncate(f, size, max_bytes):
+    keep = max_bytes // 2
+    head = f.read(keep)
+    f.seek(size - keep)
+    tail = f.read(keep)
+    return truncate_text(head, tail, size)
+
+
+def truncate_text(head, tail, size):
+    """
+    The "truncate" policy's text for a file of 'size' bytes, from its first
+    and last max_bytes // 2 bytes.
+    """
+    # Cut at line boundaries where we can, and never in the middle of a character
+    head = head[:head.rfind(b"\n") + 1] or head
+    newline = tail.find(b"\n")
+    tail = tail[newline + 1:] if newline != -1 else tail
+    head_text = codecs.getincrementaldecoder("utf-8")("replace").decode(head, final=False)
+    tail_text = decode_text(tail.lstrip(bytes(range(0x80, 0xC0))))
+
+    elided = size - len(head) - len(tail)
+    return f"{_normalize_newlines(head_text)}... [{elided} bytes elided] ...\n{tail_text}"
+
+
+def load_file(path, max_bytes=DEFAULT_LARGE_FILE_BYTES, large_policy="truncate", raw=False):
+    """
+    Read a file for output, sniffing it first.
+    Returns the text (or a short note for skipped files and read errors),
+    or a StreamedFile for large files under the "stream" policy. With 'raw',
+    files that need no decoding come back as a RawFile instead.
+    """
+    if large_policy not in LARGE_FILE_POLICIES:
+        raise ValueError(f"Unknown large file policy: {large_policy}")
+    start = time.perf_counter()
+    content = _load_file(path, max_bytes, large_policy, raw)
+    run_stats.record("read", time.perf_counter() - start, path)
+    return content
+
+
+def _load_file(path, max_bytes, large_policy, raw):
+    try:
+        with open(path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            head = f.read(SNIFF_BYTES)
+            run_stats.add("bytes_read", len(head))
+            if looks_binary(head, truncated=size > len(head)):
+                run_stats.add("files_skipped_binary")
+                return SkippedFile(f"(binary file, {size} bytes, skipped)")
+            if size <= max_bytes:
+                rest = f.read()
+                run_stats.add("bytes_read", len(rest))
+                data = head + rest
+                if raw and is_clean_text(data):
+                    return RawFile(path, len(data), data)
+                start = time.perf_counter()
+                text = decode_text(data)
+                run_stats.record("decode", time.perf_counter() - start)
+                return text
+            if large_policy == "skip":
+                run_stats.add("files_skipped_large")
+                return SkippedFile(f"(large file, {size} bytes, skipped)")
+            if large_policy == "stream":
+                # Read at write time
+                run_stats.add("files_streamed")
+                if raw and _is_clean_file(f, head):
+                    return RawFile(path, size)
+                return StreamedFile(path, size)
+            f.seek(0)
+            run_stats.add("files_truncated")
+            run_stats.add("bytes_read", max_bytes - max_bytes % 2)
+            return _truncate(f, size, max_bytes)
+    except Exception as e:
+        run_stats.add("files_unreadable")
+        return SkippedFile(f"Error reading file: {e}")
@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+"""
+Async (ASGI) server mode: the same page and API as context_manager.py,
+served from an event loop by Starlette, for a host that many people use
+at once.
+
+Filesystem work (scanning, search indexing, assembling documents) runs on
+one bounded pool of FS_WORKERS threads shared by all requests, so a slow
+disk or a huge repository can't tie up the server. Full scans go through
+a ScanHub (see async_scan.py): concurrent requests for the same root share
+one scan, the page follows its progress at /api/scan/events (server-sent
+events), and a scan nobody is waiting for any more (say, everyone left the
+page) is cancelled. A document stops being assembled when its download is
+cancelled.
+
+    pip install starlette uvicorn
+    python async_server.py
+    uvicorn async_server:app --host 0.0.0.0 --port 8000
+
+Run one process: scans are shared within it. Caches, the folder watcher
+and /api/metrics are the Flask app's, so Flask has to be installed too.
+"""
+import asyncio
+import contextlib
+import json
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from jinja2 import Environment
+from starlette.applications import Starlette
+from starlette.responses import HTMLResponse, JSONResponse, PlainTextResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+# Shared helpers (tree_walker, ...) live one level up, next to print_files.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from async_scan import ScanHub, iterate_in_executor
+import run_stats
+from document_writer import encode_chunks
+from git_source import GitError
+from context_manager import (ALLOWED_EXTENSIONS, EXCLUDE_DIRS, USE_IGNORE_FILES, LISTING_CACHE, STREAM_CHUNK_BYTES,
+                             SEARCH_TOP_K, RUN_STATS, HTML_PAGE, build_tree, list_children, poll_changes,
+                             server_stats, selection_document, search_files, gzip_chunks)
+
+###############################################################################
+# 1) CONFIG
+###############################################################################
+# Threads for filesystem work, shared by every request
+FS_WORKERS = 32
+FS_POOL = ThreadPoolExecutor(max_workers=FS_WORKERS, thread_name_prefix="fs")
+
+# Directory reads one scan may have queued at a time, so scans of different roots take turns
+SCAN_READS_IN_FLIGHT = 8
+SCANS = ScanHub(FS_POOL, ALLOWED_EXTENSIONS, EXCLUDE_DIRS, USE_IGNORE_FILES, listing_cache=LISTING_CACHE,
+                max_in_flight=SCAN_READS_IN_FLIGHT)
+# How often /api/scan/events reports progress
+SCAN_EVENT_SECONDS = 0.25
+
+PAGE = Environment(autoescape=True).from_string(HTML_PAGE)
+
+###############################################################################
+# 2) HELPERS
+###############################################################################
+async def in_pool(fn, *args):
+    """
+    fn(*args), run on FS_POOL.
+    """
+    return await asyncio.get_running_loop().run_in_executor(FS_POOL, fn, *args)
+
+
+async def json_response(data, status_code=200):
+    # A whole tree can take a while to serialize; not on the event loop
+    body = await in_pool(json.dumps, data)
+    return Response(body, status_code=status_code, media_type="application/json")
+
+
+def error(message, status_code=400):
+    return JSONResponse({"error": message}, status_code=status_code)
+
+
+def sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+async def metered(byte_chunks, phase):
+    """
+    context_manager.metered() for an async stream.
+    """
+    with RUN_STATS.phase(phase):
+        async for data in byte_chunks:
+            RUN_STATS.add("bytes_sent", len(data))
+            yield data
+
+###############################################################################
+# 3) ROUTES
+###############################################################################
+async def index(request):
+    return HTMLResponse(PAGE.render(defaultRoot=os.getcwd(), scanEvents=True))
+
+
+async def api_tree(request):
+    root = os.path.normpath(request.query_params.get("root", "."))
+    if not await in_pool(os.path.isdir, root):
+        return error("Invalid directory")
+    with RUN_STATS.phase("tree"):
+        listings = await SCANS.scan(root)
+        tree = await in_pool(build_tree, root, listings)
+    return await json_response(tree)
+
+
+async def api_scan_events(request):
+    """
+    Server-sent events following the scan of 'root' (the one in progress,
+    if any): "progress" with the folders and files found so far and the
+    folders still to read, then "done" (or "failed", with an "error").
+    If the client goes away while the scan is still running, and nobody
+    else waits on it, the scan is cancelled.
+    """
+    root = os.path.normpath(request.query_params.get("root", "."))
+    if not await in_pool(os.path.isdir, root):
+        return error("Invalid directory")
+
+    async def events():
+        try:
+            async for progress in SCANS.watch(root, SCAN_EVENT_SECONDS):
+                yield sse("done" if progress["done"] else "progress", progress)
+        except Exception as e:
+            yield sse("failed", {"error": str(e)})
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-store", "X-Accel-Buffering": "no"})
+
+
+async def api_children(request):
+    path = request.query_params.get("path", ".")
+    if not await in_pool(os.path.isdir, path):
+        return error("Invalid directory")
+    cursor = request.query_params.get("cursor") or None
+    try:
+        limit = min(max(int(request.query_params.get("limit", 200)), 1), 1000)
+    except ValueError:
+        return error("Invalid limit")
+    with RUN_STATS.phase("children"):
+        children = await in_pool(list_children, path, cursor, limit, request.query_params.get("root") or None)
+    return JSONResponse(children)
+
+
+async def api_changes(request):
+    try:
+        since = int(request.query_params["since"])
+    except (KeyError, ValueError):
+        since = None
+    return JSONResponse(await in_pool(poll_changes, since))
+
+
+async def api_stats(request):
+    stats = server_stats()
+    stats["scans"] = SCANS.running()
+    return JSONResponse(stats)
+
+
+async def api_search(request):
+    """
+    Like the Flask app's /api/search, on the shared scan of 'root'.
+    """
+    root = request.query_params.get("root", "")
+    query = request.query_params.get("q", "").strip()
+    if not await in_pool(os.path.isdir, root):
+        return error("Invalid directory")
+    root = os.path.normpath(root)
+    if not query:
+        return error("Empty query")
+    try:
+        k = min(max(int(request.query_params.get("k", SEARCH_TOP_K)), 1), 1000)
+        max_bytes = int(request.query_params["max_bytes"]) if request.query_params.get("max_bytes") else None
+    except ValueError:
+        return error("k and max_bytes must be numbers")
+    with RUN_STATS.phase("search"):
+        listings = await SCANS.scan(root)
+        results = await in_pool(search_files, root, query, k, max_bytes, listings)
+    return await json_response({"results": results})
+
+
+async def api_submit(request):
+    """
+    Like the Flask app's /api/submit. Selected folders are taken from the
+    shared scans, and the document is assembled on FS_POOL one piece at a
+    time as the client reads it; a cancelled download stops it.
+    """
+    try:
+        data = await request.json()
+    except ValueError:
+        data = {}
+    data = data or {}
+    selected = data.get("selected", [])
+    root = data.get("root", "")
+    if not await in_pool(os.path.isdir, root):
+        return error("Invalid directory")
+    hunks = data.get("hunks")
+    if hunks is not None and (not isinstance(hunks, int) or hunks < 0):
+        return error("hunks must be a number of lines")
+    diff_base = data.get("diff_base") or None
+
+    scanned = None
+    if not diff_base:
+        # With diff_base only the changed files are listed, so there's nothing to scan
+        top = os.path.normpath(root)
+        wanted = {os.path.normpath(path) for path in selected}
+        wanted = [path for path in wanted if path == top or os.path.commonpath([top, path]) == top]
+        folders = await in_pool(lambda: [path for path in wanted if os.path.isdir(path)])
+        # Scanned with the ignore files of the whole tree, as selection_listings() would
+        scans = await asyncio.gather(*(SCANS.scan(folder, base=top) for folder in folders))
+        scanned = dict(zip(folders, scans))
+
+    try:
+        file_count, chunks = await in_pool(selection_document, root, selected, diff_base, hunks,
+                                           data.get("outline", []), data.get("full", []), scanned)
+    except GitError as e:
+        return error(f"git: {e}")
+    body = encode_chunks(chunks, STREAM_CHUNK_BYTES)
+    headers = {"X-Context-Files": str(file_count), "Cache-Control": "no-store"}
+    if data.get("gzip"):
+        body = gzip_chunks(body)
+        headers["Content-Encoding"] = "gzip"
+    return StreamingResponse(metered(iterate_in_executor(body, FS_POOL), "submit"), media_type="text/plain",
+                             headers=headers)
+
+
+async def api_metrics(request):
+    if request.query_params.get("format") == "text":
+        return PlainTextResponse(RUN_STATS.format_summary() + "\n")
+    return JSONResponse(RUN_STATS.as_dict())
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    # The pipeline reports to RUN_STATS from every thread while the server runs
+    previous = run_stats.activate(RUN_STATS)
+    try:
+        yield
+    finally:
+        run_stats.activate(previous)
+        FS_POOL.shutdown(wait=False, cancel_futures=True)
+
+
+app = Starlette(routes=[
+    Route("/", index),
+    Route("/api/tree", api_tree),
+    Route("/api/scan/events", api_scan_events),
+    Route("/api/children", api_children),
+    Route("/api/changes", api_changes),
+    Route("/api/stats", api_stats),
+    Route("/api/search", api_search),
+    Route("/api/submit", api_submit, methods=["POST"]),
+    Route("/api/metrics", api_metrics),
+], lifespan=lifespan)
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(app)
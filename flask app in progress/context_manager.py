@@ -1,7 +1,33 @@
 #!/usr/bin/env python3
 import os
+import sys
 import json
-from flask import Flask, request, jsonify, render_template_string
+import zlib
+import bisect
+import contextlib
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from flask import Flask, Response, request, jsonify, render_template_string
+
+# Shared helpers (tree_walker, ...) live one level up, next to print_files.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from tree_walker import scan_tree, read_directory, filter_paths, DEFAULT_WORKERS
+from ignore_rules import load_ignore_rules
+from file_sniffer import load_file
+from context_document import file_listings, iter_document, selection_listings
+from tree_walker import iter_tree
+from listing_cache import ListingCache
+from fs_watcher import make_watcher
+from live_tree import LiveTree
+from document_writer import encode_chunks
+from git_source import GitError, GitRepo
+from diff_scope import HUNK_LANGUAGE, DiffScope
+from outline import OutlineCache, Outliner
+from dedup import DigestCache, find_duplicates
+from search_index import SearchIndex, pick_top
+import run_stats
+from run_stats import RunStats
 
 app = Flask(__name__)
 
@@ -13,47 +39,294 @@ ALLOWED_EXTENSIONS = {
     ".md", ".html", ".css", ".txt"
 }
 EXCLUDE_DIRS = {".git", ".ipynb_checkpoints", "__pycache__", "venv", ".ropeproject"}
+# Also skip whatever .gitignore / .contextignore files say (pruned during the walk)
+USE_IGNORE_FILES = True
+
+# Files over this size are streamed through in chunks when assembling context
+LARGE_FILE_BYTES = 1024 * 1024
+# /api/submit sends the document in pieces of about this size
+STREAM_CHUNK_BYTES = 64 * 1024
+
+# Directory listings shared by all requests; reused while a directory's mtime is unchanged
+LISTING_CACHE = ListingCache(max_entries=1_000_000)
+
+# Folders the browser has opened are watched; /api/changes reports which of them
+# changed on disk so the page can re-list just those
+WATCHER = make_watcher()
+CHANGE_LOG = deque(maxlen=10_000)  # (seq, dir_path)
+CHANGE_STATE = {"seq": 0}
+CHANGE_LOCK = threading.Lock()
+# Watched folders, least recently listed first; past MAX_WATCHED_DIRS the oldest is unwatched
+WATCHED_DIRS = {}
+MAX_WATCHED_DIRS = 4096
+
+# Outlines shared by all requests, by content hash, so a file is only outlined once per version
+OUTLINE_CACHE = OutlineCache()
+# Content digests by stat, for printing identical files once
+DIGEST_CACHE = DigestCache()
+
+# /api/search ranks files with an index kept here (relative to where the server runs),
+# updated on each search for whatever changed since
+SEARCH_INDEX_FILE = ".files_explanation_index.sqlite"
+SEARCH_TOP_K = 20
+
+# Timings and counters for every request since the server started, served at /api/metrics.
+# The server makes it the process-wide RunStats when it starts, not this module on import.
+RUN_STATS = RunStats()
+RUN_STATS.watch_cache("listings", LISTING_CACHE)
+RUN_STATS.watch_cache("outlines", OUTLINE_CACHE)
+
+# /api/tree keeps a watched LiveTree per root, so repeat calls only re-list what changed
+LIVE_TREES = {}
+MAX_LIVE_TREES = 4
+LIVE_TREES_LOCK = threading.Lock()
 
 ###############################################################################
 # 2) BUILD TREE
 ###############################################################################
-def build_tree(root_path):
+def build_tree(root_path, listings=None):
+    if listings is None:
+        ignore = load_ignore_rules(root_path) if USE_IGNORE_FILES else None
+        listings = scan_tree(root_path, ALLOWED_EXTENSIONS, EXCLUDE_DIRS, ignore=ignore,
+                             listing_cache=LISTING_CACHE)
     tree = []
-    try:
-        for entry in sorted(os.listdir(root_path)):
-            if entry in EXCLUDE_DIRS:
-                continue
-
-            full_path = os.path.join(root_path, entry)
-            if os.path.isdir(full_path):
-                tree.append({
-                    "name": entry + "/",
-                    "path": full_path,
-                    "type": "dir",
-                    "children": build_tree(full_path)
-                })
-            else:
-                _, ext = os.path.splitext(entry)
-                if ext.lower() in ALLOWED_EXTENSIONS:
-                    tree.append({
-                        "name": entry,
-                        "path": full_path,
-                        "type": "file",
-                        "children": []
-                    })
-    except PermissionError:
-        pass
+    for entry, is_dir in listings.get(root_path, []):
+        full_path = os.path.join(root_path, entry)
+        if is_dir:
+            tree.append({
+                "name": entry + "/",
+                "path": full_path,
+                "type": "dir",
+                "children": build_tree(full_path, listings)
+            })
+        else:
+            tree.append({
+                "name": entry,
+                "path": full_path,
+                "type": "file",
+                "children": []
+            })
     return tree
 
+def build_live_tree(root_path):
+    """
+    build_tree() from root_path's LiveTree (created on first use), which
+    re-lists only the directories that changed since the last call.
+    """
+    with LIVE_TREES_LOCK:
+        live = LIVE_TREES.pop(root_path, None)
+        if live is None:
+            live = LiveTree(root_path, ALLOWED_EXTENSIONS, EXCLUDE_DIRS, USE_IGNORE_FILES,
+                            listing_cache=LISTING_CACHE, keep_table=False)
+        else:
+            live.refresh()
+        LIVE_TREES[root_path] = live
+        while len(LIVE_TREES) > MAX_LIVE_TREES:
+            LIVE_TREES.pop(next(iter(LIVE_TREES))).close()
+        return build_tree(root_path, live.listings)
+
+
+def list_children(dir_path, cursor=None, limit=200, root=None):
+    """
+    One page of a single directory level, for lazy loading in the browser.
+    Entries come in sorted order; 'cursor' is the name of the last entry of
+    the previous page. Each directory on the page carries its own child
+    count (its listing is read here, in parallel), so the client knows
+    whether it can be expanded without fetching it. 'root' is the tree's
+    root, whose ignore files apply even outside a git repository.
+    The directory is watched from now on (see /api/changes), until
+    MAX_WATCHED_DIRS others have been listed since.
+    """
+    if cursor is None:
+        with CHANGE_LOCK:
+            WATCHER.watch(dir_path)
+            WATCHED_DIRS.pop(dir_path, None)
+            WATCHED_DIRS[dir_path] = True
+            while len(WATCHED_DIRS) > MAX_WATCHED_DIRS:
+                oldest = next(iter(WATCHED_DIRS))
+                del WATCHED_DIRS[oldest]
+                WATCHER.unwatch(oldest)
+    ignore = load_ignore_rules(dir_path, base=root) if USE_IGNORE_FILES else None
+    entries, ignore = read_directory(dir_path, ALLOWED_EXTENSIONS, EXCLUDE_DIRS, ignore, LISTING_CACHE)
+
+    start = bisect.bisect_right([name for name, _ in entries], cursor) if cursor else 0
+    page = entries[start:start + limit]
+
+    def count_children(name):
+        sub_ignore = ignore.descend(name) if ignore is not None else None
+        sub_path = os.path.join(dir_path, name)
+        return len(read_directory(sub_path, ALLOWED_EXTENSIONS, EXCLUDE_DIRS, sub_ignore, LISTING_CACHE)[0])
+
+    dir_names = [name for name, is_dir in page if is_dir]
+    with ThreadPoolExecutor(max_workers=DEFAULT_WORKERS) as pool:
+        counts = dict(zip(dir_names, pool.map(count_children, dir_names)))
+
+    children = []
+    for name, is_dir in page:
+        child = {
+            "name": name,
+            "path": os.path.join(dir_path, name),
+            "type": "dir" if is_dir else "file",
+        }
+        if is_dir:
+            child["child_count"] = counts[name]
+        children.append(child)
+
+    more = start + limit < len(entries)
+    return {
+        "path": dir_path,
+        "entries": children,
+        "total": len(entries),
+        "next_cursor": page[-1][0] if more and page else None,
+    }
+
+
+def poll_changes(since=None):
+    """
+    Folders (among those the page has listed) that changed on disk after
+    change number 'since'. Without 'since', just the current change number.
+    "reset" means older changes were dropped and the page should re-list
+    everything it shows.
+    """
+    with CHANGE_LOCK:
+        for dir_path in WATCHER.poll():
+            CHANGE_STATE["seq"] += 1
+            CHANGE_LOG.append((CHANGE_STATE["seq"], dir_path))
+        seq = CHANGE_STATE["seq"]
+        if since is None:
+            return {"seq": seq, "dirs": [], "reset": False}
+        reset = bool(CHANGE_LOG) and since < CHANGE_LOG[0][0] - 1
+        dirs = sorted({dir_path for change, dir_path in CHANGE_LOG if change > since})
+    return {"seq": seq, "dirs": [] if reset else dirs, "reset": reset}
+
+
+def server_stats():
+    with CHANGE_LOCK:
+        watcher = {"kind": WATCHER.kind, "directories": len(WATCHER.watched()), "seq": CHANGE_STATE["seq"]}
+    return {"listing_cache": LISTING_CACHE.stats(), "watcher": watcher}
+
 ###############################################################################
-# 3) FLASK ROUTES
+# 3) CONTEXT ASSEMBLY (streamed)
 ###############################################################################
-@app.route("/")
-def index():
-    # We'll pass the current working directory into the HTML as defaultRoot
-    default_root = os.getcwd()
+def selection_document(root, selected, diff_base=None, hunk_lines=None, outline_paths=(), full_paths=(),
+                       scanned=None):
+    """
+    The same tree-plus-contents document print_files.py writes, for the
+    selected files/folders under root. Returns (number of files, generator
+    of str chunks); nothing is read until the generator is consumed.
+    With 'diff_base' (a git revision), only files changed since then are
+    included, from the selection or (if nothing is selected) all of root;
+    with 'hunk_lines' too, only their changed hunks with that much context.
+    Files under 'outline_paths' (and not, more closely, under 'full_paths')
+    are shown as outlines. Files identical to an earlier one are printed
+    as a reference to it (and marked in the tree). 'scanned' holds listings
+    of selected folders that were already scanned (see selection_listings).
+    Raises GitError if root isn't in a git repository or the revision is unknown.
+    """
+    root = os.path.normpath(root)
+    with contextlib.ExitStack() as stack:
+        scope = None
+        if diff_base:
+            scope = DiffScope(stack.enter_context(GitRepo(root)), diff_base, context_lines=hunk_lines)
+            changed = scope.files_under(root)
+            if selected:
+                wanted = [os.path.normpath(path) for path in selected]
+                changed = [path for path in changed
+                           if any(path == top or path.startswith(os.path.join(top, "")) for top in wanted)]
+            ignore = load_ignore_rules(root) if USE_IGNORE_FILES else None
+            listings = file_listings(root, filter_paths(root, changed, ALLOWED_EXTENSIONS, EXCLUDE_DIRS, ignore,
+                                                        LISTING_CACHE))
+        else:
+            listings = selection_listings(root, selected, ALLOWED_EXTENSIONS, EXCLUDE_DIRS, USE_IGNORE_FILES,
+                                          listing_cache=LISTING_CACHE, scanned=scanned)
+        entries = list(iter_tree(listings, root))
+        files = [path for _, _, path, is_dir in entries if not is_dir]
+        if scope is not None and hunk_lines is not None:
+            lines = [root + "/"] + [line_prefix + name for line_prefix, name, _, _ in entries]
+            # The repository (and its git process) stays open until the hunks have been read
+            return len(files), closing_after(iter_document([lines], files, scope.hunks, size_cap=LARGE_FILE_BYTES,
+                                                           lang=HUNK_LANGUAGE), stack.pop_all())
+        duplicates = find_duplicates(files, cache=DIGEST_CACHE)
+        lines = [root + "/"]
+        for line_prefix, name, path, is_dir in entries:
+            if path in duplicates:
+                name += f" (identical to {duplicates[path]})"
+            lines.append(line_prefix + name)
+        # Clean UTF-8 files go into the response as their bytes, without a decode/encode round trip
+        load = lambda path: load_file(path, LARGE_FILE_BYTES, large_policy="stream", raw=True)
+        if outline_paths:
+            load = Outliner(outline_paths, full_paths, OUTLINE_CACHE).wrap(load)
+        return len(files), iter_document([lines], files, load, size_cap=LARGE_FILE_BYTES, raw=True,
+                                         duplicates=duplicates)
 
-    html_page = """
+
+def search_files(root, query, k=SEARCH_TOP_K, max_bytes=None, listings=None):
+    """
+    The files under root that best match 'query', best first, as
+    [{"path", "score", "bytes", "picked"}]: the top 'k' (or, with
+    'max_bytes', as many of them as fit in that many bytes) are "picked";
+    a few more follow so the user can swap some in. 'listings' is a scan
+    of root already made, if there is one.
+    """
+    root = os.path.normpath(root)
+    if listings is None:
+        ignore = load_ignore_rules(root) if USE_IGNORE_FILES else None
+        listings = scan_tree(root, ALLOWED_EXTENSIONS, EXCLUDE_DIRS, ignore=ignore, listing_cache=LISTING_CACHE)
+    files = [path for _, _, path, is_dir in iter_tree(listings, root) if not is_dir]
+    with SearchIndex(SEARCH_INDEX_FILE) as index:
+        index.update(files, prune=[root])
+        ranked = index.search(query, files)[:2 * k]
+    sizes = {}
+    for path, _ in ranked:
+        try:
+            sizes[path] = os.path.getsize(path)
+        except OSError:
+            sizes[path] = 0
+    picked = set(pick_top(ranked, k, max_bytes, sizes.get))
+    return [{"path": path, "score": round(score, 3), "bytes": sizes[path], "picked": path in picked}
+            for path, score in ranked]
+
+
+def metered(byte_chunks, phase):
+    """
+    Pass a response body through, timing it as 'phase' of RUN_STATS (from
+    the first piece to the last one sent) and counting the bytes sent.
+    """
+    with RUN_STATS.phase(phase):
+        for data in byte_chunks:
+            RUN_STATS.add("bytes_sent", len(data))
+            yield data
+
+
+def closing_after(chunks, resource):
+    """
+    Pass 'chunks' through, then close 'resource' (also when the consumer
+    stops early).
+    """
+    try:
+        yield from chunks
+    finally:
+        resource.close()
+
+
+def gzip_chunks(byte_chunks, level=6):
+    """
+    Gzip a stream of bytes on the fly. Each piece is sync-flushed so the
+    client can keep decompressing (and showing progress) as data arrives.
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for data in byte_chunks:
+        out = compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        if out:
+            yield out
+    yield compressor.flush()
+
+###############################################################################
+# 4) FLASK ROUTES
+###############################################################################
+# The page; with scanEvents (the async server), it follows a full scan of the root
+# over /api/scan/events while the tree is browsed
+HTML_PAGE = """
 <!DOCTYPE html>
 <html>
 <head>
@@ -82,6 +355,20 @@ def index():
         .file > label::before {
           content: "📄 ";
         }
+        .toggle {
+          display: inline-block;
+          width: 1em;
+          cursor: pointer;
+        }
+        .file > .toggle {
+          cursor: default;
+        }
+        .mode {
+          margin-left: 6px;
+          font-size: 0.8em;
+          color: #888;
+          cursor: pointer;
+        }
         button {
           margin-top: 20px;
           font-size: 1em;
@@ -96,187 +383,548 @@ def index():
     <input id="rootDirInput" type="text" style="width: 400px;"
            value="{{ defaultRoot|e }}" />
     <button onclick="loadTree()">Load Tree</button>
+    <span id="scanStatus"></span>
 
     <div id="treeContainer" style="margin-top:20px;"></div>
 
+    <p>
+      Only files changed since git revision
+      <input id="diffBaseInput" type="text" style="width: 120px;" placeholder="(e.g. HEAD)" />
+      <label><input id="hunksInput" type="checkbox" /> only changed hunks, with</label>
+      <input id="hunkLinesInput" type="number" min="0" value="3" style="width: 50px;" /> lines of context
+    </p>
+    <p>
+      Or find files about
+      <input id="searchInput" type="text" style="width: 300px;" placeholder="(e.g. retry logic in the uploader)" />
+      top <input id="topKInput" type="number" min="1" value="20" style="width: 50px;" />
+      within <input id="maxKbInput" type="number" min="0" value="0" style="width: 70px;" /> KB (0 = no limit)
+      <button onclick="searchFiles()">Find</button>
+    </p>
+    <ul id="searchResults"></ul>
+    <p>Click the mark after a file or folder to show it as an <b>outline</b> (imports, signatures,
+      docstrings) or in <b>full</b>; the closest marked folder decides for what's inside.</p>
     <button onclick="submitSelection()">Submit Selection</button>
+    <button id="cancelButton" onclick="cancelSubmit()" disabled>Cancel</button>
+    <label><input id="gzipInput" type="checkbox" checked /> gzip transfer</label>
+    <div id="progress"></div>
+    <a id="downloadLink" style="display:none;" download="files_explanation.txt">Download context</a>
+    <textarea id="preview" style="display:none; width:100%; height:300px;" readonly></textarea>
 
     <script>
-    let treeData = [];
+    // The tree is loaded one directory level at a time from /api/children,
+    // so nothing below a folder is fetched (or rendered) until it's expanded.
+    const PAGE_SIZE = 200;
     let rootDir = "";
 
+    // Opened folders are watched on the server; changes are polled for and
+    // only the folders that changed are re-listed, in place.
+    const CHANGE_POLL_MS = 2000;
+    let changeSeq = null;
+    let changeTimer = null;
+    let polling = false;
+
     async function loadTree() {
       rootDir = document.getElementById("rootDirInput").value.trim();
       if(!rootDir) {
         alert("Enter a directory path first.");
         return;
       }
+      {% if scanEvents %}followScan(rootDir);{% endif %}
+      const container = document.getElementById("treeContainer");
+      container.innerHTML = "";
+      const ul = document.createElement("ul");
+      container.appendChild(ul);
       try {
-        const resp = await fetch("/api/tree?root=" + encodeURIComponent(rootDir));
-        if(!resp.ok) throw new Error(resp.statusText);
-        treeData = await resp.json();
-        const container = document.getElementById("treeContainer");
-        container.innerHTML = "";
-        const ul = buildUL(treeData);
-        container.appendChild(ul);
+        changeSeq = (await (await fetch("/api/changes")).json()).seq;
+        await loadChildren(ul, rootDir, null, false);
       } catch(err) {
         alert("Error loading tree: " + err);
       }
+      if(!changeTimer) changeTimer = setInterval(pollChanges, CHANGE_POLL_MS);
     }
 
-    function buildUL(nodes) {
-      const ul = document.createElement("ul");
-      for(const node of nodes) {
-        const li = document.createElement("li");
-        li.classList.add(node.type === "dir" ? "folder" : "file");
-        const label = document.createElement("label");
-
-        const checkbox = document.createElement("input");
-        checkbox.type = "checkbox";
-        checkbox.dataset.path = node.path;
-        checkbox.addEventListener("change", (e) => onCheckboxChange(e, node));
-
-        label.appendChild(checkbox);
-        label.append(" " + node.name);
-        li.appendChild(label);
-
-        if(node.type === "dir" && node.children && node.children.length) {
-          const childUL = buildUL(node.children);
-          childUL.classList.add("indent");
-          li.appendChild(childUL);
-        }
-        ul.appendChild(li);
-      }
-      return ul;
+    {% if scanEvents %}
+    // The async server scans the whole root in the background meanwhile, so a search or
+    // submit finds it done (or joins it); leaving the page or loading another root cancels it
+    let scanSource = null;
+
+    function followScan(root) {
+      if(scanSource) scanSource.close();
+      const status = document.getElementById("scanStatus");
+      const source = new EventSource("/api/scan/events?root=" + encodeURIComponent(root));
+      scanSource = source;
+      const stop = (text) => {
+        source.close();
+        if(scanSource === source) scanSource = null;
+        status.textContent = text;
+      };
+      source.addEventListener("progress", (ev) => {
+        const p = JSON.parse(ev.data);
+        status.textContent = "Scanning: " + p.dirs + " folders, " + p.files + " files, "
+          + p.pending + " folders to go";
+      });
+      source.addEventListener("done", (ev) => {
+        const p = JSON.parse(ev.data);
+        stop("Scanned " + p.dirs + " folders, " + p.files + " files in " + p.seconds.toFixed(1) + "s");
+      });
+      source.addEventListener("failed", (ev) => stop("Scan failed: " + JSON.parse(ev.data).error));
+      // Don't let the browser reconnect (and start the scan over) after a dropped connection
+      source.onerror = () => stop("");
     }
+    {% endif %}
 
-    function onCheckboxChange(ev, node) {
-      const checked = ev.target.checked;
-      // We'll simply do "selectChildren" + "bubble up partial"
-      selectChildren(node, checked);
-      updateParentsPartial(node);
+    function folderUL(path) {
+      if(path === rootDir) return document.querySelector("#treeContainer > ul");
+      const li = document.querySelector('li[data-path="' + CSS.escape(path) + '"]');
+      return li ? li.querySelector(":scope > ul") : null;
     }
 
-    function selectChildren(node, checked) {
-      if(node.children && node.children.length) {
-        for(const child of node.children) {
-          const childBox = document.querySelector('input[data-path="' + cssEscape(child.path) + '"]');
-          if(childBox) {
-            childBox.checked = checked;
+    async function pollChanges() {
+      if(changeSeq === null || polling) return;
+      polling = true;
+      try {
+        const resp = await fetch("/api/changes?since=" + changeSeq);
+        if(!resp.ok) return;
+        const data = await resp.json();
+        changeSeq = data.seq;
+        let dirs = data.dirs;
+        if(data.reset) {
+          dirs = [rootDir];
+          for(const li of document.querySelectorAll("li.folder[data-path]")) {
+            if(li.querySelector(":scope > ul")) dirs.push(li.dataset.path);
           }
-          selectChildren(child, checked);
         }
+        for(const path of dirs) {
+          const ul = folderUL(path);
+          if(ul) await refreshChildren(ul, path);
+        }
+      } catch(err) {
+        // Server busy or restarting; try again on the next tick
+      } finally {
+        polling = false;
       }
     }
 
-    function updateParentsPartial(node) {
-      const parentPath = getParentPath(node.path);
-      if(!parentPath) return;
-
-      const parentNode = findNodeByPath(parentPath, treeData);
-      if(!parentNode) return;
-
-      const {allChecked, noneChecked} = checkChildrenState(parentNode);
-      const parentCheckbox = document.querySelector('input[data-path="' + cssEscape(parentNode.path) + '"]');
-      if(parentCheckbox) {
-        if(allChecked) {
-          parentCheckbox.checked = true;
-          parentCheckbox.indeterminate = false;
-        } else if(noneChecked) {
-          parentCheckbox.checked = false;
-          parentCheckbox.indeterminate = false;
+    async function refreshChildren(ul, path) {
+      // Entries still there keep their <li> (checkbox, opened subfolders);
+      // new ones follow the folder's checkbox, like freshly expanded children
+      const existing = new Map();
+      for(const li of ul.querySelectorAll(":scope > li[data-path]")) existing.set(li.dataset.path, li);
+      const moreLI = ul.querySelector(":scope > li:not([data-path])");
+      const folderBox = ul.parentElement.querySelector(":scope > label > input");
+      const checked = folderBox ? folderBox.checked : false;
+
+      // As many entries as were showing (all of them if the folder was fully loaded)
+      const entries = [];
+      let cursor = null;
+      let data;
+      do {
+        data = await fetchChildren(path, cursor);
+        entries.push(...data.entries);
+        cursor = data.next_cursor;
+      } while(cursor && (!moreLI || entries.length < existing.size));
+
+      const kept = new Set();
+      for(const node of entries) {
+        let li = existing.get(node.path);
+        if(li && li.classList.contains(node.type === "dir" ? "folder" : "file")) {
+          if(node.type === "dir") updateFolderCount(li, node);
         } else {
-          parentCheckbox.checked = false;
-          parentCheckbox.indeterminate = true;
+          if(li) li.remove();
+          li = buildLI(node, checked);
         }
+        kept.add(node.path);
+        ul.appendChild(li);  // moves kept entries into sorted order
+      }
+      for(const [p, li] of existing) {
+        if(!kept.has(p)) li.remove();
       }
-      updateParentsPartial(parentNode);
+      if(moreLI) moreLI.remove();
+      if(data.next_cursor) appendLoadMore(ul, path, data, checked);
+      const first = ul.querySelector(":scope > li[data-path]");
+      if(first) updateParentsPartial(first);
     }
 
-    function checkChildrenState(dirNode) {
-      if(!dirNode.children || dirNode.children.length === 0) {
-        const box = document.querySelector('input[data-path="' + cssEscape(dirNode.path) + '"]');
-        const c = box ? box.checked : false;
-        return {allChecked: c, noneChecked: !c};
+    function updateFolderCount(li, node) {
+      const label = li.querySelector(":scope > label");
+      label.lastChild.textContent = " " + node.name + "/ (" + node.child_count + ")";
+      const toggle = li.querySelector(":scope > .toggle");
+      if(node.child_count && !toggle.textContent) {
+        toggle.textContent = "▸";
+        toggle.addEventListener("click", () => toggleFolder(li, node));
       }
-      let total = dirNode.children.length;
-      let checkedCount = 0;
-      for(const child of dirNode.children) {
-        const box = document.querySelector('input[data-path="' + cssEscape(child.path) + '"]');
-        if(box && box.checked) {
-          checkedCount++;
+    }
+
+    async function fetchChildren(path, cursor) {
+      let url = "/api/children?path=" + encodeURIComponent(path) + "&limit=" + PAGE_SIZE
+        + "&root=" + encodeURIComponent(rootDir);
+      if(cursor) url += "&cursor=" + encodeURIComponent(cursor);
+      const resp = await fetch(url);
+      if(!resp.ok) throw new Error(resp.statusText);
+      return await resp.json();
+    }
+
+    async function loadChildren(ul, path, cursor, checked) {
+      const data = await fetchChildren(path, cursor);
+      for(const node of data.entries) {
+        ul.appendChild(buildLI(node, checked));
+      }
+      if(data.next_cursor) appendLoadMore(ul, path, data, checked);
+    }
+
+    function appendLoadMore(ul, path, data, checked) {
+      const loaded = ul.querySelectorAll(":scope > li[data-path]").length;
+      const li = document.createElement("li");
+      const more = document.createElement("button");
+      more.textContent = "Load more (" + (data.total - loaded) + " left)";
+      more.addEventListener("click", async () => {
+        li.remove();
+        try {
+          await loadChildren(ul, path, data.next_cursor, checked);
+        } catch(err) {
+          alert("Error loading folder: " + err);
         }
+      });
+      li.appendChild(more);
+      ul.appendChild(li);
+    }
+
+    function buildLI(node, checked) {
+      const li = document.createElement("li");
+      li.classList.add(node.type === "dir" ? "folder" : "file");
+      li.dataset.path = node.path;
+
+      const toggle = document.createElement("span");
+      toggle.className = "toggle";
+      if(node.type === "dir" && node.child_count) {
+        toggle.textContent = "▸";
+        toggle.addEventListener("click", () => toggleFolder(li, node));
       }
-      const allChecked = (checkedCount === total);
-      const noneChecked = (checkedCount === 0);
-      return {allChecked, noneChecked};
+      li.appendChild(toggle);
+
+      const label = document.createElement("label");
+      const checkbox = document.createElement("input");
+      checkbox.type = "checkbox";
+      checkbox.checked = checked;
+      checkbox.dataset.path = node.path;
+      checkbox.addEventListener("change", (e) => onCheckboxChange(e, li));
+
+      label.appendChild(checkbox);
+      label.append(" " + node.name + (node.type === "dir" ? "/ (" + node.child_count + ")" : ""));
+      li.appendChild(label);
+
+      const mode = document.createElement("span");
+      mode.className = "mode";
+      mode.dataset.mode = "";
+      mode.textContent = "[·]";
+      mode.title = "outline / full / as its folder";
+      mode.addEventListener("click", () => cycleMode(mode));
+      li.appendChild(mode);
+      return li;
     }
 
-    function getParentPath(pathStr) {
-      const idx = pathStr.lastIndexOf("/");
-      if(idx <= 0) return null;
-      return pathStr.substring(0, idx);
+    function cycleMode(mode) {
+      const next = {"": "outline", "outline": "full", "full": ""}[mode.dataset.mode];
+      mode.dataset.mode = next;
+      mode.textContent = next ? "[" + next + "]" : "[·]";
     }
 
-    function findNodeByPath(pathStr, nodeList) {
-      for(const n of nodeList) {
-        if(n.path === pathStr) return n;
-        if(n.children) {
-          const found = findNodeByPath(pathStr, n.children);
-          if(found) return found;
-        }
+    function markedPaths(mode) {
+      return Array.from(document.querySelectorAll('.mode[data-mode="' + mode + '"]'),
+                        (span) => span.parentElement.dataset.path);
+    }
+
+    async function toggleFolder(li, node) {
+      const toggle = li.querySelector(":scope > .toggle");
+      let childUL = li.querySelector(":scope > ul");
+      if(childUL) {
+        childUL.hidden = !childUL.hidden;
+        toggle.textContent = childUL.hidden ? "▸" : "▾";
+        return;
+      }
+      childUL = document.createElement("ul");
+      childUL.classList.add("indent");
+      li.appendChild(childUL);
+      toggle.textContent = "▾";
+      // Children of a checked folder start out checked
+      const box = li.querySelector(":scope > label > input");
+      try {
+        await loadChildren(childUL, node.path, null, box.checked);
+      } catch(err) {
+        childUL.remove();
+        toggle.textContent = "▸";
+        alert("Error loading folder: " + err);
+      }
+    }
+
+    function onCheckboxChange(ev, li) {
+      const checked = ev.target.checked;
+      // Loaded descendants follow the folder; unloaded ones inherit it when expanded
+      for(const box of li.querySelectorAll("ul input[type=checkbox]")) {
+        box.checked = checked;
+        box.indeterminate = false;
+      }
+      updateParentsPartial(li);
+    }
+
+    function updateParentsPartial(li) {
+      const parentLI = li.parentElement.closest("li");
+      if(!parentLI) return;
+
+      const boxes = parentLI.querySelectorAll(":scope > ul > li > label > input");
+      let checkedCount = 0;
+      let partial = false;
+      for(const box of boxes) {
+        if(box.checked) checkedCount++;
+        if(box.indeterminate) partial = true;
+      }
+      const parentCheckbox = parentLI.querySelector(":scope > label > input");
+      if(checkedCount === boxes.length && !partial) {
+        parentCheckbox.checked = true;
+        parentCheckbox.indeterminate = false;
+      } else if(checkedCount === 0 && !partial) {
+        parentCheckbox.checked = false;
+        parentCheckbox.indeterminate = false;
+      } else {
+        parentCheckbox.checked = false;
+        parentCheckbox.indeterminate = true;
       }
-      return null;
+      updateParentsPartial(parentLI);
     }
 
-    function cssEscape(str) {
-      return str.replace(/"/g, '\\"').replace(/'/g, "\\'");
+    // Search results are checkboxes like the tree's, so checked ones are submitted with it
+    async function searchFiles() {
+      const query = document.getElementById("searchInput").value.trim();
+      if(!rootDir || !query) {
+        alert("Load a tree and enter what to look for first.");
+        return;
+      }
+      const params = new URLSearchParams({
+        root: rootDir,
+        q: query,
+        k: document.getElementById("topKInput").value || "20"
+      });
+      const maxKb = parseInt(document.getElementById("maxKbInput").value, 10) || 0;
+      if(maxKb > 0) params.set("max_bytes", String(maxKb * 1024));
+      const list = document.getElementById("searchResults");
+      try {
+        const resp = await fetch("/api/search?" + params);
+        const data = await resp.json();
+        if(!resp.ok) throw new Error(data.error || resp.statusText);
+        list.innerHTML = "";
+        if(!data.results.length) list.textContent = "No files match.";
+        for(const result of data.results) {
+          const li = document.createElement("li");
+          const label = document.createElement("label");
+          const box = document.createElement("input");
+          box.type = "checkbox";
+          box.dataset.path = result.path;
+          box.checked = result.picked;
+          label.appendChild(box);
+          label.appendChild(document.createTextNode(" " + result.path
+            + " (" + (result.bytes / 1024).toFixed(1) + " KB, score " + result.score + ")"));
+          li.appendChild(label);
+          list.appendChild(li);
+        }
+      } catch(err) {
+        alert("Search error: " + err);
+      }
     }
 
+    let submitController = null;
+
     async function submitSelection() {
-      let allChecks = document.querySelectorAll('input[type="checkbox"]:checked');
+      // A checked folder stands for everything under it, loaded or not
+      let allChecks = document.querySelectorAll('input[type="checkbox"][data-path]:checked');
       let paths = [];
       for(const c of allChecks) {
         paths.push(c.dataset.path);
       }
       console.log("Selected:", paths);
 
+      const progress = document.getElementById("progress");
+      const link = document.getElementById("downloadLink");
+      const preview = document.getElementById("preview");
+      link.style.display = "none";
+      preview.style.display = "none";
+      submitController = new AbortController();
+      document.getElementById("cancelButton").disabled = false;
+
+      // The document is streamed back; keep the pieces and count "FILE: " headers for progress
+      const parts = [];
+      let bytes = 0;
+      let filesDone = 0;
+      let tail = "";
       try {
         let resp = await fetch("/api/submit", {
           method: "POST",
           headers: {"Content-Type": "application/json"},
-          body: JSON.stringify({root: rootDir, selected: paths})
+          body: JSON.stringify({
+            root: rootDir,
+            selected: paths,
+            gzip: document.getElementById("gzipInput").checked,
+            diff_base: document.getElementById("diffBaseInput").value.trim(),
+            hunks: document.getElementById("hunksInput").checked
+              ? parseInt(document.getElementById("hunkLinesInput").value, 10) || 0 : null,
+            outline: markedPaths("outline"),
+            full: markedPaths("full")
+          }),
+          signal: submitController.signal
         });
-        if(!resp.ok) throw new Error(resp.statusText);
-        let text = await resp.text();
-        alert("Server responded: " + text);
+        if(!resp.ok) {
+          let message = resp.statusText;
+          try { message = (await resp.json()).error || message; } catch(e) {}
+          throw new Error(message);
+        }
+        const totalFiles = resp.headers.get("X-Context-Files");
+        const reader = resp.body.getReader();
+        const decoder = new TextDecoder();
+        while(true) {
+          const {done, value} = await reader.read();
+          if(done) break;
+          bytes += value.length;
+          const text = decoder.decode(value, {stream: true});
+          parts.push(text);
+          const scan = tail + text;
+          filesDone += (scan.match(/\\nFILE: /g) || []).length;
+          tail = scan.slice(-6);
+          progress.textContent = filesDone + " / " + totalFiles + " files, "
+            + (bytes / 1048576).toFixed(1) + " MB received";
+        }
+        parts.push(decoder.decode());
+        progress.textContent = "Done: " + totalFiles + " files, " + (bytes / 1048576).toFixed(1) + " MB";
+
+        const blob = new Blob(parts, {type: "text/plain"});
+        link.href = URL.createObjectURL(blob);
+        link.style.display = "";
+        preview.value = await blob.slice(0, 200000).text();
+        preview.style.display = "";
       } catch(err) {
-        alert("Submit error: " + err);
+        if(err.name === "AbortError") {
+          progress.textContent = "Cancelled after " + filesDone + " files.";
+        } else {
+          alert("Submit error: " + err);
+        }
+      } finally {
+        submitController = null;
+        document.getElementById("cancelButton").disabled = true;
       }
     }
+
+    function cancelSubmit() {
+      if(submitController) submitController.abort();
+    }
     </script>
 </body>
 </html>
     """
-    return render_template_string(html_page, defaultRoot=default_root)
+
+@app.route("/")
+def index():
+    # We'll pass the current working directory into the HTML as defaultRoot
+    return render_template_string(HTML_PAGE, defaultRoot=os.getcwd(), scanEvents=False)
 
 @app.route("/api/tree")
 def api_tree():
     root = request.args.get("root", ".")
     if not os.path.isdir(root):
         return jsonify({"error": "Invalid directory"}), 400
-    tree = build_tree(root)
+    with RUN_STATS.phase("tree"):
+        tree = build_live_tree(root)
     return jsonify(tree)
 
+@app.route("/api/children")
+def api_children():
+    path = request.args.get("path", ".")
+    if not os.path.isdir(path):
+        return jsonify({"error": "Invalid directory"}), 400
+    cursor = request.args.get("cursor") or None
+    try:
+        limit = min(max(int(request.args.get("limit", 200)), 1), 1000)
+    except ValueError:
+        return jsonify({"error": "Invalid limit"}), 400
+    with RUN_STATS.phase("children"):
+        children = list_children(path, cursor, limit, root=request.args.get("root") or None)
+    return jsonify(children)
+
+@app.route("/api/changes")
+def api_changes():
+    """
+    See poll_changes().
+    """
+    try:
+        since = int(request.args["since"])
+    except (KeyError, ValueError):
+        since = None
+    return jsonify(poll_changes(since))
+
+@app.route("/api/stats")
+def api_stats():
+    return jsonify(server_stats())
+
+@app.route("/api/search")
+def api_search():
+    """
+    Files under 'root' ranked for the text 'q' (see search_files); 'k' is
+    how many to pick, 'max_bytes' an optional size budget for the picks.
+    """
+    root = request.args.get("root", "")
+    query = request.args.get("q", "").strip()
+    if not os.path.isdir(root):
+        return jsonify({"error": "Invalid directory"}), 400
+    if not query:
+        return jsonify({"error": "Empty query"}), 400
+    try:
+        k = min(max(int(request.args.get("k", SEARCH_TOP_K)), 1), 1000)
+        max_bytes = int(request.args["max_bytes"]) if request.args.get("max_bytes") else None
+    except ValueError:
+        return jsonify({"error": "k and max_bytes must be numbers"}), 400
+    with RUN_STATS.phase("search"):
+        results = search_files(root, query, k, max_bytes)
+    return jsonify({"results": results})
+
 @app.route("/api/submit", methods=["POST"])
 def api_submit():
-    data = request.json
+    """
+    Stream the assembled context back (chunked). With "gzip": true in the
+    body the stream is gzip-compressed on the fly. X-Context-Files tells
+    the client how many file blocks to expect, for progress. "diff_base"
+    (and "hunks", a number of context lines) limit it to what changed;
+    "outline" and "full" are paths to show as outlines / in full.
+    """
+    data = request.json or {}
     selected = data.get("selected", [])
     root = data.get("root", "")
-    print(f"User selected {len(selected)} items under root {root}")
-    for s in selected:
-        print(" =>", s)
-    return "OK from server"
+    if not os.path.isdir(root):
+        return jsonify({"error": "Invalid directory"}), 400
+    hunks = data.get("hunks")
+    if hunks is not None and (not isinstance(hunks, int) or hunks < 0):
+        return jsonify({"error": "hunks must be a number of lines"}), 400
+
+    try:
+        file_count, chunks = selection_document(root, selected, data.get("diff_base") or None, hunks,
+                                                data.get("outline", []), data.get("full", []))
+    except GitError as e:
+        return jsonify({"error": f"git: {e}"}), 400
+    body = encode_chunks(chunks, STREAM_CHUNK_BYTES)
+    headers = {"X-Context-Files": str(file_count), "Cache-Control": "no-store"}
+    if data.get("gzip"):
+        body = gzip_chunks(body)
+        headers["Content-Encoding"] = "gzip"
+    return Response(metered(body, "submit"), mimetype="text/plain", headers=headers)
+
+@app.route("/api/metrics")
+def api_metrics():
+    """
+    RUN_STATS since the server started: time per endpoint (wall / CPU),
+    time spent listing, reading, decoding, counts of directories and files
+    visited, excluded and skipped, bytes read and sent, cache hit rates and
+    the slowest reads. JSON, or a plain text summary with ?format=text.
+    """
+    if request.args.get("format") == "text":
+        return Response(RUN_STATS.format_summary() + "\n", mimetype="text/plain")
+    return jsonify(RUN_STATS.as_dict())
 
 if __name__ == "__main__":
+    run_stats.activate(RUN_STATS)
     app.run(debug=True)
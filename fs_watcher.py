@@ -0,0 +1,237 @@
+"""
+Tells which directories changed since the last look, so a tree can be kept
+current by re-listing just those instead of walking everything again.
+
+On Linux, InotifyWatcher asks the kernel (through libc, no extra packages)
+to report entries created, deleted or renamed in each watched directory,
+and poll() only drains the queued events. Elsewhere, or when inotify is
+unavailable or out of watches, PollingWatcher stats every watched directory
+and compares mtimes, the same signal listing_cache.py relies on.
+
+poll() returns {dir_path: rules_changed}, where rules_changed says one of
+the directory's .gitignore / .contextignore files was created, removed or
+rewritten, which can change everything below it. Content changes of ordinary
+files are not reported: the tree doesn't change, and the content and token
+caches are validated by stat on their own.
+"""
+import ctypes
+import ctypes.util
+import errno
+import os
+import struct
+import sys
+
+from ignore_rules import IGNORE_FILES
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = (IN_CREATE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO | IN_DELETE_SELF | IN_MOVE_SELF
+              | IN_CLOSE_WRITE | IN_ONLYDIR)
+_EVENT = struct.Struct("iIII")
+
+
+class PollingWatcher:
+    """
+    Detects changes by stat()ing each watched directory (and its ignore files).
+    """
+
+    def __init__(self):
+        self._stamps = {}  # dir path -> stat stamp
+
+    def watch(self, path):
+        self._stamps[path] = _stamp(path)
+
+    def unwatch(self, path):
+        self._stamps.pop(path, None)
+
+    def watched(self):
+        return set(self._stamps)
+
+    def poll(self):
+        """
+        {dir_path: rules_changed} for the directories that changed since the last poll.
+        """
+        changed = {}
+        for path, stamp in list(self._stamps.items()):
+            current = _stamp(path)
+            if current == stamp:
+                continue
+            if current is None:
+                # Gone: stop watching it and report its parent, like inotify does
+                del self._stamps[path]
+                parent = os.path.dirname(path)
+                changed[parent] = changed.get(parent, False)
+                continue
+            self._stamps[path] = current
+            changed[path] = changed.get(path, False) or current[2:] != stamp[2:]
+        return changed
+
+    def close(self):
+        self._stamps.clear()
+
+
+def _stamp(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    stamp = [st.st_mtime_ns, st.st_ino]
+    for name in IGNORE_FILES:
+        try:
+            ignore_st = os.stat(os.path.join(path, name))
+            stamp += [ignore_st.st_mtime_ns, ignore_st.st_size]
+        except OSError:
+            stamp += [None, None]
+    return tuple(stamp)
+
+
+class InotifyWatcher:
+    """
+    Linux inotify, one watch per directory. Raises OSError if inotify is not
+    available or the watch limit (fs.inotify.max_user_watches) is reached.
+    """
+
+    def __init__(self):
+        libc_name = ctypes.util.find_library("c")
+        if not sys.platform.startswith("linux") or libc_name is None:
+            raise OSError(errno.ENOSYS, "inotify is not available")
+        self._libc = ctypes.CDLL(libc_name, use_errno=True)
+        self._fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+        self._paths = {}  # watch descriptor -> dir path
+        self._wds = {}  # dir path -> watch descriptor
+
+    def watch(self, path):
+        if path in self._wds:
+            return
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(path), WATCH_MASK)
+        if wd < 0:
+            err = ctypes.get_errno()
+            if err in (errno.ENOENT, errno.ENOTDIR, errno.EACCES):
+                return  # gone already, or unreadable; its parent will report it
+            raise OSError(err, os.strerror(err), path)
+        self._paths[wd] = path
+        self._wds[path] = wd
+
+    def unwatch(self, path):
+        wd = self._wds.pop(path, None)
+        if wd is not None:
+            self._paths.pop(wd, None)
+            self._libc.inotify_rm_watch(self._fd, wd)
+
+    def watched(self):
+        return set(self._wds)
+
+    def poll(self):
+        """
+        {dir_path: rules_changed} for the directories that changed since the
+        last poll. Never blocks.
+        """
+        changed = {}
+        while True:
+            try:
+                data = os.read(self._fd, 64 * 1024)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset < len(data):
+                wd, mask, _cookie, length = _EVENT.unpack_from(data, offset)
+                offset += _EVENT.size
+                name = data[offset:offset + length].rstrip(b"\0")
+                offset += length
+                if mask & IN_Q_OVERFLOW:
+                    # Events were dropped; anything may have changed
+                    changed.update(dict.fromkeys(self._wds, True))
+                    continue
+                path = self._paths.get(wd)
+                if path is None:
+                    continue
+                if mask & IN_IGNORED:
+                    self._paths.pop(wd, None)
+                    self._wds.pop(path, None)
+                    continue
+                if mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+                    parent = os.path.dirname(path)
+                    changed[parent] = changed.get(parent, False)
+                    continue
+                rules_changed = os.fsdecode(name) in IGNORE_FILES
+                if mask & IN_CLOSE_WRITE and not rules_changed:
+                    continue
+                changed[path] = changed.get(path, False) or rules_changed
+        return changed
+
+    def close(self):
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+        self._paths.clear()
+        self._wds.clear()
+
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            pass
+
+
+class FallbackWatcher:
+    """
+    InotifyWatcher while it works; switches to PollingWatcher for good (keeping
+    the same watched directories) if inotify is missing or runs out of watches.
+    """
+
+    def __init__(self):
+        self._pending = {}
+        try:
+            self._watcher = InotifyWatcher()
+        except OSError:
+            self._watcher = PollingWatcher()
+
+    @property
+    def kind(self):
+        return "inotify" if isinstance(self._watcher, InotifyWatcher) else "polling"
+
+    def watch(self, path):
+        try:
+            self._watcher.watch(path)
+        except OSError:
+            # Keep what inotify already saw, then carry on by polling
+            for dir_path, rules_changed in self._watcher.poll().items():
+                self._pending[dir_path] = self._pending.get(dir_path, False) or rules_changed
+            watched = self._watcher.watched()
+            self._watcher.close()
+            self._watcher = PollingWatcher()
+            for dir_path in watched | {path}:
+                self._watcher.watch(dir_path)
+
+    def unwatch(self, path):
+        self._watcher.unwatch(path)
+
+    def watched(self):
+        return self._watcher.watched()
+
+    def poll(self):
+        changed, self._pending = self._pending, {}
+        for dir_path, rules_changed in self._watcher.poll().items():
+            changed[dir_path] = changed.get(dir_path, False) or rules_changed
+        return changed
+
+    def close(self):
+        self._watcher.close()
+
+
+def make_watcher():
+    return FallbackWatcher()
@@ -0,0 +1,417 @@
+"""
+Build context from a git commit instead of the working directory.
+
+GitRepo lists a commit once with `git ls-tree` (every tracked path with its
+blob id and size) and reads blobs through one long-lived
+`git cat-file --batch` process, so nothing is checked out and no file is
+opened or stat()ed. A GitTree (one commit) then stands in for the
+filesystem where print_files.py and the apps touch it:
+  - listing(path) makes it usable as the 'listing_cache' of
+    tree_walker.scan_tree, so filtering, ignore files and rendering are the
+    same code as for a working tree (scan() does exactly that)
+  - ignore_rules(root) reads .gitignore / .contextignore out of the commit
+  - load(path, ...) is file_sniffer.load_file() for the blob at 'path'
+  - stat(path) gives the size and a blob-derived key in place of os.stat(),
+    for the token and content caches
+
+Paths are the same as for the working tree (relative to the current
+directory, or absolute), so output for a clean checkout of the commit is
+identical. Only tracked files exist in a commit. Symlinks to files in the
+commit are followed, like the walker does; symlinks to directories or to
+anything outside the commit, and submodules, are left out.
+"""
+import io
+import os
+import posixpath
+import subprocess
+import threading
+import time
+from collections import namedtuple
+
+from file_sniffer import (CHUNK_SIZE, DEFAULT_LARGE_FILE_BYTES, LARGE_FILE_POLICIES, SNIFF_BYTES, RawFile,
+                          SkippedFile, StreamedFile, decode_text, is_clean_text, looks_binary, truncate_text)
+from ignore_rules import IGNORE_FILES, IgnoreRules, compile_patterns, read_ignore_file
+import run_stats
+from tree_walker import scan_tree
+
+# What the caches need from os.stat(); a blob id never changes content, so
+# it stands in for mtime + inode
+BlobStat = namedtuple("BlobStat", "st_size st_mtime_ns st_ino")
+
+SYMLINK_MODE = b"120000"
+
+
+class GitError(RuntimeError):
+    pass
+
+
+class GitRepo:
+    """
+    The git repository containing 'path'. Thread safe: blob reads from any
+    thread are serialized on the one cat-file process. close() (or use as a
+    context manager) stops it.
+    """
+
+    def __init__(self, path=".", git="git"):
+        self.git = git
+        self.toplevel = os.fsdecode(self._run("rev-parse", "--show-toplevel", cwd=path).rstrip(b"\n"))
+        self._lock = threading.Lock()
+        self._batch = None
+        self._trees = {}  # commit id -> GitTree
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _run(self, *args, cwd=None):
+        result = subprocess.run([self.git, "-C", cwd or self.toplevel, *args],
+                                stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        if result.returncode != 0:
+            message = result.stderr.decode(errors="replace").strip()
+            raise GitError(message or f"git {args[0]} failed")
+        return result.stdout
+
+    def repo_path(self, path):
+        """
+        Path relative to the top level ("/"-separated, "" for the top level
+        itself) for a working-tree style path, or None outside the repository.
+        """
+        # git reports the top level with symlinks resolved, so resolve the current
+        # directory too (and, failing that, the whole path)
+        if not os.path.isabs(path):
+            path = os.path.join(os.path.realpath(os.getcwd()), path)
+        for candidate in (os.path.normpath(path), os.path.realpath(path)):
+            rel = os.path.relpath(candidate, self.toplevel)
+            if rel == ".":
+                return ""
+            if rel != os.pardir and not rel.startswith(os.pardir + os.sep):
+                return rel.replace(os.sep, "/")
+        return None
+
+    def resolve(self, rev):
+        """
+        Full id of the commit 'rev' names.
+        """
+        if rev.startswith("-"):
+            raise GitError(f"Invalid revision: {rev}")
+        try:
+            return self._run("rev-parse", "--verify", "--quiet", rev + "^{commit}").decode().strip()
+        except GitError:
+            raise GitError(f"Unknown revision: {rev}") from None
+
+    def tree(self, rev="HEAD"):
+        """
+        GitTree for the commit 'rev' names (listed once per commit).
+        """
+        commit = self.resolve(rev)
+        tree = self._trees.get(commit)
+        if tree is None:
+            tree = self._trees[commit] = GitTree(self, commit, *self._ls_tree(commit))
+        return tree
+
+    def _ls_tree(self, commit):
+        """
+        ({repo path: (blob id, size)}, {repo dir: [(name, is_dir), ...]}),
+        with "" for the top directory and "/" separators.
+        """
+        # Records are "<mode> <type> <id> <size>\t<path>", NUL-terminated; -t adds the trees themselves
+        out = self._run("ls-tree", "-r", "-t", "-l", "-z", "--full-tree", commit)
+        blobs = {}
+        dirs = {"": []}
+        links = {}
+        for record in out.split(b"\0"):
+            if not record:
+                continue
+            meta, path = record.split(b"\t", 1)
+            mode, kind, oid, size = meta.split()
+            path = os.fsdecode(path)
+            parent, _, name = path.rpartition("/")
+            if kind == b"tree":
+                dirs.setdefault(path, [])
+                dirs.setdefault(parent, []).append((name, True))
+            elif kind == b"blob" and mode == SYMLINK_MODE:
+                links[path] = oid.decode()
+            elif kind == b"blob":
+                blobs[path] = (oid.decode(), int(size))
+                dirs.setdefault(parent, []).append((name, False))
+        for path, oid in links.items():
+            target = self._follow_link(path, oid, links)
+            if target in blobs:
+                parent, _, name = path.rpartition("/")
+                blobs[path] = blobs[target]
+                dirs.setdefault(parent, []).append((name, False))
+        return blobs, dirs
+
+    def _follow_link(self, path, oid, links, max_depth=40):
+        """
+        Repository path a symlink ends up at (following links to links), or None.
+        """
+        for _ in range(max_depth):
+            target = os.fsdecode(self.read_blob(oid)[0])
+            if posixpath.isabs(target):
+                return None
+            path = posixpath.normpath(posixpath.join(posixpath.dirname(path), target))
+            if path == ".." or path.startswith("../"):
+                return None
+            oid = links.get(path)
+            if oid is None:
+                return path
+        return None
+
+    def changes(self, base, head=None):
+        """
+        [(status, repo path), ...] for the files that differ between the
+        commits 'base' and 'head', or between 'base' and the working tree if
+        head is None, in git's (path) order. Status is git's letter (A, M, D,
+        R for a rename, reported under the new path, ...); against the working
+        tree, untracked files that aren't ignored follow with status "?".
+        """
+        out = self._run("diff", "--name-status", "-z", "-M", "--no-ext-diff", base, *([head] if head else []), "--")
+        fields = out.split(b"\0")
+        changes = []
+        i = 0
+        while i + 1 < len(fields):
+            status = fields[i].decode()
+            if status[:1] in ("R", "C"):
+                changes.append((status[0], os.fsdecode(fields[i + 2])))
+                i += 3
+            else:
+                changes.append((status[:1], os.fsdecode(fields[i + 1])))
+                i += 2
+        if head is None:
+            out = self._run("ls-files", "--others", "--exclude-standard", "-z")
+            changes.extend(("?", os.fsdecode(path)) for path in out.split(b"\0") if path)
+        return changes
+
+    def diff(self, base, head=None, context_lines=3, paths=()):
+        """
+        The unified diff (bytes) between 'base' and 'head' (or the working
+        tree), with the same rename detection and order as changes().
+        """
+        return self._run("diff", "-M", "--no-ext-diff", "--no-color", f"-U{context_lines}",
+                         base, *([head] if head else []), "--", *paths)
+
+    def _start_batch(self):
+        if self._batch is None or self._batch.poll() is not None:
+            self._batch = subprocess.Popen([self.git, "-C", self.toplevel, "cat-file", "--batch"],
+                                           stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        return self._batch
+
+    def read_blob(self, oid, head=None, tail=0):
+        """
+        (first 'head' bytes, last 'tail' bytes, size) of a blob; all of it as
+        the head if 'head' is None. The whole blob comes through the pipe
+        either way, but only those parts are kept.
+        """
+        with self._lock:
+            batch = self._start_batch()
+            try:
+                batch.stdin.write(oid.encode() + b"\n")
+                batch.stdin.flush()
+                header = batch.stdout.readline().split()
+                if len(header) != 3:
+                    raise GitError(f"Cannot read object {oid}")
+                size = int(header[2])
+                kept_head = bytearray()
+                kept_tail = bytearray()
+                left = size
+                while left:
+                    data = batch.stdout.read(min(CHUNK_SIZE, left))
+                    if not data:
+                        raise GitError("git cat-file exited unexpectedly")
+                    left -= len(data)
+                    if tail:
+                        kept_tail += data
+                        del kept_tail[:-tail]
+                    if head is None:
+                        kept_head += data
+                    elif len(kept_head) < head:
+                        kept_head += data[:head - len(kept_head)]
+                batch.stdout.read(1)  # the newline after the contents
+            except BaseException:
+                # The stream is out of step now; start over on the next read
+                self._stop_batch()
+                raise
+        return bytes(kept_head), bytes(kept_tail), size
+
+    def _stop_batch(self):
+        if self._batch is not None:
+            if self._batch.poll() is None:
+                self._batch.kill()
+            self._batch.wait()
+            self._batch.stdin.close()
+            self._batch.stdout.close()
+            self._batch = None
+
+    def close(self):
+        with self._lock:
+            if self._batch is not None and self._batch.poll() is None:
+                self._batch.stdin.close()
+                self._batch.wait()
+            self._stop_batch()
+
+
+class _TreeListing:
+    """
+    One directory of a commit, shaped like a listing_cache listing.
+    """
+    __slots__ = ("entries", "filtered", "names")
+
+    def __init__(self, entries):
+        self.entries = entries
+        self.filtered = {}
+        self.names = frozenset(name for name, _ in entries)
+
+
+_EMPTY = ()
+
+
+class _BlobStream(StreamedFile):
+    """
+    A large blob under the "stream" policy, decoded (with universal
+    newlines, like open()) as it comes out of its own `git cat-file blob`.
+    """
+
+    def __init__(self, repo, oid, path, size, chunk_size=CHUNK_SIZE):
+        super().__init__(path, size, chunk_size)
+        self.repo = repo
+        self.oid = oid
+
+    def __iter__(self):
+        proc = subprocess.Popen([self.repo.git, "-C", self.repo.toplevel, "cat-file", "blob", self.oid],
+                                stdout=subprocess.PIPE)
+        try:
+            with io.TextIOWrapper(proc.stdout, encoding="utf-8", errors="replace") as f:
+                while True:
+                    chunk = f.read(self.chunk_size)
+                    if not chunk:
+                        return
+                    yield chunk
+        finally:
+            if proc.poll() is None:
+                proc.kill()
+            proc.wait()
+
+
+class GitTree:
+    """
+    The tracked files of one commit (see the module docstring).
+    """
+
+    def __init__(self, repo, commit, blobs, dirs):
+        self.repo = repo
+        self.commit = commit
+        self._blobs = blobs
+        self._listings = {path: _TreeListing(entries) for path, entries in dirs.items()}
+        self._ignore_files = {}  # blob id -> compiled batches
+
+    def _rel(self, path):
+        return self.repo.repo_path(path)
+
+    def _blob(self, path):
+        entry = self._blobs.get(self._rel(path))
+        if entry is None:
+            raise FileNotFoundError(f"{path} is not a file in commit {self.commit[:12]}")
+        return entry
+
+    def isfile(self, path):
+        return self._rel(path) in self._blobs
+
+    def isdir(self, path):
+        return self._rel(path) in self._listings
+
+    def listing(self, path):
+        return self._listings.get(self._rel(path)) or _TreeListing(_EMPTY)
+
+    def stat(self, path):
+        oid, size = self._blob(path)
+        return BlobStat(size, 0, int(oid[:15], 16))
+
+    def digest(self, path):
+        """
+        The blob id: git has already hashed the contents (see dedup.find_duplicates).
+        """
+        return self._blob(path)[0]
+
+    def scan(self, root, allowed_extensions=None, exclude_dirs=(), use_ignore_files=True):
+        """
+        tree_walker.scan_tree() over the commit instead of the disk.
+        """
+        ignore = self.ignore_rules(root) if use_ignore_files else None
+        return scan_tree(root, allowed_extensions, exclude_dirs, workers=1, ignore=ignore, listing_cache=self)
+
+    def ignore_rules(self, root, filenames=IGNORE_FILES):
+        """
+        ignore_rules.load_ignore_rules() for 'root', with the ignore files
+        taken from the commit (.git/info/exclude still comes from the repository).
+        """
+        exclude = read_ignore_file(os.path.join(self.repo.toplevel, ".git", "info", "exclude"))
+        rules = IgnoreRules((("", exclude),) if exclude else (), filenames, self._read_ignore_file)
+        rel = self._rel(root)
+        if not rel:
+            return rules
+        current = self.repo.toplevel
+        for part in rel.split("/"):
+            rules = rules.with_local_files(current, self.listing(current).names).descend(part)
+            current = os.path.join(current, part)
+        return rules
+
+    def _read_ignore_file(self, path):
+        entry = self._blobs.get(self._rel(path))
+        if entry is None:
+            return ()
+        batches = self._ignore_files.get(entry[0])
+        if batches is None:
+            data = self.repo.read_blob(entry[0])[0]
+            batches = self._ignore_files[entry[0]] = compile_patterns(
+                tuple(data.decode("utf-8", errors="replace").splitlines()))
+        return batches
+
+    def load(self, path, max_bytes=DEFAULT_LARGE_FILE_BYTES, large_policy="truncate", raw=False):
+        """
+        file_sniffer.load_file() for the blob at 'path', reported to the
+        active RunStats the same way.
+        """
+        if large_policy not in LARGE_FILE_POLICIES:
+            raise ValueError(f"Unknown large file policy: {large_policy}")
+        start = time.perf_counter()
+        content = self._load(path, max_bytes, large_policy, raw)
+        run_stats.record("read", time.perf_counter() - start, path)
+        return content
+
+    def _load(self, path, max_bytes, large_policy, raw):
+        try:
+            oid, size = self._blob(path)
+            if size <= max_bytes:
+                data = self.repo.read_blob(oid)[0]
+                run_stats.add("bytes_read", len(data))
+                if looks_binary(data[:SNIFF_BYTES], truncated=size > SNIFF_BYTES):
+                    run_stats.add("files_skipped_binary")
+                    return SkippedFile(f"(binary file, {size} bytes, skipped)")
+                if raw and is_clean_text(data):
+                    return RawFile(path, size, data)
+                start = time.perf_counter()
+                text = decode_text(data)
+                run_stats.record("decode", time.perf_counter() - start)
+                return text
+            keep = max_bytes // 2
+            head, tail, _ = self.repo.read_blob(oid, head=max(keep, SNIFF_BYTES),
+                                                tail=keep if large_policy == "truncate" else 0)
+            # The whole blob comes through the pipe, even if only its ends are kept
+            run_stats.add("bytes_read", size)
+            if looks_binary(head[:SNIFF_BYTES]):
+                run_stats.add("files_skipped_binary")
+                return SkippedFile(f"(binary file, {size} bytes, skipped)")
+            if large_policy == "skip":
+                run_stats.add("files_skipped_large")
+                return SkippedFile(f"(large file, {size} bytes, skipped)")
+            if large_policy == "stream":
+                run_stats.add("files_streamed")
+                return _BlobStream(self.repo, oid, path, size)
+            run_stats.add("files_truncated")
+            return truncate_text(head[:keep], tail, size)
+        except Exception as e:
+            run_stats.add("files_unreadable")
+            return SkippedFile(f"Error reading file: {e}")
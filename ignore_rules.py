@@ -0,0 +1,231 @@
+"""
+.gitignore / .contextignore support for the tree walker.
+
+Every ignore file is compiled once into a few big regexes: consecutive
+patterns with the same sign ("ignore" or "!re-include") are batched into one
+alternation, and the batches are checked from last to first so the last
+matching pattern wins, like git. An IgnoreRules object holds the chain of
+compiled files that apply to one directory (including the ones above the
+scanned root, up to the enclosing git repository). The walker asks it about
+each entry before descending, so ignored directories are never listed.
+
+Not supported: git's global excludesFile, and re-including a file whose parent
+directory is ignored (git doesn't support that either).
+"""
+import functools
+import os
+import re
+
+IGNORE_FILES = (".gitignore", ".contextignore")
+
+# Never walked when ignore files are respected
+ALWAYS_IGNORED = {".git"}
+
+
+def _translate(pattern):
+    """
+    Turn one gitignore glob (no '!' prefix, no trailing '/') into a regex body
+    matched against a '/'-separated path relative to the ignore file's directory.
+    """
+    anchored = "/" in pattern
+    if pattern.startswith("/"):
+        pattern = pattern[1:]
+
+    out = []
+    i, n = 0, len(pattern)
+    while i < n:
+        c = pattern[i]
+        if c == "*":
+            if pattern.startswith("**", i):
+                j = i + 2
+                starts_segment = i == 0 or pattern[i - 1] == "/"
+                if starts_segment and j == n:
+                    out.append(".*")
+                    i = j
+                    continue
+                if starts_segment and pattern[j] == "/":
+                    out.append("(?:.*/)?")
+                    i = j + 1
+                    continue
+                i = j - 1  # a '**' inside a segment is just '*'
+            out.append("[^/]*")
+        elif c == "?":
+            out.append("[^/]")
+        elif c == "[":
+            end = pattern.find("]", i + 2 if pattern[i + 1:i + 2] in ("!", "^") else i + 1)
+            if end == -1:
+                out.append(re.escape(c))
+            else:
+                body = pattern[i + 1:end]
+                if body[:1] in ("!", "^"):
+                    body = "^" + body[1:]
+                out.append("[" + body.replace("\\", "\\\\") + "]")
+                i = end
+        elif c == "\\" and i + 1 < n:
+            i += 1
+            out.append(re.escape(pattern[i]))
+        else:
+            out.append(re.escape(c))
+        i += 1
+
+    body = "".join(out)
+    return body if anchored else "(?:.*/)?" + body
+
+
+def _parse_line(line):
+    """
+    Returns (negated, dir_only, regex body), or None for blanks and comments.
+    """
+    line = line.rstrip("\n").rstrip("\r")
+    # Trailing spaces are ignored unless escaped
+    while line.endswith(" ") and not line.endswith("\\ "):
+        line = line[:-1]
+    if not line or line.startswith("#"):
+        return None
+    negated = line.startswith("!")
+    if negated:
+        line = line[1:]
+    elif line.startswith("\\!") or line.startswith("\\#"):
+        line = line[1:]
+    dir_only = line.endswith("/")
+    line = line.rstrip("/")
+    if not line:
+        return None
+    return negated, dir_only, _translate(line)
+
+
+@functools.lru_cache(maxsize=1024)
+def compile_patterns(lines):
+    """
+    Compile the lines of one ignore file (a tuple of str).
+    Returns a tuple of batches (negated, any_regex, dir_only_regex), last
+    batch first. Cached on the text, so identical ignore files across
+    directories and repositories are only compiled once.
+    """
+    batches = []
+    for parsed in filter(None, map(_parse_line, lines)):
+        negated, dir_only, body = parsed
+        if not batches or batches[-1][0] != negated:
+            batches.append((negated, [], []))
+        batches[-1][2 if dir_only else 1].append(body)
+
+    compiled = []
+    for negated, any_bodies, dir_bodies in reversed(batches):
+        any_re = re.compile("(?:" + "|".join(any_bodies) + r")\Z") if any_bodies else None
+        dir_re = re.compile("(?:" + "|".join(dir_bodies) + r")\Z") if dir_bodies else None
+        compiled.append((negated, any_re, dir_re))
+    return tuple(compiled)
+
+
+# path -> (mtime_ns, size, compiled batches), so unchanged ignore files aren't re-read
+_file_cache = {}
+
+
+def read_ignore_file(path):
+    """
+    The compiled batches of the ignore file at 'path' (() if it can't be
+    read), re-read only when its mtime or size changed.
+    """
+    try:
+        st = os.stat(path)
+        cached = _file_cache.get(path)
+        if cached is not None and cached[:2] == (st.st_mtime_ns, st.st_size):
+            return cached[2]
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            batches = compile_patterns(tuple(f.read().splitlines()))
+    except OSError:
+        return ()
+    _file_cache[path] = (st.st_mtime_ns, st.st_size, batches)
+    return batches
+
+
+class IgnoreRules:
+    """
+    The compiled ignore files that apply inside one directory.
+    'chain' is a tuple of (relative prefix from the ignore file's directory
+    to this one, compiled batches), deepest file first. 'read_file' turns
+    an ignore file's path into compiled batches (from disk by default; see
+    git_source.py for reading them out of a commit).
+    """
+
+    def __init__(self, chain=(), filenames=IGNORE_FILES, read_file=None):
+        self.chain = chain
+        self.filenames = filenames
+        self.read_file = read_file or read_ignore_file
+
+    def descend(self, name):
+        """
+        Rules for the subdirectory 'name' (before its own ignore files are added).
+        """
+        return IgnoreRules(tuple((prefix + name + "/", batches) for prefix, batches in self.chain),
+                           self.filenames, self.read_file)
+
+    def with_local_files(self, dir_path, names):
+        """
+        Add the ignore files found among 'names' (the listing of 'dir_path').
+        """
+        local = [fn for fn in self.filenames if fn in names]
+        if not local:
+            return self
+        chain = self.chain
+        for fn in local:
+            batches = self.read_file(os.path.join(dir_path, fn))
+            if batches:
+                chain = (("", batches),) + chain
+        return IgnoreRules(chain, self.filenames, self.read_file)
+
+    def is_ignored(self, name, is_dir):
+        if name in ALWAYS_IGNORED:
+            return True
+        for prefix, batches in self.chain:
+            rel = prefix + name
+            for negated, any_re, dir_re in batches:
+                if (any_re is not None and any_re.match(rel)) or \
+                        (is_dir and dir_re is not None and dir_re.match(rel)):
+                    return not negated
+        return False
+
+
+def find_repo_root(path):
+    path = os.path.abspath(path)
+    while True:
+        if os.path.exists(os.path.join(path, ".git")):
+            return path
+        parent = os.path.dirname(path)
+        if parent == path:
+            return None
+        path = parent
+
+
+def load_ignore_rules(root, filenames=IGNORE_FILES, base=None):
+    """
+    Rules that apply to the entries of 'root': .git/info/exclude and the
+    ignore files of every directory from the enclosing git repository down
+    to root's parent. Root's own ignore files are picked up by the walker.
+    Outside a git repository, ignore files are collected from 'base' (e.g.
+    the root a tree was scanned from) down instead, if given.
+    """
+    rules = IgnoreRules((), filenames)
+    abs_root = os.path.abspath(root)
+    repo = find_repo_root(abs_root)
+    if repo is None:
+        if base is None:
+            return rules
+        top = os.path.abspath(base)
+        if top != abs_root and os.path.commonpath([top, abs_root]) != top:
+            return rules
+    else:
+        top = repo
+        exclude = read_ignore_file(os.path.join(repo, ".git", "info", "exclude"))
+        rules = IgnoreRules((("", exclude),) if exclude else (), filenames)
+    rel = os.path.relpath(abs_root, top)
+    parts = [] if rel == "." else rel.split(os.sep)
+    current = top
+    for part in parts:
+        try:
+            names = set(os.listdir(current))
+        except OSError:
+            names = set()
+        rules = rules.with_local_files(current, names).descend(part)
+        current = os.path.join(current, part)
+    return rules
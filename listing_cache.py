@@ -0,0 +1,124 @@
+"""
+Process-wide cache of raw directory listings, validated by directory mtime.
+
+A directory's mtime changes whenever an entry is added, removed or renamed
+in it, so a cached listing is reused as long as one stat() of the directory
+still shows the same mtime and inode. Re-walking an unchanged tree then costs
+one stat per directory instead of a full read. Listings that were read within
+RACY_NS of the directory's mtime aren't trusted (a change in the same clock
+tick wouldn't move the mtime), the same trick git uses for its index.
+
+Raw (name, is_dir) listings are cached, before any extension/exclude/ignore
+filtering, so one cache serves every caller whatever filters they use. The
+cache is bounded by the total number of cached entries and evicts least
+recently used directories. It is thread safe.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from tree_walker import scandir_entries
+
+DEFAULT_MAX_ENTRIES = 1_000_000
+RACY_NS = 2_000_000_000
+
+
+class _Listing:
+    """
+    One cached directory: its raw entries, plus filtered versions of them
+    memoized by tree_walker.read_directory (keyed by the filters used).
+    """
+    __slots__ = ("mtime_ns", "inode", "entries", "filtered", "_names")
+
+    def __init__(self, mtime_ns, inode, entries):
+        self.mtime_ns = mtime_ns
+        self.inode = inode
+        self.entries = entries
+        self.filtered = {}
+        self._names = None
+
+    @property
+    def names(self):
+        if self._names is None:
+            self._names = frozenset(name for name, _ in self.entries)
+        return self._names
+
+
+class ListingCache:
+    """
+    Pass one of these as 'listing_cache' to the tree_walker functions.
+    """
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._listings = OrderedDict()  # path -> _Listing
+        self._entry_count = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.evictions = 0
+
+    def scandir(self, path):
+        """
+        Same result as tree_walker.scandir_entries(path), from the cache when
+        the directory hasn't changed since it was listed.
+        """
+        return self.listing(path).entries
+
+    def listing(self, path):
+        """
+        The current _Listing for 'path' (cached or freshly read).
+        """
+        try:
+            st = os.stat(path)
+        except OSError:
+            return _Listing(None, None, [])
+
+        with self._lock:
+            cached = self._listings.get(path)
+            if cached is not None:
+                if cached.mtime_ns == st.st_mtime_ns and cached.inode == st.st_ino:
+                    self._listings.move_to_end(path)
+                    self.hits += 1
+                    return cached
+                self.invalidations += 1
+            self.misses += 1
+
+        listed_at = time.time_ns()
+        listing = _Listing(st.st_mtime_ns, st.st_ino, scandir_entries(path))
+        if listed_at - st.st_mtime_ns < RACY_NS:
+            # Too fresh to trust the mtime: a change in the same tick wouldn't show
+            return listing
+
+        with self._lock:
+            old = self._listings.pop(path, None)
+            if old is not None:
+                self._entry_count -= len(old.entries)
+            self._listings[path] = listing
+            self._entry_count += len(listing.entries)
+            while self._entry_count > self.max_entries and len(self._listings) > 1:
+                _, evicted = self._listings.popitem(last=False)
+                self._entry_count -= len(evicted.entries)
+                self.evictions += 1
+        return listing
+
+    def clear(self):
+        with self._lock:
+            self._listings.clear()
+            self._entry_count = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "directories": len(self._listings),
+                "entries": self._entry_count,
+                "max_entries": self.max_entries,
+            }
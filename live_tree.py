@@ -0,0 +1,125 @@
+"""
+A scanned tree that stays current as files are created, deleted or renamed.
+
+LiveTree walks the root once, then watches every directory it listed (see
+fs_watcher.py). refresh() only re-lists the directories the watcher reports,
+scans directories that appeared, drops the ones that went away, and patches
+the {dir_path: entries} listings in place. When a table is kept, the changed
+subtrees are spliced into the NodeTable and the TreeSelection, so selections
+of nodes that are still there survive. With nothing changed, refresh() is a
+single non-blocking read (inotify) or one stat per directory (polling).
+"""
+import os
+
+from fs_watcher import make_watcher
+from ignore_rules import load_ignore_rules
+from node_table import NodeTable
+from tree_selection import TreeSelection
+from tree_walker import read_directory, scan_tree
+
+
+class LiveTree:
+
+    def __init__(self, root, allowed_extensions=None, exclude_dirs=(), use_ignore_files=True,
+                 listing_cache=None, watcher=None, keep_table=True):
+        self.root = root
+        self.allowed_extensions = allowed_extensions
+        self.exclude_dirs = exclude_dirs
+        self.use_ignore_files = use_ignore_files
+        self.listing_cache = listing_cache
+        self.watcher = watcher if watcher is not None else make_watcher()
+        self.listings = self._scan(root)
+        for dir_path in self.listings:
+            self.watcher.watch(dir_path)
+        self.selection = TreeSelection(NodeTable.from_listings(root, self.listings)) if keep_table else None
+
+    @property
+    def table(self):
+        return self.selection.table if self.selection is not None else None
+
+    def _rules(self, dir_path):
+        return load_ignore_rules(dir_path, base=self.root) if self.use_ignore_files else None
+
+    def _scan(self, dir_path, ignore=None):
+        if ignore is None:
+            ignore = self._rules(dir_path)
+        return scan_tree(dir_path, self.allowed_extensions, self.exclude_dirs, ignore=ignore,
+                         listing_cache=self.listing_cache)
+
+    def _drop(self, dir_path):
+        """
+        Forget 'dir_path' and every directory listed below it.
+        """
+        stack = [dir_path]
+        while stack:
+            path = stack.pop()
+            entries = self.listings.pop(path, ())
+            self.watcher.unwatch(path)
+            stack.extend(os.path.join(path, name) for name, is_dir in entries if is_dir)
+
+    def _add(self, listings):
+        self.listings.update(listings)
+        for dir_path in listings:
+            self.watcher.watch(dir_path)
+
+    def _update(self, dir_path, rules_changed):
+        """
+        Bring the listings for one changed directory up to date.
+        """
+        if rules_changed:
+            # What's ignored below may have changed anywhere, so list it all again
+            self._drop(dir_path)
+            self._add(self._scan(dir_path))
+            return
+        old = set(self.listings.get(dir_path, ()))
+        entries, rules = read_directory(dir_path, self.allowed_extensions, self.exclude_dirs,
+                                        self._rules(dir_path), self.listing_cache)
+        self.listings[dir_path] = entries
+        for name, is_dir in old.difference(entries):
+            if is_dir:
+                self._drop(os.path.join(dir_path, name))
+        for name, is_dir in set(entries).difference(old):
+            if is_dir:
+                self._add(self._scan(os.path.join(dir_path, name), rules and rules.descend(name)))
+
+    def refresh(self):
+        """
+        Apply everything the watcher saw since the last call.
+        Returns None if nothing changed, otherwise remap(old_id) -> new id
+        (or None if the node is gone), for callers that keep node ids.
+        """
+        changed = {path: rules_changed for path, rules_changed in self.watcher.poll().items()
+                   if path in self.listings}
+        if not changed:
+            return None
+        # Parents first, so a directory dropped by its parent isn't re-listed
+        for dir_path in sorted(changed, key=len):
+            if dir_path in self.listings:
+                self._update(dir_path, changed[dir_path])
+
+        if self.selection is None:
+            return lambda node: node
+        # Only the topmost changed directories need splicing; each is rebuilt
+        # from the listings with everything below it
+        table = self.table
+        topmost = []
+        for dir_path in sorted(changed):
+            if dir_path in self.listings and not any(
+                    dir_path.startswith(os.path.join(top, "")) for top in topmost):
+                topmost.append(dir_path)
+        remaps = []
+        for node in sorted(filter(lambda n: n is not None, map(table.find, topmost)), reverse=True):
+            forest = NodeTable.from_listings(table.abs_path(node), self.listings)
+            remaps.append(self.selection.replace_children(node, forest))
+
+        def remap(node):
+            for step in remaps:
+                if node is None:
+                    return None
+                node = step(node)
+            return node
+
+        return remap
+
+    def close(self):
+        self.watcher.close()
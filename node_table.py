@@ -0,0 +1,270 @@
+"""
+Compact, array-backed directory tree.
+
+Instead of a dict per node (name, abs_path, rel_path, parent path, children
+list), every node is an integer id into a handful of parallel arrays:
+parent, first_child, next_sibling, subtree_end and a name index into a list
+of interned name segments. Paths are built on demand from the parent chain.
+
+Ids are assigned in depth-first pre-order with sorted children, so the whole
+subtree of node i is the contiguous id range [i, subtree_end[i]). Id 0 is the
+scanned root directory itself. A table costs roughly 20 bytes per node plus
+the unique names, and pickles as a few flat arrays (cheap to keep in
+st.session_state).
+"""
+import bisect
+import os
+from array import array
+
+NO_NODE = -1
+
+
+class NodeTable:
+
+    def __init__(self, root_path):
+        self.root_path = root_path
+        self.names = []
+        self.name_ids = array("i")
+        self.parent = array("i")
+        self.first_child = array("i")
+        self.next_sibling = array("i")
+        self.subtree_end = array("i")
+        self.dir_flags = bytearray()
+        self._name_index = None
+
+    @classmethod
+    def from_listings(cls, root_path, listings):
+        """
+        Build a table from tree_walker.scan_tree() output for 'root_path'.
+        """
+        table = cls(root_path)
+        interned = {}
+        last_child = []
+
+        def add(name, is_dir, parent):
+            node = len(table.parent)
+            name_id = interned.get(name)
+            if name_id is None:
+                name_id = interned[name] = len(table.names)
+                table.names.append(name)
+            table.name_ids.append(name_id)
+            table.parent.append(parent)
+            table.first_child.append(NO_NODE)
+            table.next_sibling.append(NO_NODE)
+            table.subtree_end.append(node + 1)
+            table.dir_flags.append(1 if is_dir else 0)
+            last_child.append(NO_NODE)
+            if parent != NO_NODE:
+                if last_child[parent] == NO_NODE:
+                    table.first_child[parent] = node
+                else:
+                    table.next_sibling[last_child[parent]] = node
+                last_child[parent] = node
+            return node
+
+        root = add(os.path.basename(os.path.normpath(root_path)), True, NO_NODE)
+        stack = [(root_path, root, iter(listings.get(root_path, ())))]
+        while stack:
+            path, node, entries = stack[-1]
+            entry = next(entries, None)
+            if entry is None:
+                table.subtree_end[node] = len(table.parent)
+                stack.pop()
+                continue
+            name, is_dir = entry
+            child = add(name, is_dir, node)
+            if is_dir:
+                child_path = os.path.join(path, name)
+                stack.append((child_path, child, iter(listings.get(child_path, ()))))
+        return table
+
+    def __len__(self):
+        return len(self.parent)
+
+    def name(self, node):
+        return self.names[self.name_ids[node]]
+
+    def isdir(self, node):
+        return self.dir_flags[node] == 1
+
+    def children(self, node=0):
+        child = self.first_child[node]
+        while child != NO_NODE:
+            yield child
+            child = self.next_sibling[child]
+
+    def rel_path(self, node):
+        """
+        Path relative to the root ("" for the root itself).
+        """
+        parts = []
+        while node > 0:
+            parts.append(self.names[self.name_ids[node]])
+            node = self.parent[node]
+        return os.path.join(*reversed(parts)) if parts else ""
+
+    def abs_path(self, node):
+        rel = self.rel_path(node)
+        return os.path.join(self.root_path, rel) if rel else self.root_path
+
+    def iter_paths(self, node=0):
+        """
+        Yield (id, abs_path) for 'node' and everything below it, in pre-order.
+        Paths are built incrementally, one join per node.
+        """
+        dir_paths = {}
+        for i in range(node, self.subtree_end[node]):
+            if i == node:
+                path = self.abs_path(node)
+            else:
+                path = os.path.join(dir_paths[self.parent[i]], self.names[self.name_ids[i]])
+            if self.dir_flags[i]:
+                dir_paths[i] = path
+            yield i, path
+
+    def find(self, path):
+        """
+        Id of the node at 'path' (absolute, or relative to the root), or None.
+        """
+        rel = os.path.relpath(path, self.root_path) if os.path.isabs(path) else path
+        if rel in ("", "."):
+            return 0
+        node = 0
+        for part in rel.split(os.sep):
+            for child in self.children(node):
+                if self.names[self.name_ids[child]] == part:
+                    node = child
+                    break
+            else:
+                return None
+        return node
+
+    def search(self, query):
+        """
+        Ids of the nodes whose name contains 'query' (case-insensitive), in
+        tree order. Only the unique names are scanned; the matching nodes come
+        from a name -> ids index built on first use.
+        """
+        query = query.lower()
+        if not query:
+            return []
+        if self._name_index is None:
+            by_name = array("i", sorted(range(1, len(self)), key=self.name_ids.__getitem__))
+            self._name_index = (
+                [name.lower() for name in self.names],
+                by_name,
+                array("i", (self.name_ids[node] for node in by_name)),
+            )
+        lowered, by_name, sorted_ids = self._name_index
+        found = []
+        for name_id, name in enumerate(lowered):
+            if query in name:
+                start = bisect.bisect_left(sorted_ids, name_id)
+                found.extend(by_name[start:bisect.bisect_right(sorted_ids, name_id, start)])
+        found.sort()
+        return found
+
+    def replace_children(self, node, forest):
+        """
+        Replace everything below 'node' with the children of forest's root
+        (another NodeTable, typically built from fresh listings of node's
+        path), in place. Ids before node's subtree are unchanged and ids after
+        it shift by the change in size; old ids inside it are matched to new
+        ones by path. Returns remap(old_id) -> new id, or None for a node that
+        is gone.
+        """
+        start, old_end = node + 1, self.subtree_end[node]
+        old_ids, new_ids = _match_children(self, node, forest, 0, start)
+        added = len(forest) - 1
+        delta = added - (old_end - start)
+        parent_chain = []
+        ancestor = node
+        while ancestor != NO_NODE:
+            parent_chain.append(ancestor)
+            ancestor = self.parent[ancestor]
+        after = self.next_sibling[node]
+        if after != NO_NODE:
+            after += delta
+
+        def shift(values):
+            return array("i", (v + delta if v >= old_end else v for v in values))
+
+        if delta:
+            for name in ("parent", "first_child", "next_sibling"):
+                values = getattr(self, name)
+                setattr(self, name, shift(values[:start]) + shift(values[old_end:]))
+            ends = self.subtree_end
+            head = array("i", (v + delta if v > old_end else v for v in ends[:start]))
+            for ancestor in parent_chain:
+                head[ancestor] = ends[ancestor] + delta
+            self.subtree_end = head + shift(ends[old_end:])
+        else:
+            for name in ("parent", "first_child", "next_sibling", "subtree_end"):
+                values = getattr(self, name)
+                setattr(self, name, values[:start] + values[old_end:])
+        self.next_sibling[node] = after
+
+        interned = {name: i for i, name in enumerate(self.names)}
+        name_ids = array("i")
+        for forest_name_id in forest.name_ids[1:]:
+            name = forest.names[forest_name_id]
+            name_id = interned.get(name)
+            if name_id is None:
+                name_id = interned[name] = len(self.names)
+                self.names.append(name)
+            name_ids.append(name_id)
+
+        def moved(values, root_value):
+            return array("i", (root_value if v == 0 else (v + start - 1 if v > 0 else v) for v in values))
+
+        self.name_ids[start:old_end] = name_ids
+        self.parent[start:start] = moved(forest.parent[1:], node)
+        self.first_child[start:start] = moved(forest.first_child[1:], NO_NODE)
+        self.next_sibling[start:start] = moved(forest.next_sibling[1:], NO_NODE)
+        self.subtree_end[start:start] = array("i", (v + start - 1 for v in forest.subtree_end[1:]))
+        self.dir_flags[start:old_end] = forest.dir_flags[1:]
+        self.first_child[node] = start if added else NO_NODE
+        self._name_index = None
+
+        matched = dict(zip(old_ids, new_ids))
+
+        def remap(old_id):
+            if old_id < start:
+                return old_id
+            if old_id >= old_end:
+                return old_id + delta
+            return matched.get(old_id)
+
+        return remap
+
+    def memory_bytes(self):
+        """
+        Rough size of the table's arrays and names.
+        """
+        arrays = (self.name_ids, self.parent, self.first_child, self.next_sibling, self.subtree_end)
+        return (sum(a.itemsize * len(a) for a in arrays) + len(self.dir_flags)
+                + sum(len(name) + 49 for name in self.names))
+
+
+def _match_children(old, old_node, new, new_node, new_offset):
+    """
+    Pair up the nodes below old_node and new_node that have the same path and
+    type, walking both sorted child lists in step. New ids are shifted by
+    new_offset - 1 (where new's children will land in old's id space).
+    Returns (old ids, new ids).
+    """
+    old_ids, new_ids = [], []
+    stack = [(old_node, new_node)]
+    while stack:
+        a, b = stack.pop()
+        old_children = [((old.names[old.name_ids[c]], old.dir_flags[c]), c) for c in old.children(a)]
+        new_children = dict(((new.names[new.name_ids[c]], new.dir_flags[c]), c) for c in new.children(b))
+        for key, child in old_children:
+            match = new_children.get(key)
+            if match is None:
+                continue
+            old_ids.append(child)
+            new_ids.append(match + new_offset - 1)
+            if key[1]:
+                stack.append((child, match))
+    return old_ids, new_ids
@@ -0,0 +1,220 @@
+"""
+Outlines: the shape of a file (imports, class and function signatures,
+docstrings) instead of all of it, so far more of a repository fits in a
+context window next to the few files printed in full.
+
+An extractor turns a file's text into its outline, or returns None when it
+can't (a syntax error, say), in which case the file is printed whole.
+Python files are outlined with the ast module; other types can be added
+with register_extractor(). An Outliner decides which files are outlined,
+by path, and caches outlines by a hash of the file's text, so an unchanged
+file is never parsed twice, even after it is touched or checked out again.
+"""
+import ast
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+DEFAULT_MAX_ENTRIES = 100_000
+
+_EXTRACTORS = {}  # extension -> (name, extract)
+
+
+class Outline(str):
+    """
+    The outline of a file, standing in for its text (render_file_block marks
+    the block as an outline).
+    """
+
+
+def register_extractor(extensions, extract, name=None):
+    """
+    Outline files with these extensions with 'extract' (text -> outline text,
+    or None if the file can't be outlined). 'name' is part of the cache key:
+    change it whenever the extractor's output changes.
+    """
+    name = name or getattr(extract, "__name__", "extractor")
+    for ext in extensions:
+        _EXTRACTORS[ext.lower()] = (name, extract)
+
+
+def get_extractor(path):
+    """
+    (name, extract) for the type of file at 'path', or None.
+    """
+    return _EXTRACTORS.get(os.path.splitext(path)[1].lower())
+
+
+def python_outline(text):
+    """
+    Module docstring, imports, and every class and function (methods too, but
+    not functions nested in functions) with its decorators, signature and
+    docstring; bodies become "...". Comments and other statements are dropped.
+    """
+    try:
+        tree = ast.parse(text)
+    except (SyntaxError, ValueError):
+        return None
+    tree.body = _outline_body(tree.body)
+    return ast.unparse(tree)
+
+
+def _docstring(body):
+    if body and isinstance(body[0], ast.Expr) and isinstance(body[0].value, ast.Constant) \
+            and isinstance(body[0].value.value, str):
+        return [body[0]]
+    return []
+
+
+def _outline_body(body):
+    # Imports, classes (outlined in turn) and function signatures, each with its docstring
+    kept = _docstring(body)
+    for node in body:
+        if isinstance(node, (ast.Import, ast.ImportFrom)):
+            kept.append(node)
+        elif isinstance(node, ast.ClassDef):
+            node.body = _outline_body(node.body) or [ast.Expr(ast.Constant(...))]
+            kept.append(node)
+        elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            node.body = _docstring(node.body) or [ast.Expr(ast.Constant(...))]
+            kept.append(node)
+    return kept
+
+
+register_extractor([".py", ".pyi"], python_outline, "python-ast-1")
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS outlines (
+    key       TEXT PRIMARY KEY,
+    outline   TEXT,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS outlines_last_used ON outlines (last_used);
+"""
+
+_MISSING = object()
+
+
+class OutlineCache:
+    """
+    Outlines by content hash, in memory and, if 'db_path' is given, in a
+    SQLite file shared between runs (keeping the 'max_entries' most recently
+    used). Files that couldn't be outlined are remembered too. Safe to use
+    from the reader threads; use as a context manager or call close().
+    """
+
+    def __init__(self, db_path=None, max_entries=DEFAULT_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._memory = {}
+        self._touched = {}
+        self._lock = threading.Lock()
+        self._conn = None
+        if db_path:
+            self._conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(_SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def get(self, key):
+        """
+        The outline stored under 'key' (None for a file that couldn't be
+        outlined), or _MISSING.
+        """
+        with self._lock:
+            outline = self._memory.get(key, _MISSING)
+            if outline is _MISSING and self._conn is not None:
+                row = self._conn.execute("SELECT outline FROM outlines WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    outline = self._memory[key] = row[0]
+            if outline is _MISSING:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._touched[key] = time.time()
+            return outline
+
+    def put(self, key, outline):
+        with self._lock:
+            self._memory[key] = outline
+            if self._conn is not None:
+                self._conn.execute("INSERT OR REPLACE INTO outlines (key, outline, last_used) VALUES (?, ?, ?)",
+                                   (key, outline, time.time()))
+
+    def close(self):
+        if self._conn is None:
+            return
+        with self._lock:
+            self._conn.executemany("UPDATE outlines SET last_used = ? WHERE key = ?",
+                                   [(used, key) for key, used in self._touched.items()])
+            self._touched = {}
+            self._conn.execute(
+                "DELETE FROM outlines WHERE key IN "
+                "(SELECT key FROM outlines ORDER BY last_used DESC LIMIT -1 OFFSET ?)", (self.max_entries,))
+            self._conn.commit()
+            self._conn.close()
+            self._conn = None
+
+
+class Outliner:
+    """
+    Which files to outline, and their outlines. Files under 'outline_paths'
+    are outlined, except those under 'full_paths'; the closest enclosing
+    path decides (so a file listed in full_paths inside an outlined folder
+    stays whole, and vice versa). Only types with an extractor are outlined.
+    """
+
+    def __init__(self, outline_paths=(), full_paths=(), cache=None):
+        rules = [(os.path.abspath(path), True) for path in outline_paths]
+        rules += [(os.path.abspath(path), False) for path in full_paths]
+        # Longest path first; on a tie, full wins
+        self._rules = sorted(rules, key=lambda rule: (-len(rule[0]), rule[1]))
+        self.cache = cache if cache is not None else OutlineCache()
+        # Part of the rendered blocks' cache variant, since it decides what a block holds
+        self.key = "|".join(("+" if outline else "-") + path for path, outline in sorted(rules))
+
+    def wants(self, path):
+        if get_extractor(path) is None:
+            return False
+        path = os.path.abspath(path)
+        for top, outline in self._rules:
+            if path == top or path.startswith(os.path.join(top, "")):
+                return outline
+        return False
+
+    def outline(self, path, content):
+        """
+        'content' (what a load function returned for 'path': text, or a
+        StreamedFile) as an Outline, or 'content' itself if the file has no
+        extractor or can't be outlined (e.g. a note for a skipped file).
+        """
+        extractor = get_extractor(path)
+        if extractor is None:
+            return content
+        name, extract = extractor
+        text = content if isinstance(content, str) else "".join(content)
+        key = hashlib.sha1(name.encode("utf-8") + b"\0" + text.encode("utf-8", "surrogatepass")).hexdigest()
+        outline = self.cache.get(key)
+        if outline is _MISSING:
+            outline = extract(text)
+            self.cache.put(key, outline)
+        return content if outline is None else Outline(outline)
+
+    def wrap(self, load):
+        """
+        A load function that outlines what 'load' returns for the files this
+        Outliner wants, and passes everything else through.
+        """
+        def load_outlined(path, *args, **kwargs):
+            content = load(path, *args, **kwargs)
+            return self.outline(path, content) if self.wants(path) else content
+        return load_outlined
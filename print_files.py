@@ -1,7 +1,29 @@
-
-> ### `print_files.py`
-```python
+import argparse
+import contextlib
+import functools
+import json
 import os
+import re
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from tree_walker import scan_tree, iter_tree, filter_paths
+from ignore_rules import load_ignore_rules
+from file_reader import iter_file_contents
+from file_sniffer import SkippedFile, StreamedFile, load_file, LARGE_FILE_POLICIES
+from content_cache import ContentCache
+from context_document import (FILE_CONTENTS_HEADER, file_listings, iter_file_block, render_duplicate_block,
+                              render_file_block)
+from token_budget import TokenCounter, fit_to_budget, get_tokenizer
+from document_writer import ClipboardSink, FileSink, write_document
+from git_source import GitError, GitRepo
+from diff_scope import HUNK_LANGUAGE, DiffScope
+from outline import OutlineCache, Outliner
+from dedup import file_digest, find_duplicates
+from shard_writer import manifest_path, plan_shards, shard_paths, write_manifest, write_shard
+from search_index import SearchIndex
+import run_stats
+from run_stats import RunStats
 
 # Specify the paths you want to include here
 paths = [
@@ -19,82 +41,514 @@ file_explanation_output_file = "files_explanation.txt"
 # Directories to exclude from traversal
 exclude_dirs = {".ipynb_checkpoints", "__pycache__"}
 
+# Files and folders (paths, not names) left out of the tree, like the output and the caches are
+exclude_paths = []
+
+# Also skip whatever .gitignore / .contextignore files say (ignored directories aren't walked at all)
+use_ignore_files = True
+
+# Rendered file blocks are cached here between runs, so only changed files get re-read.
+# Set to None to disable the cache.
+content_cache_file = ".files_explanation_cache.sqlite"
+content_cache_max_bytes = 256 * 1024 * 1024
+# Commit to the cache file every this many writes, so runs sharing it (parts written in
+# parallel, print_files_batch.py workers) don't wait on each other for long
+content_cache_commit_every = 256
+
+# Binary-looking files are always skipped. Files bigger than large_file_bytes are handled
+# by large_file_policy: "skip", "truncate" (head + tail) or "stream" (all of it, in chunks)
+large_file_bytes = 1024 * 1024
+large_file_policy = "truncate"
+
+# Token estimation (see --tokens / --max-tokens). Counts are cached per file in token_cache_file.
+tokenizer = "approx"
+token_cache_file = ".files_explanation_tokens.json"
+
+# Read the files from this git revision (e.g. "HEAD~1", "main") instead of the working directory
+git_rev = None
+
+# Only include files changed since this git revision (see --diff / --hunks)
+diff_base = None
+
+# Print just an outline (imports, signatures, docstrings) of the files under outline_paths,
+# except those under full_paths, which stay whole; "." outlines everything (see --outline / --full).
+# Outlines are cached by content hash in outline_cache_file (None keeps them in memory only).
+outline_paths = []
+full_paths = []
+outline_cache_file = ".files_explanation_outlines.sqlite"
+
+# Print the contents of identical files once; later copies get "FILE: x (identical to y)" (see --no-dedupe)
+dedupe_files = True
+
+# With --shard-bytes / --shard-tokens, this many parts are written at once
+shard_workers = 4
+
+# --query ranks the files under 'paths' with a search index kept here (updated as files change).
+# With --rev, files are indexed by blob in a file of its own next to it (see rev_index_file()).
+search_index_file = ".files_explanation_index.sqlite"
+top_k = 20
+
+# --stats reports where the time went, with this many of the slowest file reads
+stats_slowest_files = 10
+
 all_files = []
 
-def guess_code_block_language(filename):
-    _, ext = os.path.splitext(filename)
-    ext = ext.lower()
-    if ext == '.py':
-        return 'python'
-    elif ext == '.js':
-        return 'javascript'
-    elif ext == '.json':
-        return 'json'
-    elif ext in ['.yml', '.yaml']:
-        return 'yaml'
-    elif ext == '.sh':
-        return 'bash'
-    elif ext == '.md':
-        return 'md'
-    elif ext == '.html':
-        return 'html'
-    elif ext == '.css':
-        return 'css'
+def own_files(args):
+    # {absolute folder: test(name)} for the files this tool writes there (the output, its
+    # parts and manifest, the caches) and exclude_paths, so a run over that folder doesn't print them
+    tests = {}
+    def add(path, test=None):
+        folder, name = os.path.split(os.path.abspath(path))
+        tests.setdefault(folder, []).append(test or name.__eq__)
+    for path in (content_cache_file, token_cache_file, outline_cache_file, search_index_file,
+                 search_index_file and rev_index_file(), *exclude_paths):
+        if path:
+            add(path)
+    if args.output != "-":
+        add(args.output)
+        add(manifest_path(args.output))
+        base, ext = os.path.splitext(os.path.basename(args.output))
+        add(args.output, re.compile(re.escape(base) + r"\.part\d+" + re.escape(ext)).fullmatch)
+    return {folder: lambda name, tests=folder_tests: any(test(name) for test in tests)
+            for folder, folder_tests in tests.items()}
+
+def rev_index_file():
+    # The search index for --rev: a blob's stand-in stat never matches the working tree's,
+    # so sharing search_index_file would re-index every file each time the two alternate.
+    # Blobs that are the same in two commits share their entry.
+    if search_index_file == ":memory:":
+        return search_index_file
+    base, ext = os.path.splitext(search_index_file)
+    return base + ".rev" + ext
+
+def drop_own_files(listings, own):
+    # 'listings' without the entries own_files() matches
+    for dir_path, entries in listings.items():
+        is_own = own.get(os.path.abspath(dir_path))
+        if is_own is not None:
+            listings[dir_path] = [(name, is_dir) for name, is_dir in entries if not is_own(name)]
+    return listings
+
+def tree_lines(root, prefix="", ignore_files=None, source=None, scope=None, own=None):
+    # (line, file path or None for directories) for everything under root,
+    # read from the working directory or, with a GitTree as 'source', from a commit.
+    # With a DiffScope, only the changed files (and the folders leading to them) are listed.
+    # 'own' (see own_files()) leaves out the files this tool writes.
+    if ignore_files is None:
+        ignore_files = use_ignore_files
+    if source is not None:
+        ignore = source.ignore_rules(root) if ignore_files else None
     else:
-        return ''  # no specific language
+        ignore = load_ignore_rules(root) if ignore_files else None
+    if scope is not None:
+        changed = filter_paths(root, scope.files_under(root), allowed_extensions, exclude_dirs, ignore, source)
+        root = os.path.normpath(root)
+        listings = file_listings(root, changed)
+    elif source is not None:
+        listings = source.scan(root, allowed_extensions, exclude_dirs, ignore_files)
+    else:
+        listings = scan_tree(root, allowed_extensions, exclude_dirs, ignore=ignore)
+    if own:
+        listings = drop_own_files(dict(listings), own)
+    lines = []
+    for line_prefix, item, path, is_dir in iter_tree(listings, root, prefix):
+        if is_dir:
+            lines.append((line_prefix + item, None))
+        else:
+            lines.append((line_prefix + item, path))
+            all_files.append(path)
+    return lines
 
 def print_tree(root, prefix="", out=None):
-    items = os.listdir(root)
-    items.sort()
-    for i, item in enumerate(items):
-        # Skip excluded directories
-        if item in exclude_dirs:
-            continue
+    for line, _ in tree_lines(root, prefix):
+        print(line, file=out)
+
+def iter_file_blocks(files, cache=None, load=load_file, variant="", size_cap=None, stat=os.stat, duplicates=None):
+    # Yields the block of each file in 'files' order. Files whose size/mtime/inode
+    # still match the cache are spliced in from it; everything else is read ahead concurrently.
+    # Files in 'duplicates' aren't read at all: they just refer to their identical original.
+    for _, chunk in iter_file_chunks(files, cache, load, variant, size_cap, stat, duplicates):
+        yield chunk
+
+def iter_file_chunks(files, cache=None, load=load_file, variant="", size_cap=None, stat=os.stat, duplicates=None):
+    # iter_file_blocks(), as (file path, chunk) pairs. Each file whose contents go out counts
+    # as "files_written"; a skipped file's note isn't cached, so a hit is always contents.
+    duplicates = duplicates or {}
+    stats = []
+    cached = []
+    for fpath in files:
+        try:
+            st = stat(fpath) if fpath not in duplicates else None
+        except OSError:
+            st = None
+        stats.append(st)
+        cached.append(cache is not None and st is not None and cache.contains(fpath, st, variant=fpath + variant))
 
-        path = os.path.join(root, item)
-        connector = "└── " if i == len(items)-1 else "├── "
+    # Large files never hold more than large_file_bytes in memory, whatever the policy
+    size_cap = size_cap or large_file_bytes
+    sizes = {fpath: min(st.st_size, size_cap) for fpath, st in zip(files, stats) if st is not None}
+    to_read = [fpath for fpath, hit in zip(files, cached) if not hit and fpath not in duplicates]
+    fresh = iter_file_contents(to_read, read=load, size_of=lambda p: sizes.get(p, 0))
 
-        if os.path.isdir(path):
-            print(prefix + connector + item, file=out)
-            new_prefix = prefix + ("    " if i == len(items)-1 else "│   ")
-            print_tree(path, new_prefix, out=out)
+    for fpath, st, hit in zip(files, stats, cached):
+        if fpath in duplicates:
+            yield fpath, render_duplicate_block(fpath, duplicates[fpath])
+            continue
+        block = cache.get(fpath, st, variant=fpath + variant) if hit else None
+        if block is not None:
+            run_stats.add("files_written")
         else:
-            # Check allowed extension
-            _, ext = os.path.splitext(item)
-            ext = ext.lower()
-            if ext in allowed_extensions:
-                print(prefix + connector + item, file=out)
-                all_files.append(path)
+            # Either a miss, or the entry was evicted since we checked
+            content = next(fresh)[1] if not hit else load(fpath)
+            if isinstance(content, StreamedFile):
+                # Streamed, or clean UTF-8 copied as is. A file that was read whole is
+                # still cached, so an unchanged rerun doesn't read it again.
+                if cache is not None and st is not None and getattr(content, "data", None) is not None:
+                    cache.put(fpath, st, render_file_block(fpath, content.data.decode("utf-8")),
+                              variant=fpath + variant)
+                run_stats.add("files_written")
+                for chunk in iter_file_block(fpath, content, raw=True):
+                    yield fpath, chunk
+                continue
+            block = render_file_block(fpath, content)
+            if not isinstance(content, SkippedFile):
+                run_stats.add("files_written")
+                if cache is not None and st is not None:
+                    cache.put(fpath, st, block, variant=fpath + variant)
+        yield fpath, block
 
-if __name__ == "__main__":
-    with open(file_explanation_output_file, "w", encoding="utf-8") as out:
-        # Print the directory structure for all specified paths
-        for folder in paths:
-            if os.path.isfile(folder):
+def iter_content_chunks(files, duplicates, cache, load, stat, variant, args):
+    # (file path, chunk) for the FILE CONTENTS part
+    if args.hunks is not None:
+        # 'load' gives the changed hunks; they're cheap to recompute, so not cached
+        for fpath in files:
+            run_stats.add("files_written")
+            yield fpath, render_file_block(fpath, load(fpath), HUNK_LANGUAGE)
+    else:
+        yield from iter_file_chunks(files, cache, load, variant, args.large_file_bytes, stat, duplicates)
+
+def iter_tree_text(sections, kept, token_counts, duplicates):
+    # The directory structure for all specified paths, with token counts and duplicates marked
+    for section in sections:
+        for line, fpath in section:
+            if token_counts is not None and fpath is not None:
+                note = "" if fpath in kept else ", omitted"
+                line += f" ({token_counts[fpath]} tokens{note})"
+            if fpath in duplicates:
+                line += f" (identical to {duplicates[fpath]})"
+            yield line + "\n"
+        yield "\n"
+
+def iter_output(sections, files, token_counts, duplicates, cache, load, stat, variant, args):
+    # The whole output file as a stream of chunks, in one pass
+    yield from iter_tree_text(sections, set(files), token_counts, duplicates)
+
+    if token_counts is not None:
+        total = sum(token_counts[fpath] for fpath in files)
+        summary = f"Total: ~{total} tokens in {len(files)} files"
+        if len(files) < len(all_files):
+            summary += f" ({len(all_files) - len(files)} omitted to fit --max-tokens {args.max_tokens})"
+        yield summary + "\n\n"
+
+    # Now print file contents separately
+    yield FILE_CONTENTS_HEADER + "\n"
+    for _, chunk in iter_content_chunks(files, duplicates, cache, load, stat, variant, args):
+        yield chunk
+
+def cut_sections(sections, keep):
+    # The tree sections cut down to the files in 'keep' (and the folders leading to them)
+    wanted = set(keep)
+    excerpt = []
+    for section in sections:
+        files = [fpath for _, fpath in section if fpath in wanted]
+        if not files:
+            continue
+        head = section[0][0]
+        if not head.endswith("/"):
+            # A file listed in 'paths' by itself
+            excerpt.append(section)
+            continue
+        root = os.path.normpath(head[:-1])
+        original = {os.path.normpath(fpath): fpath for fpath in files}
+        lines = [(head, None)]
+        for line_prefix, item, path, is_dir in iter_tree(file_listings(root, files), root):
+            lines.append((line_prefix + item, None if is_dir else original[os.path.normpath(path)]))
+        excerpt.append(lines)
+    return excerpt
+
+def shard_costs(sections, duplicates, token_counts, load, stat, args):
+    # Estimated cost of each file in a part, in bytes or tokens: its block, its line in the
+    # tree excerpt and its folder's line. Erring on the large side, so parts stay under the cap.
+    lines = {}
+    for section in sections:
+        folder_line = ""
+        for line, fpath in section:
+            if fpath is None:
+                folder_line = line
+            else:
+                lines[fpath] = (line, folder_line)
+    if args.shard_tokens:
+        count_text = get_tokenizer(args.tokenizer)
+        def cost(fpath):
+            line, folder_line = lines[fpath]
+            overhead = 0 if fpath in duplicates else count_text(render_file_block(fpath, ""))
+            return token_counts[fpath] + overhead + count_text(line) + count_text(folder_line) + 2
+        return cost
+
+    def line_bytes(line):
+        # Indentation can use "│   " (6 bytes) where the full tree had "    " (4)
+        return len(line.encode("utf-8")) + 2 * line.count("    ") + 1
+
+    def block_bytes(fpath):
+        if fpath in duplicates:
+            return len(render_duplicate_block(fpath, duplicates[fpath]).encode("utf-8"))
+        if args.hunks is not None:
+            return len(render_file_block(fpath, load(fpath), HUNK_LANGUAGE).encode("utf-8"))
+        header = len(render_file_block(fpath, "", "").encode("utf-8")) + 16
+        try:
+            size = stat(fpath).st_size
+        except OSError:
+            return header + 64
+        if size <= args.large_file_bytes or args.large_files == "stream":
+            return header + size
+        # A note, or head and tail with an elision marker between them
+        return header + 64 + (args.large_file_bytes if args.large_files == "truncate" else 0)
+
+    def cost(fpath):
+        line, folder_line = lines[fpath]
+        return block_bytes(fpath) + line_bytes(line) + line_bytes(folder_line)
+    return cost
+
+def open_content_cache():
+    return ContentCache(content_cache_file, content_cache_max_bytes, content_cache_commit_every)
+
+def write_shards(sections, files, token_counts, duplicates, load, stat, variant, args):
+    # Split the output into parts under --shard-bytes / --shard-tokens, written concurrently,
+    # plus a JSON manifest of where each file's block is
+    cap = args.shard_tokens or args.shard_bytes
+    unit = "tokens" if args.shard_tokens else "bytes"
+    cost = shard_costs(sections, duplicates, token_counts, load, stat, args)
+    # Room for the part header, folder lines of 'paths' and the FILE CONTENTS header
+    reserve = 256 if unit == "bytes" else 64
+    shards = plan_shards(list(dict.fromkeys(files)), cost, max(cap - reserve, 1))
+    outputs = shard_paths(args.output, len(shards))
+
+    def write_part(i):
+        part_files = shards[i]
+        header = [f"========== PART {i + 1} OF {len(shards)} ==========\n\n"]
+        header += iter_tree_text(cut_sections(sections, part_files), set(part_files), token_counts, duplicates)
+        if token_counts is not None:
+            total = sum(token_counts[fpath] for fpath in part_files)
+            header.append(f"Total: ~{total} tokens in {len(part_files)} files\n\n")
+        header.append(FILE_CONTENTS_HEADER + "\n")
+        # SQLite connections can't be shared between threads, so each part opens the cache itself
+        with contextlib.ExitStack() as stack:
+            cache = stack.enter_context(open_content_cache()) if content_cache_file else None
+            return write_shard(outputs[i], header,
+                               iter_content_chunks(part_files, duplicates, cache, load, stat, variant, args))
+
+    with ThreadPoolExecutor(max_workers=max(1, min(shard_workers, len(shards)))) as pool:
+        written = list(pool.map(run_stats.carried(write_part), range(len(shards))))
+    for shard in written:
+        for entry in shard["files"]:
+            if entry["file"] in duplicates:
+                entry["identical_to"] = duplicates[entry["file"]]
+    write_manifest(manifest_path(args.output), written, cap, unit)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Print a tree and the contents of the files under 'paths'.")
+    parser.add_argument("--no-ignore-files", dest="ignore_files", action="store_false", default=use_ignore_files,
+                        help="don't apply .gitignore / .contextignore patterns")
+    parser.add_argument("--tokens", action="store_true",
+                        help="show estimated token counts per file and in total in the tree section")
+    parser.add_argument("--max-tokens", type=int, default=None,
+                        help="only include as many files as fit in this many tokens (implies --tokens)")
+    parser.add_argument("--fit", choices=["greedy", "knapsack"], default="greedy",
+                        help="how --max-tokens picks files; earlier entries in 'paths' have priority")
+    parser.add_argument("--tokenizer", default=tokenizer,
+                        help="'approx' (default, fast estimate) or e.g. 'tiktoken:cl100k_base'")
+    parser.add_argument("--large-files", choices=LARGE_FILE_POLICIES, default=large_file_policy,
+                        help="what to do with files over --large-file-bytes")
+    parser.add_argument("--large-file-bytes", type=int, default=large_file_bytes)
+    parser.add_argument("--output", default=file_explanation_output_file,
+                        help="where to write the result ('-' for stdout)")
+    parser.add_argument("--clipboard", action="store_true",
+                        help="copy the result to the clipboard instead of writing --output")
+    parser.add_argument("--rev", default=git_rev,
+                        help="read tracked files from this git commit/branch/tag instead of the working directory")
+    parser.add_argument("--diff", metavar="BASE", default=diff_base,
+                        help="only include files changed since the git revision BASE (up to --rev, if given)")
+    parser.add_argument("--hunks", metavar="N", type=int, default=None,
+                        help="with --diff, print only the changed hunks with N lines of context instead of whole files")
+    parser.add_argument("--outline", metavar="PATH", action="append", default=[],
+                        help="print only an outline of the (Python) files under PATH; repeatable, '.' for all")
+    parser.add_argument("--full", metavar="PATH", action="append", default=[],
+                        help="print the files under PATH in full, inside an --outline path; repeatable")
+    parser.add_argument("--no-dedupe", dest="dedupe", action="store_false", default=dedupe_files,
+                        help="print identical files in full every time")
+    parser.add_argument("--query", default=None,
+                        help="only include the files that best match this text (e.g. 'retry logic in the uploader')")
+    parser.add_argument("--top-k", type=int, default=top_k,
+                        help="with --query, how many of the best matches to include (fewer if --max-tokens is hit)")
+    parser.add_argument("--stats", nargs="?", const="text", choices=["text", "json"], default=None,
+                        help="report time per phase, counts, cache hit rates and the slowest reads on stderr")
+    parser.add_argument("--profile", metavar="PATH", default=None,
+                        help="write a cProfile dump of the run to PATH (a pyinstrument report if PATH ends in .html)")
+    shard = parser.add_mutually_exclusive_group()
+    shard.add_argument("--shard-bytes", metavar="N", type=int, default=None,
+                       help="split the output into parts of at most about N bytes, plus a JSON manifest")
+    shard.add_argument("--shard-tokens", metavar="N", type=int, default=None,
+                       help="split the output into parts of at most about N tokens, plus a JSON manifest")
+    args = parser.parse_args(argv)
+    if (args.shard_bytes or args.shard_tokens) and (args.clipboard or args.output == "-"):
+        parser.error("--shard-bytes / --shard-tokens write files next to --output")
+    args.outline = outline_paths + args.outline
+    args.full = full_paths + args.full
+    if args.hunks is not None and not args.diff:
+        parser.error("--hunks needs --diff")
+    return args
+
+def main(argv=None):
+    args = parse_args(argv)
+    stats = RunStats(stats_slowest_files) if args.stats else None
+    with contextlib.ExitStack() as stack:
+        if args.profile:
+            stack.enter_context(run_stats.profiling(args.profile))
+        stack.enter_context(run_stats.collecting(stats))
+        generate(args)
+    # On stderr, since the document itself may be going to stdout
+    if args.stats == "json":
+        print(json.dumps(stats.as_dict(), indent=1), file=sys.stderr)
+    elif args.stats:
+        print(stats.format_summary(), file=sys.stderr)
+
+def generate(args):
+    # run() on the working directory, or on the commit / changes --rev and --diff ask for
+    if args.rev or args.diff:
+        try:
+            with GitRepo() as repo:
+                source = repo.tree(args.rev) if args.rev else None
+                scope = DiffScope(repo, args.diff, args.rev, args.hunks) if args.diff else None
+                run(args, source, scope)
+        except GitError as e:
+            raise SystemExit(f"git: {e}")
+    else:
+        run(args)
+
+def run(args, source=None, scope=None):
+    # 'source' is a GitTree to read a commit instead of the working directory,
+    # 'scope' a DiffScope to keep only the files that changed
+    with contextlib.ExitStack() as stack:
+        cache = stack.enter_context(open_content_cache()) if content_cache_file else None
+        run_stats.watch_cache("content", cache)
+        outliner = None
+        if args.outline:
+            outliner = Outliner(args.outline, args.full, stack.enter_context(OutlineCache(outline_cache_file)))
+            run_stats.watch_cache("outlines", outliner.cache)
+        write_output(args, source, scope, cache, outliner)
+
+def write_output(args, source=None, scope=None, cache=None, outliner=None):
+    read_file = source.load if source is not None else load_file
+    stat = source.stat if source is not None else os.stat
+    isfile = source.isfile if source is not None else os.path.isfile
+    load = lambda fpath: read_file(fpath, args.large_file_bytes, args.large_files)
+    # For the output itself: files that need no decoding are copied byte for byte
+    load_raw = lambda fpath: read_file(fpath, args.large_file_bytes, args.large_files, raw=True)
+    # Blocks rendered under a different large-file setting mustn't be reused from the cache
+    variant = f"|{args.large_files}:{args.large_file_bytes}"
+    if outliner is not None:
+        load = outliner.wrap(load)
+        load_raw = outliner.wrap(load_raw)
+        variant += f"|outline:{outliner.key}"
+    if args.hunks is not None:
+        # Made once per file (an untracked file is read whole), then reused for the
+        # token count, the part sizes under --shard-bytes and the output
+        load = load_raw = functools.lru_cache(maxsize=None)(scope.hunks)
+    stat = run_stats.timed("stat", stat)
+
+    # Walk everything first: token counts have to be known before the tree is printed
+    sections = []
+    priorities = {}
+    own = own_files(args)
+    with run_stats.phase("walk"):
+        for i, folder in enumerate(paths):
+            first_new = len(all_files)
+            if isfile(folder):
                 _, ext = os.path.splitext(folder)
-                if ext.lower() in allowed_extensions:
-                    print(folder, file=out)
+                if ext.lower() in allowed_extensions and (scope is None or scope.is_changed(folder)):
                     all_files.append(folder)
-                    print("", file=out)
+                    sections.append([(folder, folder)])
+            else:
+                # A directory - collect its structure
+                sections.append([(folder + "/", None)] + tree_lines(folder, ignore_files=args.ignore_files,
+                                                                    source=source, scope=scope, own=own))
+            for fpath in all_files[first_new:]:
+                priorities.setdefault(fpath, len(paths) - i)
+
+    if args.query:
+        # Keep the best matches only, ranked first for --max-tokens too
+        index_file = search_index_file if source is None else rev_index_file()
+        with run_stats.phase("search"), SearchIndex(index_file) as index:
+            index.update(all_files, read=lambda fpath: read_file(fpath, args.large_file_bytes, "truncate"), stat=stat,
+                         prune=[folder for folder in paths if source is None and os.path.isdir(folder)])
+            ranked = index.search(args.query, all_files)[:args.top_k]
+        priorities = {fpath: len(ranked) - rank for rank, (fpath, _) in enumerate(ranked)}
+        sections = cut_sections(sections, priorities)
+        all_files[:] = [fpath for fpath in all_files if fpath in priorities]
+        if not ranked:
+            sections = [[(f"(no files match --query {args.query!r})", None)]]
+
+    # Identical files (hashed only when their sizes match; a commit's blob ids are hashes already)
+    duplicates = {}
+    if args.dedupe and args.hunks is None:
+        with run_stats.phase("dedupe"):
+            if source is not None:
+                duplicates = find_duplicates(all_files, source.digest, stat)
+            else:
+                duplicates = find_duplicates(all_files, file_digest, stat, cache)
+
+    files = all_files
+    token_counts = None
+    if args.tokens or args.max_tokens is not None or args.shard_tokens:
+        with run_stats.phase("tokens"):
+            counter = TokenCounter(args.tokenizer, cache_file=token_cache_file, variant=variant)
+            run_stats.watch_cache("tokens", counter)
+            count_text = counter.count_text
+            if args.hunks is not None:
+                token_counts = {fpath: count_text(load(fpath)) for fpath in all_files}
             else:
-                # A directory - print its structure
-                print(folder + "/", file=out)
-                print_tree(folder, out=out)
-                print("", file=out)
-
-        # Now print file contents separately
-        print("========== FILE CONTENTS ==========\n", file=out)
-        for fpath in all_files:
-            lang = guess_code_block_language(fpath)
-            # Ensure we can read the file
-            try:
-                with open(fpath, 'r', encoding='utf-8', errors='replace') as f:
-                    content = f.read()
-            except Exception as e:
-                content = f"Error reading file: {e}"
-
-            print(f"FILE: {fpath}", file=out)
-            print("```" + lang, file=out)
-            print(content, file=out)
-            print("```", file=out)
-            print("", file=out)
+                token_counts = counter.count_files([fpath for fpath in all_files if fpath not in duplicates],
+                                                   read=load, stat=stat)
+            counter.save()
+            # A duplicate only costs its reference
+            for fpath, original in duplicates.items():
+                token_counts[fpath] = count_text(render_duplicate_block(fpath, original))
+        if args.max_tokens is not None:
+            tree_tokens = count_text("\n".join(line for section in sections for line, _ in section))
+            overhead = lambda fpath: 0 if fpath in duplicates else count_text(render_file_block(fpath, ""))
+            items = [(fpath, token_counts[fpath] + overhead(fpath), priorities[fpath])
+                     for fpath in dict.fromkeys(all_files)]
+            kept = fit_to_budget(items, args.max_tokens - tree_tokens, args.fit)
+            # A reference is no use without the file it points to
+            kept = {fpath for fpath in kept if fpath not in duplicates or duplicates[fpath] in kept}
+            files = [fpath for fpath in all_files if fpath in kept]
+
+    if args.shard_bytes or args.shard_tokens:
+        # The part writers have connections of their own, which would wait on this one's digests
+        if cache is not None:
+            cache.commit()
+        with run_stats.phase("write"):
+            write_shards(sections, files, token_counts, duplicates, load_raw, stat, variant, args)
+        return
+    if args.clipboard:
+        sink = ClipboardSink()
+    elif args.output == "-":
+        sink = FileSink(sys.stdout)
+    else:
+        sink = FileSink(args.output)
+    with run_stats.phase("write"):
+        write_document(iter_output(sections, files, token_counts, duplicates, cache, load_raw, stat, variant, args),
+                       sink)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,246 @@
+"""
+Run print_files.py over many repositories at once, from a manifest.
+
+    python print_files_batch.py repos.json
+    python print_files_batch.py repos.json --workers 16 --output-dir /srv/contexts
+
+The manifest is JSON:
+
+    {
+      "output_dir": "contexts",
+      "options": ["--tokens", "--max-tokens", "200000"],
+      "repos": [
+        "/srv/repos/billing",
+        {"root": "/srv/repos/search", "name": "search", "paths": ["src", "README.md"],
+         "options": ["--outline", "src/vendor"]}
+      ]
+    }
+
+Each repo is a root directory (paths inside it are relative to it; "."
+by default), with print_files.py command-line options: the manifest's
+"options" first, then the repo's own. Every repo gets <name>.txt in the
+output directory, or a set of parts plus a manifest with --shard-bytes /
+--shard-tokens. summary.json sits next to them, with the time, file count,
+size and outcome of every repo (and, with --stats, its full stats). A repo
+that fails doesn't stop the others, even by killing its worker process: the
+jobs that were still to finish when a worker died are run again, each in a
+process of its own.
+
+Repos are handed out to a pool of worker processes, so throughput scales
+with cores. All of them share one content cache (and its digests) in the
+cache directory. It is keyed by a file's absolute path and stat, so it
+saves the reads of files unchanged since the last batch; the same file
+checked out in two repos is still read once per repo. Its size bound
+(print_files.content_cache_max_bytes) is enforced by each job on its own,
+against the size the file had when the job opened it plus what that job
+added, so the shared file can grow past the bound by what the jobs running
+alongside it add. The output and cache directories are left out of every
+repo's tree, even when they sit inside it. Each worker keeps compiled
+ignore patterns across the repos it handles, so identical .gitignore files
+are compiled once per worker. Token counts, outlines and search indexes
+are kept per repo.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+import print_files
+import run_stats
+from run_stats import RunStats
+from shard_writer import manifest_path
+
+SUMMARY_FILE = "summary.json"
+
+
+def load_manifest(path, output_dir=None):
+    """
+    The manifest at 'path' as a list of jobs (dicts with name, root, paths,
+    argv for print_files, output), plus the output and cache directories.
+    Relative directories are taken from the manifest's folder.
+    """
+    with open(path, encoding="utf-8") as f:
+        manifest = json.load(f)
+    base = os.path.dirname(os.path.abspath(path))
+    output_dir = os.path.join(base, output_dir or manifest.get("output_dir", "."))
+    cache_dir = os.path.join(base, manifest.get("cache_dir", os.path.join(output_dir, ".cache")))
+
+    jobs = []
+    names = set()
+    for entry in manifest.get("repos", []):
+        if isinstance(entry, str):
+            entry = {"root": entry}
+        root = os.path.normpath(os.path.join(base, entry["root"]))
+        name = entry.get("name") or os.path.basename(root)
+        # Two repos with the same folder name mustn't overwrite each other's output
+        unique, n = name, 2
+        while unique in names:
+            unique, n = f"{name}-{n}", n + 1
+        names.add(unique)
+        output = os.path.join(output_dir, unique + ".txt")
+        argv = list(manifest.get("options", [])) + list(entry.get("options", [])) + ["--output", output]
+        jobs.append({"name": unique, "root": root, "paths": entry.get("paths", ["."]), "argv": argv,
+                     "output": output})
+    return jobs, output_dir, cache_dir
+
+
+def check_job(job):
+    """
+    Why 'job' can't run (a message), or None.
+    """
+    if not os.path.isdir(job["root"]):
+        return f"not a directory: {job['root']}"
+    try:
+        args = print_files.parse_args(job["argv"])
+    except SystemExit:
+        return f"bad options: {' '.join(job['argv'])}"
+    if args.clipboard:
+        return "--clipboard makes no sense in a batch"
+    if args.profile:
+        return "--profile would write every repo's profile to the same file; profile one repo with print_files.py"
+    return None
+
+
+def _init_worker(cache_dir):
+    # One content cache for everyone; the per-repo caches are set for each job
+    print_files.content_cache_file = os.path.join(cache_dir, "content.sqlite")
+
+
+def run_job(job, cache_dir):
+    """
+    Generate one repo's context in this (worker) process. Returns its
+    summary entry; errors are reported there rather than raised.
+    """
+    start = time.perf_counter()
+    result = {"name": job["name"], "root": job["root"], "output": job["output"]}
+    # check_job() made sure the options parse
+    args = print_files.parse_args(job["argv"])
+    stats = RunStats(slowest=print_files.stats_slowest_files if args.stats else 0)
+    try:
+        os.chdir(job["root"])
+        print_files.paths = job["paths"]
+        print_files.exclude_paths = [os.path.dirname(job["output"]), cache_dir]
+        print_files.all_files.clear()
+        prefix = os.path.join(cache_dir, job["name"])
+        print_files.token_cache_file = prefix + ".tokens.json"
+        print_files.outline_cache_file = prefix + ".outlines.sqlite"
+        print_files.search_index_file = prefix + ".index.sqlite"
+        with run_stats.collecting(stats):
+            print_files.generate(args)
+        result["ok"] = True
+        # Not all_files: that also has the files left out by --max-tokens, skipped or deduplicated
+        result["files"] = stats.counters["files_written"]
+        if args.shard_bytes or args.shard_tokens:
+            result["output"] = manifest_path(job["output"])
+    except (Exception, SystemExit) as e:
+        result["ok"] = False
+        result["error"] = str(e) or type(e).__name__
+    result["seconds"] = round(time.perf_counter() - start, 3)
+    result["bytes_written"] = stats.counters["bytes_written"]
+    result["bytes_read"] = stats.counters["bytes_read"]
+    if args.stats:
+        # What --stats would print, kept in the summary rather than on a shared stderr
+        result["stats"] = stats.as_dict()
+    return result
+
+
+def run_alone(job, cache_dir):
+    """
+    run_job() in a worker process of its own, so that if the process dies
+    (out of memory, a crash in a C extension) only this job fails.
+    """
+    with ProcessPoolExecutor(max_workers=1, initializer=_init_worker, initargs=(cache_dir,)) as pool:
+        try:
+            return pool.submit(run_job, job, cache_dir).result()
+        except BrokenProcessPool:
+            return {"name": job["name"], "root": job["root"], "ok": False, "error": "the worker process died"}
+
+
+def run_batch(jobs, output_dir, cache_dir, workers=None, progress=None):
+    """
+    Run 'jobs' (see load_manifest) on a process pool and write the summary.
+    'progress' is called with each job's summary entry as it finishes.
+    Returns the summary.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    os.makedirs(cache_dir, exist_ok=True)
+    start = time.perf_counter()
+    results = {}
+
+    def finish(result):
+        results[result["name"]] = result
+        if progress:
+            progress(result)
+
+    runnable = []
+    for job in jobs:
+        problem = check_job(job)
+        if problem is None:
+            runnable.append(job)
+        else:
+            finish({"name": job["name"], "root": job["root"], "ok": False, "error": problem})
+
+    workers = min(workers or os.cpu_count() or 1, max(1, len(runnable)))
+    unfinished = []
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(cache_dir,)) as pool:
+        futures = {pool.submit(run_job, job, cache_dir): job for job in runnable}
+        for future in as_completed(futures):
+            job = futures[future]
+            try:
+                finish(future.result())
+            except BrokenProcessPool:
+                # A worker died and took the pool down with it; we can't tell whose job killed it
+                unfinished.append(job)
+            except Exception as e:
+                finish({"name": job["name"], "root": job["root"], "ok": False, "error": str(e) or type(e).__name__})
+    if unfinished:
+        # Each in a process of its own this time, so only the job that kills its worker fails
+        with ThreadPoolExecutor(max_workers=workers) as threads:
+            for future in as_completed([threads.submit(run_alone, job, cache_dir) for job in unfinished]):
+                finish(future.result())
+
+    repos = [results[job["name"]] for job in jobs]
+    summary = {
+        "seconds": round(time.perf_counter() - start, 3),
+        "workers": workers,
+        "repos": len(repos),
+        "failed": sum(1 for result in repos if not result["ok"]),
+        "files": sum(result.get("files", 0) for result in repos),
+        "bytes_written": sum(result.get("bytes_written", 0) for result in repos),
+        "results": repos,
+    }
+    tmp = os.path.join(output_dir, SUMMARY_FILE + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(summary, f, indent=1)
+    os.replace(tmp, os.path.join(output_dir, SUMMARY_FILE))
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("manifest", help="JSON manifest of repos (see the top of this file)")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: one per core)")
+    parser.add_argument("--output-dir", default=None, help="overrides the manifest's output_dir")
+    args = parser.parse_args()
+
+    jobs, output_dir, cache_dir = load_manifest(args.manifest, args.output_dir)
+
+    def progress(result):
+        if result["ok"]:
+            print(f"{result['name']}: {result['files']} files, {result['bytes_written'] / 1048576:.1f} MB "
+                  f"in {result['seconds']:.1f}s")
+        else:
+            print(f"{result['name']}: FAILED: {result['error']}", file=sys.stderr)
+
+    summary = run_batch(jobs, output_dir, cache_dir, args.workers, progress)
+    print(f"{summary['repos'] - summary['failed']} of {summary['repos']} repos done in {summary['seconds']:.1f}s "
+          f"with {summary['workers']} workers; summary in {os.path.join(output_dir, SUMMARY_FILE)}")
+    if summary["failed"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,271 @@
+"""
+Where a run's time goes: per-phase timings and counters for print_files.py
+and the apps.
+
+A RunStats records phases (wall and CPU time of a stretch of the run, such
+as the walk or writing the output), counters (directories listed, files
+visited, excluded and skipped, bytes read and written), operations (time
+spent in each directory listing, file read, decode and write, summed over
+the threads doing them, so it can exceed the wall time), the slowest file
+reads, and the hit rates of the caches it was told about.
+
+The shared pipeline (tree_walker, file_sniffer, document_writer) reports to
+whichever RunStats is active (see collecting()); with none active,
+reporting is a function call that does nothing. collecting() is per thread
+(a context variable), so concurrent runs, like the Streamlit app's
+sessions, each keep their own; activate() sets the process-wide one that
+applies wherever collecting() isn't in effect. Thread pools of the pipeline
+pass theirs on to their workers with carried(). CPU time is the process's,
+so phases overlapping in other threads (e.g. concurrent requests in the
+Flask app) share it. profiling() adds a cProfile or pyinstrument dump.
+"""
+import contextlib
+import contextvars
+import heapq
+import threading
+import time
+from collections import Counter
+
+DEFAULT_SLOWEST = 10
+
+_UNSET = object()
+# The process-wide RunStats (activate()) and the one of the current thread or task (collecting())
+_active = None
+_current = contextvars.ContextVar("run_stats", default=_UNSET)
+
+
+class RunStats:
+    """
+    Timings and counters for one run (or, in a server, for all requests
+    since it started). Safe to report to from any thread.
+    """
+
+    def __init__(self, slowest=DEFAULT_SLOWEST):
+        self.slowest = slowest
+        self.started = time.time()
+        self.phases = {}  # name -> [count, wall seconds, cpu seconds]
+        self.counters = Counter()
+        self.operations = {}  # name -> [count, seconds]
+        self.caches = {}  # name -> anything with .hits and .misses
+        self._slowest = []  # min-heap of (seconds, path)
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """
+        Time the 'with' block as phase 'name' (repeated phases add up).
+        """
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+            with self._lock:
+                entry = self.phases.setdefault(name, [0, 0.0, 0.0])
+                entry[0] += 1
+                entry[1] += wall
+                entry[2] += cpu
+
+    def add(self, name, n=1):
+        with self._lock:
+            self.counters[name] += n
+
+    def record(self, name, seconds, path=None):
+        """
+        One operation 'name' that took 'seconds'; with a 'path', it is a
+        candidate for the slowest files.
+        """
+        with self._lock:
+            entry = self.operations.setdefault(name, [0, 0.0])
+            entry[0] += 1
+            entry[1] += seconds
+            if path is not None and self.slowest:
+                if len(self._slowest) < self.slowest:
+                    heapq.heappush(self._slowest, (seconds, path))
+                elif seconds > self._slowest[0][0]:
+                    heapq.heapreplace(self._slowest, (seconds, path))
+
+    def watch_cache(self, name, cache):
+        """
+        Report the hit rate of 'cache' (anything with .hits and .misses).
+        """
+        self.caches[name] = cache
+
+    def as_dict(self):
+        with self._lock:
+            caches = {}
+            for name, cache in self.caches.items():
+                lookups = cache.hits + cache.misses
+                caches[name] = {"hits": cache.hits, "misses": cache.misses,
+                                "hit_rate": round(cache.hits / lookups, 4) if lookups else None}
+            # A file read twice (say, for token counts, then for the output) is listed once
+            slowest = {}
+            for seconds, path in sorted(self._slowest, reverse=True):
+                slowest.setdefault(path, seconds)
+            return {
+                "elapsed": round(time.time() - self.started, 4),
+                "phases": {name: {"count": count, "wall": round(wall, 4), "cpu": round(cpu, 4)}
+                           for name, (count, wall, cpu) in self.phases.items()},
+                "counters": dict(self.counters),
+                "operations": {name: {"count": count, "seconds": round(seconds, 4)}
+                               for name, (count, seconds) in self.operations.items()},
+                "caches": caches,
+                "slowest_files": [{"path": path, "seconds": round(seconds, 4)} for path, seconds in slowest.items()],
+            }
+
+    def format_summary(self):
+        """
+        The same as as_dict(), as a few lines for a person to read.
+        """
+        data = self.as_dict()
+        lines = [f"Run stats ({data['elapsed']:.2f}s since start)"]
+        if data["phases"]:
+            lines.append("Phases (wall / cpu):")
+            for name, phase in data["phases"].items():
+                times = f" x{phase['count']}" if phase["count"] > 1 else ""
+                lines.append(f"  {name:<14} {phase['wall']:9.3f}s {phase['cpu']:9.3f}s{times}")
+        if data["operations"]:
+            lines.append("Time in operations (summed over threads):")
+            for name, op in data["operations"].items():
+                lines.append(f"  {name:<14} {op['seconds']:9.3f}s in {op['count']} calls")
+        if data["counters"]:
+            lines.append("Counts:")
+            for name, value in sorted(data["counters"].items()):
+                lines.append(f"  {name:<22} {value}")
+        if data["caches"]:
+            lines.append("Caches:")
+            for name, cache in data["caches"].items():
+                rate = "-" if cache["hit_rate"] is None else f"{cache['hit_rate']:.0%}"
+                lookups = cache["hits"] + cache["misses"]
+                lines.append(f"  {name:<14} {rate:>5} hits ({cache['hits']} of {lookups})")
+        if data["slowest_files"]:
+            lines.append("Slowest reads:")
+            for entry in data["slowest_files"]:
+                lines.append(f"  {entry['seconds']:9.4f}s  {entry['path']}")
+        return "\n".join(lines)
+
+
+def active():
+    """
+    The RunStats being reported to, or None.
+    """
+    stats = _current.get()
+    return _active if stats is _UNSET else stats
+
+
+def activate(stats):
+    """
+    Report to 'stats' (None to stop) from now on, in every thread not inside
+    collecting(); returns the previous one.
+    """
+    global _active
+    previous, _active = _active, stats
+    return previous
+
+
+@contextlib.contextmanager
+def collecting(stats):
+    """
+    Report to 'stats' inside the 'with' block, in this thread (and the pool
+    workers it hands carried() functions to); a None 'stats' turns
+    reporting off.
+    """
+    token = _current.set(stats)
+    try:
+        yield stats
+    finally:
+        _current.reset(token)
+
+
+def carried(fn):
+    """
+    'fn', reporting to the RunStats active here in whatever thread runs it.
+    """
+    stats = _current.get()
+    if stats is _UNSET:
+        return fn
+
+    def carried_fn(*args, **kwargs):
+        with collecting(stats):
+            return fn(*args, **kwargs)
+    return carried_fn
+
+
+@contextlib.contextmanager
+def phase(name):
+    """
+    RunStats.phase() on the active RunStats, if any.
+    """
+    stats = active()
+    if stats is None:
+        yield
+    else:
+        with stats.phase(name):
+            yield
+
+
+def add(name, n=1):
+    stats = active()
+    if stats is not None:
+        stats.add(name, n)
+
+
+def record(name, seconds, path=None):
+    stats = active()
+    if stats is not None:
+        stats.record(name, seconds, path)
+
+
+def watch_cache(name, cache):
+    stats = active()
+    if stats is not None and cache is not None:
+        stats.watch_cache(name, cache)
+
+
+def timed(name, fn):
+    """
+    'fn' with each call recorded as operation 'name' in the active RunStats
+    (just 'fn' when none is active).
+    """
+    stats = active()
+    if stats is None:
+        return fn
+
+    def timed_fn(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            stats.record(name, time.perf_counter() - start)
+    return timed_fn
+
+
+@contextlib.contextmanager
+def profiling(path):
+    """
+    Profile the 'with' block into 'path': a cProfile dump (read it with
+    python -m pstats, snakeviz, ...), or for a .html path, a pyinstrument
+    report. Both only see the calling thread, not the reader threads.
+    """
+    if path.endswith(".html"):
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            raise ImportError(f"Profiling to '{path}' needs pyinstrument (pip install pyinstrument)")
+        profiler = Profiler()
+        profiler.start()
+        try:
+            yield
+        finally:
+            profiler.stop()
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(profiler.output_html())
+    else:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            profiler.dump_stats(path)
@@ -0,0 +1,272 @@
+"""
+Relevance search over file contents and paths, to pick files for a query
+instead of clicking through a tree.
+
+A SearchIndex is an inverted index (term -> files, with counts) kept in
+SQLite, and ranks files with BM25. Identifiers are split the way code is
+written: "uploadRetryCount" and "upload_retry_count" both give upload,
+retry and count (plus the whole identifier), and a light suffix strip lets
+"uploader" or "retries" match "upload" and "retry". Path components are
+indexed too, with extra weight, since a file's name says a lot about it.
+
+update() is incremental: a file is only re-read when its (size, mtime,
+inode) changed since it was indexed, so keeping the index of a large
+repository current costs about a stat per file.
+"""
+import math
+import os
+import re
+import sqlite3
+from array import array
+from collections import Counter
+from functools import lru_cache
+
+from content_cache import stat_key
+from file_reader import iter_file_contents
+from file_sniffer import load_file, DEFAULT_LARGE_FILE_BYTES
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+# Each path term counts as this many occurrences in the file
+PATH_WEIGHT = 3
+
+_IDENT_RE = re.compile(r"[A-Za-z0-9_]+")
+_PART_RE = re.compile(r"[A-Z]+(?![a-z])|[A-Z]?[a-z]+|[0-9]+")
+_STOP_WORDS = frozenset("a an and are as at be by for from in is it of on or that the this to with".split())
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS terms (
+    id        INTEGER PRIMARY KEY,
+    term      TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS docs (
+    id        INTEGER PRIMARY KEY,
+    path      TEXT NOT NULL UNIQUE,
+    size      INTEGER NOT NULL,
+    mtime_ns  INTEGER NOT NULL,
+    inode     INTEGER NOT NULL,
+    length    INTEGER NOT NULL,
+    terms     BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS postings (
+    term      INTEGER NOT NULL,
+    doc       INTEGER NOT NULL,
+    tf        INTEGER NOT NULL,
+    PRIMARY KEY (term, doc)
+) WITHOUT ROWID;
+"""
+
+
+def _stem(word):
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        word = word[:-1]
+    for suffix in ("ing", "ed", "er"):
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            word = word[:-len(suffix)]
+            break
+    if len(word) > 4 and word.endswith("e"):
+        word = word[:-1]
+    return word
+
+
+@lru_cache(maxsize=200_000)
+def _identifier_terms(ident):
+    terms = []
+    parts = _PART_RE.findall(ident)
+    for part in parts:
+        part = part.lower()
+        if len(part) > 1 and part not in _STOP_WORDS:
+            terms.append(_stem(part))
+    if len(parts) > 1:
+        terms.append(ident.strip("_").lower())
+    return terms
+
+
+def term_counts(text):
+    """
+    Counter of the search terms in 'text': identifiers split at underscores
+    and case changes, lowercased and stemmed, plus each multi-part
+    identifier whole.
+    """
+    counts = Counter()
+    # Code repeats its identifiers a lot, so each distinct one is only split once
+    for ident, n in Counter(_IDENT_RE.findall(text)).items():
+        for term in _identifier_terms(ident):
+            counts[term] += n
+    return counts
+
+
+def tokenize(text):
+    """
+    The search terms of 'text' in order (see term_counts()).
+    """
+    return [term for ident in _IDENT_RE.findall(text) for term in _identifier_terms(ident)]
+
+
+def read_for_index(path):
+    return load_file(path, DEFAULT_LARGE_FILE_BYTES, large_policy="truncate")
+
+
+def pick_top(ranked, k=None, budget=None, cost=None):
+    """
+    The best of 'ranked' ((path, score), best first): at most 'k' of them,
+    and with a 'budget', only as many as fit in it by cost(path), skipping
+    any that no longer fit.
+    """
+    picked = []
+    used = 0
+    for path, _ in ranked:
+        if k is not None and len(picked) >= k:
+            break
+        if budget is not None:
+            size = cost(path)
+            if used + size > budget:
+                continue
+            used += size
+        picked.append(path)
+    return picked
+
+
+class SearchIndex:
+    """
+    The index in a SQLite file (":memory:" for a throwaway one). Use as a
+    context manager, or call close(). Paths are stored absolute, so one
+    index can serve several roots.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._conn = sqlite3.connect(db_path, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA cache_size=-65536")
+        self._conn.executescript(_SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.commit()
+            self._conn.close()
+            self._conn = None
+
+    def _doc_terms(self, path, read):
+        text = read(path)
+        if not isinstance(text, str):
+            text = "".join(text)  # a streamed large file
+        terms = term_counts(text)
+        for term in tokenize(path.replace(os.sep, " ")):
+            terms[term] += PATH_WEIGHT
+        return terms
+
+    def update(self, paths, read=read_for_index, stat=os.stat, prune=()):
+        """
+        Bring the index up to date for 'paths': files that are new or whose
+        stat changed are (re)indexed, concurrently; the rest aren't read.
+        Indexed files under a directory in 'prune' that aren't in 'paths'
+        any more are dropped. Returns the number of files (re)indexed.
+        """
+        known = {}
+        for doc, path, size, mtime_ns, inode in self._conn.execute(
+                "SELECT id, path, size, mtime_ns, inode FROM docs"):
+            known[path] = (doc, (size, mtime_ns, inode))
+
+        # os.path.abspath() asks for the working directory every time; once is enough
+        cwd = os.getcwd()
+        absolute = {path: os.path.normpath(os.path.join(cwd, path)) for path in paths}
+        stats = {}
+        stale = []
+        wanted = set()
+        for path in paths:
+            abs_path = absolute[path]
+            wanted.add(abs_path)
+            try:
+                st = stat(path)
+            except OSError:
+                continue
+            entry = known.get(abs_path)
+            if entry is None or entry[1] != stat_key(st):
+                stats[path] = st
+                stale.append(path)
+
+        gone = []
+        for top in prune:
+            prefix = os.path.join(os.path.normpath(os.path.join(cwd, top)), "")
+            gone += [entry[0] for path, entry in known.items() if path.startswith(prefix) and path not in wanted]
+        self._delete(gone)
+
+        term_ids = {}
+        terms_of = lambda path: self._doc_terms(path, read)
+        size_of = lambda path: min(stats[path].st_size, DEFAULT_LARGE_FILE_BYTES)
+        for path, terms in iter_file_contents(stale, read=terms_of, size_of=size_of):
+            abs_path = absolute[path]
+            if abs_path in known:
+                self._delete([known[abs_path][0]])
+            ids = array("q", (self._term_id(term, term_ids) for term in terms))
+            cursor = self._conn.execute(
+                "INSERT INTO docs (path, size, mtime_ns, inode, length, terms) VALUES (?, ?, ?, ?, ?, ?)",
+                (abs_path, *stat_key(stats[path]), sum(terms.values()), ids.tobytes()))
+            self._conn.executemany("INSERT INTO postings (term, doc, tf) VALUES (?, ?, ?)",
+                                   zip(ids, [cursor.lastrowid] * len(ids), terms.values()))
+        self._conn.commit()
+        return len(stale)
+
+    def _term_id(self, term, cache):
+        term_id = cache.get(term)
+        if term_id is None:
+            row = self._conn.execute("SELECT id FROM terms WHERE term = ?", (term,)).fetchone()
+            if row is None:
+                term_id = self._conn.execute("INSERT INTO terms (term) VALUES (?)", (term,)).lastrowid
+            else:
+                term_id = row[0]
+            cache[term] = term_id
+        return term_id
+
+    def _delete(self, docs):
+        # Each doc keeps its term ids, so its postings go by primary key
+        # rather than through a second index on doc that every insert would pay for
+        for doc in docs:
+            row = self._conn.execute("SELECT terms FROM docs WHERE id = ?", (doc,)).fetchone()
+            if row is None:
+                continue
+            ids = array("q")
+            ids.frombytes(row[0])
+            self._conn.executemany("DELETE FROM postings WHERE term = ? AND doc = ?", [(term, doc) for term in ids])
+            self._conn.execute("DELETE FROM docs WHERE id = ?", (doc,))
+
+    def search(self, query, paths):
+        """
+        Rank 'paths' (indexed by update()) for 'query': [(path, score)] for
+        the files matching at least one query term, best first. Term
+        statistics are taken over 'paths' only.
+        """
+        cwd = os.getcwd()
+        by_abs = {os.path.normpath(os.path.join(cwd, path)): path for path in paths}
+        docs = {}
+        for doc, path, length in self._conn.execute("SELECT id, path, length FROM docs"):
+            if path in by_abs:
+                docs[doc] = (by_abs[path], length)
+        if not docs:
+            return []
+        avg_length = sum(length for _, length in docs.values()) / len(docs) or 1
+
+        scores = Counter()
+        for term in dict.fromkeys(tokenize(query)):
+            postings = [(doc, tf) for doc, tf in self._conn.execute(
+                "SELECT doc, tf FROM postings JOIN terms ON terms.id = postings.term WHERE terms.term = ?", (term,))
+                if doc in docs]
+            if not postings:
+                continue
+            idf = math.log(1 + (len(docs) - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc, tf in postings:
+                length = docs[doc][1]
+                scores[doc] += idf * tf * (K1 + 1) / (tf + K1 * (1 - B + B * length / avg_length))
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], docs[item[0]][0]))
+        return [(docs[doc][0], score) for doc, score in ranked]
@@ -0,0 +1,129 @@
+"""
+Splitting the context into parts under a size cap, for when one file is
+too big to paste or upload.
+
+plan_shards() packs the files, in output order, into parts whose estimated
+cost (bytes or tokens, whatever the caller measures) stays under the cap.
+Files are never split: a file over the cap gets a part of its own. Files of
+one directory are kept together where they fit, so a directory that would
+straddle a boundary moves to the next part whole.
+
+write_shard() writes one part and records where each file's block landed
+(byte offset, length, SHA-1 of the block), so write_manifest() can describe
+every part and a tool can fetch a single file's block by seeking straight
+to it. Parts are independent, so callers can write them concurrently.
+"""
+import hashlib
+import json
+import os
+
+from document_writer import FileSink, write_document
+from file_sniffer import RawFile
+
+
+def plan_shards(files, cost, cap, group_of=os.path.dirname):
+    """
+    Split 'files' into consecutive lists whose total cost(file) is at most
+    'cap' wherever possible. Runs of files with the same group_of(file)
+    (by default the directory) are only broken up when the whole run
+    doesn't fit in an empty part either.
+    """
+    groups = []
+    for fpath in files:
+        key = group_of(fpath)
+        if groups and groups[-1][0] == key:
+            groups[-1][1].append(fpath)
+        else:
+            groups.append((key, [fpath]))
+
+    shards = []
+    current = []
+    used = 0
+    for _, group in groups:
+        group_cost = sum(cost(fpath) for fpath in group)
+        if current and used + group_cost > cap and group_cost <= cap:
+            shards.append(current)
+            current, used = [], 0
+        for fpath in group:
+            fcost = cost(fpath)
+            if current and used + fcost > cap:
+                shards.append(current)
+                current, used = [], 0
+            current.append(fpath)
+            used += fcost
+    if current:
+        shards.append(current)
+    return shards
+
+
+def shard_paths(output, count):
+    """
+    Paths for 'count' parts next to 'output': out.txt -> out.part001.txt, ...
+    """
+    base, ext = os.path.splitext(output)
+    width = max(3, len(str(count)))
+    return [f"{base}.part{i:0{width}d}{ext}" for i in range(1, count + 1)]
+
+
+def manifest_path(output):
+    return os.path.splitext(output)[0] + ".manifest.json"
+
+
+def write_shard(path, header, blocks):
+    """
+    Write one part: the 'header' chunks, then 'blocks' as (file path, chunk)
+    pairs (several chunks for the same file make up its block). Returns
+    {"path", "bytes", "files": [{"file", "offset", "length", "sha1"}]},
+    offsets and lengths being in bytes from the start of the part.
+    """
+    files = []
+    state = {"pos": 0, "entry": None, "hash": None}
+
+    def finish_entry():
+        entry = state["entry"]
+        if entry is not None:
+            entry["length"] = state["pos"] - entry["offset"]
+            entry["sha1"] = state["hash"].hexdigest()
+            files.append(entry)
+            state["entry"] = None
+
+    def measured():
+        for chunk in header:
+            state["pos"] += len(chunk.encode("utf-8"))
+            yield chunk
+        for fpath, chunk in blocks:
+            entry = state["entry"]
+            if entry is None or entry["file"] != fpath:
+                finish_entry()
+                state["entry"] = {"file": fpath, "offset": state["pos"]}
+                state["hash"] = hashlib.sha1()
+            if isinstance(chunk, RawFile):
+                for data in chunk.iter_bytes():
+                    state["hash"].update(data)
+                    state["pos"] += len(data)
+            else:
+                data = chunk.encode("utf-8")
+                state["hash"].update(data)
+                state["pos"] += len(data)
+            yield chunk
+        finish_entry()
+
+    write_document(measured(), FileSink(path))
+    return {"path": path, "bytes": state["pos"], "files": files}
+
+
+def write_manifest(path, shards, cap, unit):
+    """
+    The JSON manifest for parts written by write_shard(): the cap, and for
+    each part its path, size and the files in it (offset, length, sha1).
+    """
+    manifest = {
+        "cap": cap,
+        "unit": unit,
+        "shards": [dict(shard, index=i) for i, shard in enumerate(shards, 1)],
+    }
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(tmp, path)
+    return manifest
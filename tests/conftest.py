@@ -0,0 +1,61 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import print_files
+
+
+def git(repo, *args):
+    subprocess.run(["git", "-c", "user.name=test", "-c", "user.email=test@example.com", *args], cwd=repo,
+                   check=True, capture_output=True)
+
+
+def touch_dir(path, seconds):
+    # Move a directory's mtime on, so a change shows even within one clock tick
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + seconds * 1_000_000_000))
+
+
+@pytest.fixture
+def repo(tmp_path):
+    """
+    A small git repository: scripts/a.py and scripts/b.py committed, README.md untracked.
+    """
+    root = tmp_path / "repo"
+    (root / "scripts").mkdir(parents=True)
+    (root / "scripts" / "a.py").write_text("def a():\n    return 1\n")
+    (root / "scripts" / "b.py").write_text("def b():\n    return 2\n")
+    git(root, "init", "-q")
+    git(root, "add", ".")
+    git(root, "commit", "-q", "-m", "initial")
+    (root / "README.md").write_text("# Notes\n")
+    return root
+
+
+@pytest.fixture
+def run_print_files(tmp_path, monkeypatch):
+    """
+    run_print_files(repo, *argv, paths=None) runs print_files.py in 'repo'
+    (over 'paths', by default its configured ones, i.e. scripts/) and returns
+    what it wrote, or None if nothing was written there (e.g. with --output -).
+    The output goes outside the repo, to tmp_path/files_explanation.txt.
+    """
+    def run(root, *argv, paths=None):
+        output = str(tmp_path / "files_explanation.txt")
+        if os.path.exists(output):
+            os.remove(output)
+        monkeypatch.chdir(root)
+        if paths is not None:
+            monkeypatch.setattr(print_files, "paths", list(paths))
+        monkeypatch.setattr(print_files, "file_explanation_output_file", output)
+        monkeypatch.setattr(sys, "argv", ["print_files.py", *argv])
+        print_files.all_files.clear()
+        print_files.main()
+        if not os.path.exists(output):
+            return None
+        with open(output, encoding="utf-8") as f:
+            return f.read()
+    return run
@@ -0,0 +1,98 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from async_scan import ScanHub, iterate_in_executor, scan_tree_async
+from tree_walker import scan_tree
+
+
+def make_tree(root):
+    for d in ("src/pkg", "docs", "node_modules/dep"):
+        (root / d).mkdir(parents=True)
+    for f in ("src/a.py", "src/pkg/b.py", "docs/index.md", "node_modules/dep/c.py", "top.py"):
+        (root / f).write_text("")
+
+
+def test_async_scan_matches_scan_tree(tmp_path):
+    make_tree(tmp_path)
+    progress = []
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        listings = asyncio.run(scan_tree_async(str(tmp_path), {".py"}, ("node_modules",), executor=pool,
+                                               max_in_flight=1, progress=lambda *p: progress.append(p)))
+
+    assert listings == scan_tree(str(tmp_path), {".py"}, ("node_modules",))
+    assert progress[-1] == (len(listings), 3, 0)
+
+
+def test_scans_of_one_root_are_shared_and_cancelled_when_unwatched(tmp_path):
+    make_tree(tmp_path)
+
+    async def run(hub):
+        async with hub.joined(str(tmp_path)) as first, hub.joined(str(tmp_path / "src" / "..")) as second:
+            assert first is second and len(hub.running()) == 1
+        # Nobody waits on it any more
+        assert first.cancelled
+        await asyncio.gather(first.task, return_exceptions=True)
+        assert first.task.cancelled() and hub.running() == []
+        listings, again = await asyncio.gather(hub.scan(str(tmp_path)), hub.scan(str(tmp_path)))
+        return listings, again
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        listings, again = asyncio.run(run(ScanHub(pool)))
+
+    assert listings is again
+    assert listings == scan_tree(str(tmp_path))
+
+
+def test_watch_reports_progress_until_done(tmp_path):
+    make_tree(tmp_path)
+
+    async def watch(hub):
+        return [snapshot async for snapshot in hub.watch(str(tmp_path), interval=0.01)]
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        snapshots = asyncio.run(watch(ScanHub(pool)))
+
+    assert snapshots[-1]["done"] and snapshots[-1]["pending"] == 0
+    assert snapshots[-1]["files"] == 5
+
+
+def test_folder_scans_follow_the_ignore_files_of_their_base(tmp_path):
+    root = tmp_path / "project"
+    (root / "src").mkdir(parents=True)
+    (root / ".gitignore").write_text("generated_*.py\n")
+    (root / "src" / "main.py").write_text("print('hi')\n")
+    (root / "src" / "generated_api.py").write_text("API = {}\n")
+    src = str(root / "src")
+
+    async def scan_both(hub):
+        return await asyncio.gather(hub.scan(src, base=str(root)), hub.scan(src))
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        under_root, alone = asyncio.run(scan_both(ScanHub(pool, {".py"})))
+
+    assert under_root[src] == [("main.py", False)]
+    assert alone[src] == [("generated_api.py", False), ("main.py", False)]
+
+
+def test_iterating_in_executor_closes_an_iterator_left_early():
+    closed = []
+
+    def chunks():
+        try:
+            yield from ("a", "b", "c")
+        finally:
+            closed.append(True)
+
+    async def first_two(pool):
+        taken = []
+        async for chunk in iterate_in_executor(chunks(), pool):
+            taken.append(chunk)
+            if len(taken) == 2:
+                break
+        return taken
+
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        assert asyncio.run(first_two(pool)) == ["a", "b"]
+        # The close is queued on the pool, which is drained on shutdown
+    assert closed == [True]
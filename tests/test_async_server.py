@@ -0,0 +1,73 @@
+import asyncio
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+pytest.importorskip("flask")
+pytest.importorskip("starlette")
+pytest.importorskip("httpx")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "flask app in progress"))
+import async_server
+import run_stats
+from starlette.testclient import TestClient
+
+
+@pytest.fixture
+def client():
+    # Not entered, so the lifespan (which shuts FS_POOL down) doesn't run
+    return TestClient(async_server.app)
+
+
+def make_project(root):
+    (root / "src").mkdir()
+    (root / "src" / "a.py").write_text("A = 1\n")
+    (root / "notes.md").write_text("# Notes\n")
+    (root / "skipped.py").write_text("")
+
+
+def test_tree_comes_from_a_scan(tmp_path, client):
+    make_project(tmp_path)
+
+    tree = client.get("/api/tree", params={"root": str(tmp_path)}).json()
+
+    assert {node["name"] for node in tree} == {"src/", "notes.md", "skipped.py"}
+    assert client.get("/api/tree", params={"root": str(tmp_path / "missing")}).status_code == 400
+    assert client.get("/api/stats").json()["scans"] == []
+
+
+def test_scan_events_end_with_done(tmp_path, client):
+    make_project(tmp_path)
+
+    body = client.get("/api/scan/events", params={"root": str(tmp_path)}).text
+
+    events = [line for line in body.splitlines() if line.startswith("event: ")]
+    assert events[-1] == "event: done"
+    assert set(events[:-1]) <= {"event: progress"}
+
+
+def test_submit_streams_the_selection(tmp_path, client):
+    make_project(tmp_path)
+
+    response = client.post("/api/submit", json={"root": str(tmp_path),
+                                                "selected": [str(tmp_path / "src"), str(tmp_path / "notes.md")]})
+
+    assert response.headers["X-Context-Files"] == "2"
+    assert f"FILE: {os.path.join(str(tmp_path), 'src', 'a.py')}\n```python\nA = 1\n" in response.text
+    assert "# Notes" in response.text and "skipped.py" not in response.text
+
+
+def test_lifespan_makes_run_stats_process_wide(monkeypatch):
+    monkeypatch.setattr(async_server, "FS_POOL", ThreadPoolExecutor(max_workers=1))
+    previous = run_stats.activate(None)
+
+    async def serve():
+        async with async_server.lifespan(async_server.app):
+            assert run_stats.active() is async_server.RUN_STATS
+        assert run_stats.active() is None
+
+    try:
+        asyncio.run(serve())
+    finally:
+        run_stats.activate(previous)
@@ -0,0 +1,33 @@
+import os
+
+from content_cache import ContentCache
+
+
+def test_entry_is_valid_until_the_file_changes(tmp_path):
+    path = tmp_path / "a.py"
+    path.write_text("x = 1\n")
+    with ContentCache(str(tmp_path / "cache.sqlite")) as cache:
+        cache.put(str(path), os.stat(path), "block", variant="a.py")
+
+    path.write_text("x = 22\n")
+    with ContentCache(str(tmp_path / "cache.sqlite")) as cache:
+        assert cache.get(str(path), os.stat(path), variant="other") is None
+        assert cache.get(str(path), os.stat(path), variant="a.py") is None
+        assert (cache.hits, cache.misses) == (0, 2)
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    paths = []
+    for name in ("a", "b", "c"):
+        path = tmp_path / name
+        path.write_text(name)
+        paths.append(str(path))
+    with ContentCache(str(tmp_path / "cache.sqlite"), max_bytes=250) as cache:
+        cache.put(paths[0], os.stat(paths[0]), "a" * 100)
+        cache.put(paths[1], os.stat(paths[1]), "b" * 100)
+        assert cache.get(paths[0], os.stat(paths[0])) == "a" * 100
+        cache.put(paths[2], os.stat(paths[2]), "c" * 100)
+
+        assert cache.contains(paths[0], os.stat(paths[0]))
+        assert not cache.contains(paths[1], os.stat(paths[1]))
+        assert cache.contains(paths[2], os.stat(paths[2]))
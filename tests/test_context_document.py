@@ -0,0 +1,51 @@
+from context_document import FILE_CONTENTS_HEADER, iter_document, selection_listings
+from file_sniffer import load_file
+from tree_walker import iter_tree
+
+
+def test_selection_covers_selected_files_and_folders(tmp_path):
+    root = tmp_path / "project"
+    for d in ("src/pkg", "docs", "other"):
+        (root / d).mkdir(parents=True)
+    for f in ("src/pkg/a.py", "src/b.py", "docs/index.md", "docs/extra.md", "other/c.py"):
+        (root / f).write_text("")
+
+    listings = selection_listings(str(root), [str(root / "src"), str(root / "docs" / "index.md"),
+                                              str(tmp_path / "outside.py")])
+
+    lines = [prefix + name for prefix, name, path, is_dir in iter_tree(listings, str(root))]
+    assert lines == ["├── docs", "│   └── index.md", "└── src", "    ├── b.py", "    └── pkg", "        └── a.py"]
+
+
+def test_document_streams_tree_then_blocks(tmp_path):
+    path = tmp_path / "big.txt"
+    path.write_text("x" * 5000)
+    load = lambda fpath: load_file(fpath, 1000, "stream")
+
+    chunks = list(iter_document([iter(["./", "└── big.txt"])], [str(path)], load=load))
+
+    assert "".join(chunks) == ("./\n└── big.txt\n\n" + FILE_CONTENTS_HEADER + "\n"
+                               + f"FILE: {path}\n```\n" + "x" * 5000 + "\n```\n\n")
+
+
+def test_selected_folder_follows_ignore_files_above_it_outside_git(tmp_path):
+    root = tmp_path / "project"
+    (root / "src").mkdir(parents=True)
+    (root / ".gitignore").write_text("generated_*.py\n")
+    (root / "src" / "main.py").write_text("print('hi')\n")
+    (root / "src" / "generated_api.py").write_text("API = {}\n")
+
+    listings = selection_listings(str(root), [str(root / "src")], {".py"})
+
+    assert listings[str(root / "src")] == [("main.py", False)]
+
+
+def test_selected_folders_already_scanned_are_not_walked_again(tmp_path):
+    root = tmp_path / "project"
+    (root / "src").mkdir(parents=True)
+    (root / "src" / "main.py").write_text("")
+    src = str(root / "src")
+
+    listings = selection_listings(str(root), [src], scanned={src: {src: [("from_the_scan.py", False)]}})
+
+    assert listings[src] == [("from_the_scan.py", False)]
@@ -0,0 +1,38 @@
+from dedup import DigestCache, file_digest, find_duplicates
+
+BODY = "def shared():\n    return 'the same body in more than one place'\n"
+
+
+def test_later_copies_refer_to_the_first(tmp_path):
+    for name in ("a.py", "b.py", "c.py"):
+        (tmp_path / name).write_text(BODY)
+    (tmp_path / "other.py").write_text(BODY.replace("same", "SAME"))
+    paths = [str(tmp_path / name) for name in ("a.py", "other.py", "b.py", "c.py")]
+
+    assert find_duplicates(paths) == {paths[2]: paths[0], paths[3]: paths[0]}
+
+
+def test_small_and_unique_sizes_are_not_hashed(tmp_path):
+    (tmp_path / "a.py").write_text("")
+    (tmp_path / "b.py").write_text("")
+    (tmp_path / "c.py").write_text(BODY)
+    (tmp_path / "d.py").write_text(BODY + "# longer\n")
+    hashed = []
+    digest = lambda path: hashed.append(path) or file_digest(path)
+
+    assert find_duplicates([str(p) for p in sorted(tmp_path.iterdir())], digest) == {}
+    assert hashed == []
+
+
+def test_digests_are_cached_by_stat(tmp_path):
+    paths = []
+    for name in ("a.py", "b.py"):
+        (tmp_path / name).write_text(BODY)
+        paths.append(str(tmp_path / name))
+    cache = DigestCache()
+    hashed = []
+    digest = lambda path: hashed.append(path) or file_digest(path)
+
+    assert find_duplicates(paths, digest, cache=cache) == {paths[1]: paths[0]}
+    assert find_duplicates(paths, digest, cache=cache) == {paths[1]: paths[0]}
+    assert len(hashed) == 2
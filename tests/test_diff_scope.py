@@ -0,0 +1,37 @@
+import os
+
+from conftest import git
+from diff_scope import DiffScope
+from git_source import GitRepo
+
+
+def test_changes_against_the_working_tree(repo, monkeypatch):
+    monkeypatch.chdir(repo)
+    (repo / "scripts" / "a.py").write_text("def a():\n    return 3\n")
+    os.remove(repo / "scripts" / "b.py")
+    with GitRepo() as git_repo:
+        scope = DiffScope(git_repo, "HEAD")
+        # b.py was deleted, so there's nothing of it to show; README.md is untracked
+        assert len(scope) == 2
+        assert scope.files_under("scripts") == [os.path.join("scripts", "a.py")]
+        assert scope.files_under(".") == [os.path.join(".", "scripts", "a.py"), os.path.join(".", "README.md")]
+        assert scope.is_changed("README.md") and not scope.is_changed("scripts/b.py")
+
+
+def test_hunks(repo, monkeypatch):
+    monkeypatch.chdir(repo)
+    (repo / "scripts" / "a.py").write_text("def a():\n    return 3\n")
+    with GitRepo() as git_repo:
+        scope = DiffScope(git_repo, "HEAD", context_lines=0)
+        assert scope.hunks("scripts/a.py") == "@@ -2 +2 @@ def a():\n-    return 1\n+    return 3"
+        assert scope.hunks("README.md") == "@@ -0,0 +1,1 @@\n+# Notes"
+
+
+def test_between_commits(repo, monkeypatch):
+    monkeypatch.chdir(repo)
+    git(repo, "mv", "scripts/b.py", "scripts/c.py")
+    git(repo, "commit", "-q", "-m", "rename")
+    with GitRepo() as git_repo:
+        scope = DiffScope(git_repo, "HEAD~1", "HEAD", context_lines=3)
+        assert scope.files_under("scripts") == [os.path.join("scripts", "c.py")]
+        assert scope.hunks("scripts/c.py") == "(renamed from scripts/b.py, no content changes)"
@@ -0,0 +1,64 @@
+import socket
+
+import pytest
+
+from document_writer import BufferSink, FileSink, PreviewSink, SocketSink, TeeSink, encode_chunks, write_document
+from file_sniffer import RawFile
+
+
+def test_tee_to_a_file_a_buffer_and_a_preview(tmp_path):
+    chunks = ["tree\n", "\n", "FILE: é.py\n", "x" * 100]
+    buffer, preview = BufferSink(), PreviewSink(13)
+
+    written = write_document(iter(chunks), TeeSink(FileSink(tmp_path / "out.txt"), buffer, preview))
+
+    assert written == len("".join(chunks))
+    assert (tmp_path / "out.txt").read_text(encoding="utf-8") == buffer.getvalue() == "".join(chunks)
+    assert preview.getvalue() == "tree\n\nFILE: é" and preview.truncated
+
+
+def test_socket_sink_sends_everything_in_few_writes():
+    left, right = socket.socketpair()
+    with left, right:
+        sink = SocketSink(left, chunk_bytes=1000)
+        write_document((f"line {i}\n" for i in range(300)), sink)
+        left.shutdown(socket.SHUT_WR)
+        received = b"".join(iter(lambda: right.recv(65536), b""))
+
+    assert received.decode("utf-8") == "".join(f"line {i}\n" for i in range(300))
+
+
+def test_encode_chunks_regroups_into_pieces():
+    pieces = list(encode_chunks(["ab"] * 10, chunk_bytes=6))
+
+    assert pieces == [b"ababab", b"ababab", b"ababab", b"ab"]
+
+
+def test_every_sink_is_closed_when_one_fails():
+    class Failing(BufferSink):
+        def close(self):
+            raise RuntimeError("clipboard command failed")
+
+    closed = []
+
+    class Recording(BufferSink):
+        def close(self):
+            closed.append(True)
+
+    with pytest.raises(RuntimeError):
+        write_document(["text"], TeeSink(Failing(), Recording()))
+    assert closed == [True]
+
+
+@pytest.mark.parametrize("data", [b"small\n", "large é\n".encode("utf-8") * 20000])
+def test_raw_files_are_copied_as_bytes(tmp_path, data):
+    path = tmp_path / "src.txt"
+    path.write_bytes(data)
+    raw = RawFile(str(path), len(data), data if len(data) < 100 else None)
+    buffer = BufferSink()
+
+    write_document(["head\n", raw, "tail\n"], TeeSink(FileSink(tmp_path / "out.txt"), buffer))
+
+    assert (tmp_path / "out.txt").read_bytes() == b"head\n" + data + b"tail\n"
+    assert buffer.getvalue() == "head\n" + data.decode("utf-8") + "tail\n"
+    assert b"".join(encode_chunks(["head\n", raw])) == b"head\n" + data
@@ -0,0 +1,37 @@
+import threading
+
+from file_reader import iter_file_contents, read_text
+
+
+def test_results_come_back_in_the_order_asked(tmp_path):
+    paths = []
+    for i in range(20):
+        path = tmp_path / f"{i}.txt"
+        path.write_text(f"file {i}\n")
+        paths.append(str(path))
+
+    assert list(iter_file_contents(paths, workers=4)) == [(path, read_text(path)) for path in paths]
+
+
+def test_reads_ahead_stay_within_the_byte_budget():
+    sizes = {f"f{i}": 40 for i in range(10)}
+    lock = threading.Lock()
+    started, finished, most_inflight = [], [], [0]
+
+    def read(path):
+        with lock:
+            started.append(path)
+            most_inflight[0] = max(most_inflight[0], sum(sizes[p] for p in started if p not in finished))
+        return path
+
+    for path, content in iter_file_contents(list(sizes), read=read, workers=8, max_inflight_bytes=100,
+                                            size_of=sizes.get):
+        with lock:
+            finished.append(path)
+
+    assert finished == list(sizes)
+    assert most_inflight[0] <= 100
+
+
+def test_unreadable_file_gives_a_message(tmp_path):
+    assert read_text(str(tmp_path / "missing.py")).startswith("Error reading file:")
@@ -0,0 +1,59 @@
+from file_sniffer import SNIFF_BYTES, RawFile, StreamedFile, is_clean_text, load_file, looks_binary
+
+
+def test_binary_files_are_skipped(tmp_path):
+    path = tmp_path / "blob.py"
+    path.write_bytes(b"\0\1\2" * 10)
+
+    assert load_file(str(path)) == "(binary file, 30 bytes, skipped)"
+
+
+def test_character_cut_off_by_the_sniff_is_not_binary():
+    head = ("x" * (SNIFF_BYTES - 1) + "é").encode("utf-8")[:SNIFF_BYTES]
+
+    assert not looks_binary(head)
+    assert looks_binary(head, truncated=False)
+
+
+def test_large_file_policies(tmp_path):
+    path = tmp_path / "big.txt"
+    lines = [f"line {i}\n" for i in range(1000)]
+    path.write_text("".join(lines))
+    size = path.stat().st_size
+
+    assert load_file(str(path), 1000, "skip") == f"(large file, {size} bytes, skipped)"
+    truncated = load_file(str(path), 1000, "truncate")
+    assert truncated.startswith("line 0\n") and truncated.endswith("line 999\n")
+    assert "bytes elided] ...\n" in truncated and len(truncated) < 1100
+    streamed = load_file(str(path), 1000, "stream")
+    assert isinstance(streamed, StreamedFile)
+    assert "".join(streamed) == "".join(lines)
+
+
+def test_carriage_returns_are_translated(tmp_path):
+    path = tmp_path / "dos.txt"
+    path.write_bytes(b"one\r\ntwo\rthree\n")
+
+    assert load_file(str(path)) == "one\ntwo\nthree\n"
+
+
+def test_clean_utf8_comes_back_raw(tmp_path):
+    clean, dos = tmp_path / "clean.py", tmp_path / "dos.py"
+    clean.write_bytes("naïve = 1\n".encode("utf-8"))
+    dos.write_bytes(b"x = 1\r\n")
+
+    raw = load_file(str(clean), raw=True)
+    assert isinstance(raw, RawFile) and raw.data == "naïve = 1\n".encode("utf-8")
+    assert "".join(raw) == "naïve = 1\n"
+    assert load_file(str(dos), raw=True) == "x = 1\n"
+    assert not is_clean_text(b"\xff") and is_clean_text("é".encode("utf-8"))
+
+
+def test_large_clean_file_is_streamed_raw(tmp_path):
+    path = tmp_path / "big.txt"
+    path.write_text("é\n" * 1000)
+
+    raw = load_file(str(path), 100, "stream", raw=True)
+
+    assert isinstance(raw, RawFile) and raw.data is None
+    assert b"".join(raw.iter_bytes()) == ("é\n" * 1000).encode("utf-8")
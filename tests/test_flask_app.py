@@ -0,0 +1,106 @@
+import gzip
+import os
+import sys
+
+import pytest
+
+pytest.importorskip("flask")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "flask app in progress"))
+import context_manager
+from conftest import touch_dir
+import run_stats
+
+
+@pytest.fixture
+def client():
+    return context_manager.app.test_client()
+
+
+def test_children_come_one_page_at_a_time(tmp_path, client):
+    for name in ("a", "b", "c"):
+        (tmp_path / name).mkdir()
+    (tmp_path / "b" / "one.py").write_text("")
+    (tmp_path / "b" / "two.bin").write_text("")
+    (tmp_path / "z.py").write_text("")
+
+    first = client.get("/api/children", query_string={"path": str(tmp_path), "limit": 2}).get_json()
+    second = client.get("/api/children", query_string={"path": str(tmp_path), "limit": 2,
+                                                       "cursor": first["next_cursor"]}).get_json()
+
+    assert first["total"] == 4
+    assert [(e["name"], e["child_count"]) for e in first["entries"]] == [("a", 0), ("b", 1)]
+    assert [e["name"] for e in second["entries"]] == ["c", "z.py"]
+    assert second["next_cursor"] is None
+    assert client.get("/api/children", query_string={"path": str(tmp_path / "z.py")}).status_code == 400
+
+
+def test_submit_streams_the_selection(tmp_path, client):
+    (tmp_path / "src").mkdir()
+    (tmp_path / "src" / "a.py").write_text("A = 1\n")
+    (tmp_path / "notes.md").write_text("# Notes\n")
+    (tmp_path / "skipped.py").write_text("")
+
+    response = client.post("/api/submit", json={"root": str(tmp_path), "gzip": True,
+                                                "selected": [str(tmp_path / "src"), str(tmp_path / "notes.md")]})
+
+    assert response.headers["X-Context-Files"] == "2"
+    assert response.headers["Content-Encoding"] == "gzip"
+    text = gzip.decompress(response.get_data()).decode("utf-8")
+    assert f"FILE: {os.path.join(str(tmp_path), 'src', 'a.py')}\n```python\nA = 1\n" in text
+    assert "# Notes" in text and "skipped.py" not in text
+
+
+def test_changes_report_listed_folders(tmp_path, client):
+    (tmp_path / "sub").mkdir()
+    client.get("/api/children", query_string={"path": str(tmp_path)})
+    seq = client.get("/api/changes").get_json()["seq"]
+
+    (tmp_path / "sub" / "new.py").write_text("")
+    (tmp_path / "new.py").write_text("")
+    touch_dir(tmp_path, 1)
+
+    changes = client.get("/api/changes", query_string={"since": seq}).get_json()
+    assert changes["dirs"] == [str(tmp_path)] and not changes["reset"]
+
+
+def test_least_recently_listed_folders_are_unwatched(tmp_path, monkeypatch):
+    monkeypatch.setattr(context_manager, "MAX_WATCHED_DIRS", 2)
+    monkeypatch.setattr(context_manager, "WATCHED_DIRS", {})
+    folders = [str(tmp_path / name) for name in ("a", "b", "c")]
+    for folder in folders:
+        os.mkdir(folder)
+
+    context_manager.list_children(folders[0])
+    context_manager.list_children(folders[1])
+    context_manager.list_children(folders[0])
+    context_manager.list_children(folders[2])
+
+    watched = context_manager.WATCHER.watched()
+    assert folders[0] in watched and folders[2] in watched
+    assert folders[1] not in watched
+    assert list(context_manager.WATCHED_DIRS) == [folders[0], folders[2]]
+
+
+def test_diff_document_closes_its_repository(repo, monkeypatch):
+    closed = []
+    close = context_manager.GitRepo.close
+    monkeypatch.setattr(context_manager.GitRepo, "close", lambda self: closed.append(self) or close(self))
+    (repo / "scripts" / "a.py").write_text("def a():\n    return 3\n")
+
+    count, chunks = context_manager.selection_document(str(repo), [], diff_base="HEAD", hunk_lines=0)
+    assert count == 2 and not closed
+    assert "+    return 3" in "".join(chunks)
+    assert len(closed) == 1
+
+    count, chunks = context_manager.selection_document(str(repo), [], diff_base="HEAD")
+    assert count == 2 and len(closed) == 2
+    assert b"return 3" in b"".join(context_manager.encode_chunks(chunks))
+
+
+def test_importing_the_app_leaves_run_stats_alone():
+    assert run_stats.active() is None
+
+
+def test_metrics(client):
+    data = client.get("/api/metrics").get_json()
+    assert {"phases", "counters", "operations", "caches"} <= set(data)
@@ -0,0 +1,47 @@
+import pytest
+
+from conftest import touch_dir
+from fs_watcher import InotifyWatcher, PollingWatcher
+
+
+def inotify_watcher():
+    try:
+        return InotifyWatcher()
+    except OSError:
+        pytest.skip("inotify is not available")
+
+
+def test_polling_reports_changed_directories(tmp_path):
+    (tmp_path / "sub").mkdir()
+    watcher = PollingWatcher()
+    watcher.watch(str(tmp_path))
+    watcher.watch(str(tmp_path / "sub"))
+    assert watcher.poll() == {}
+
+    (tmp_path / "a.py").write_text("")
+    touch_dir(tmp_path, 1)
+    (tmp_path / "sub" / ".gitignore").write_text("*.log\n")
+    assert watcher.poll() == {str(tmp_path): False, str(tmp_path / "sub"): True}
+
+    (tmp_path / "sub" / ".gitignore").unlink()
+    (tmp_path / "sub").rmdir()
+    touch_dir(tmp_path, 2)
+    assert watcher.poll() == {str(tmp_path): False}
+    assert watcher.watched() == {str(tmp_path)}
+
+
+def test_inotify_reports_entries_and_ignore_file_writes(tmp_path):
+    watcher = inotify_watcher()
+    watcher.watch(str(tmp_path))
+    (tmp_path / "a.py").write_text("x = 1\n")
+    assert watcher.poll() == {str(tmp_path): False}
+
+    (tmp_path / "a.py").write_text("x = 2\n")
+    assert watcher.poll() == {}
+    (tmp_path / ".contextignore").write_text("*.log\n")
+    assert watcher.poll() == {str(tmp_path): True}
+
+    watcher.unwatch(str(tmp_path))
+    (tmp_path / "b.py").write_text("")
+    assert watcher.poll() == {}
+    watcher.close()
@@ -0,0 +1,62 @@
+import os
+
+import pytest
+
+from conftest import git
+from file_sniffer import RawFile, StreamedFile
+from git_source import GitError, GitRepo
+
+
+def test_tree_lists_committed_files_only(repo, monkeypatch):
+    monkeypatch.chdir(repo)
+    with GitRepo() as git_repo:
+        tree = git_repo.tree("HEAD")
+        assert tree.isdir("scripts")
+        assert tree.isfile("scripts/a.py")
+        assert not tree.isfile("README.md")
+        assert sorted(tree.scan("scripts", {".py"})["scripts"]) == [("a.py", False), ("b.py", False)]
+
+
+def test_load_reads_the_committed_blob(repo, monkeypatch):
+    monkeypatch.chdir(repo)
+    (repo / "scripts" / "a.py").write_text("changed\n")
+    with GitRepo() as git_repo:
+        tree = git_repo.tree()
+        assert tree.load("scripts/a.py") == "def a():\n    return 1\n"
+        raw = tree.load("scripts/a.py", raw=True)
+        assert isinstance(raw, RawFile) and raw.data == b"def a():\n    return 1\n"
+        assert tree.stat("scripts/a.py").st_size == len("def a():\n    return 1\n")
+        assert tree.load("missing.py").startswith("Error reading file:")
+
+
+def test_large_blobs_follow_the_policy(repo, monkeypatch):
+    monkeypatch.chdir(repo)
+    (repo / "big.txt").write_text("line\n" * 1000)
+    git(repo, "add", "big.txt")
+    git(repo, "commit", "-q", "-m", "big")
+    with GitRepo() as git_repo:
+        tree = git_repo.tree()
+        assert tree.load("big.txt", 100, "skip") == "(large file, 5000 bytes, skipped)"
+        assert "bytes elided" in tree.load("big.txt", 100, "truncate")
+        streamed = tree.load("big.txt", 100, "stream")
+        assert isinstance(streamed, StreamedFile) and "".join(streamed) == "line\n" * 1000
+
+
+def test_ignore_files_come_from_the_commit(repo, monkeypatch):
+    monkeypatch.chdir(repo)
+    (repo / "scripts" / ".gitignore").write_text("b.py\n")
+    git(repo, "add", "scripts/.gitignore")
+    git(repo, "commit", "-q", "-m", "ignore b")
+    os.remove(repo / "scripts" / ".gitignore")
+    with GitRepo() as git_repo:
+        names = [name for name, _ in git_repo.tree().scan("scripts", {".py"})["scripts"]]
+    assert names == ["a.py"]
+
+
+def test_unknown_revision(repo, monkeypatch):
+    monkeypatch.chdir(repo)
+    with GitRepo() as git_repo:
+        with pytest.raises(GitError):
+            git_repo.tree("no-such-branch")
+        with pytest.raises(GitError):
+            git_repo.tree("--all")
@@ -0,0 +1,54 @@
+import os
+
+from ignore_rules import IgnoreRules, compile_patterns, load_ignore_rules
+from tree_walker import scan_tree
+
+
+def rules(*lines):
+    return IgnoreRules((("", compile_patterns(lines)),))
+
+
+def test_last_matching_pattern_wins():
+    ignore = rules("*.log", "!keep.log", "build/", "/top.txt", "docs/**/*.tmp")
+
+    assert ignore.is_ignored("debug.log", False)
+    assert not ignore.is_ignored("keep.log", False)
+    assert ignore.is_ignored("build", True) and not ignore.is_ignored("build", False)
+    assert ignore.is_ignored("top.txt", False)
+    assert not ignore.descend("sub").is_ignored("top.txt", False)
+    assert ignore.descend("docs").descend("a").is_ignored("x.tmp", False)
+    assert ignore.is_ignored(".git", True)
+
+
+def test_ignored_directories_are_never_listed(tmp_path):
+    (tmp_path / "node_modules" / "pkg").mkdir(parents=True)
+    (tmp_path / "src").mkdir()
+    (tmp_path / ".gitignore").write_text("node_modules/\n")
+    (tmp_path / "src" / ".contextignore").write_text("*.gen.py\n")
+    (tmp_path / "src" / "main.py").write_text("")
+    (tmp_path / "src" / "api.gen.py").write_text("")
+    root = str(tmp_path)
+
+    listings = scan_tree(root, ignore=load_ignore_rules(root))
+
+    assert listings[root] == [(".gitignore", False), ("src", True)]
+    assert listings[os.path.join(root, "src")] == [(".contextignore", False), ("main.py", False)]
+    assert os.path.join(root, "node_modules") not in listings
+
+
+def test_ignore_files_above_the_root_apply_inside_a_repo(repo):
+    (repo / ".gitignore").write_text("b.py\n")
+    root = str(repo / "scripts")
+
+    assert scan_tree(root, ignore=load_ignore_rules(root))[root] == [("a.py", False)]
+
+
+def test_ignore_files_from_a_base_outside_git(tmp_path):
+    (tmp_path / "src" / "pkg").mkdir(parents=True)
+    (tmp_path / ".gitignore").write_text("*.gen.py\n")
+    (tmp_path / "src" / "pkg" / "api.gen.py").write_text("")
+    (tmp_path / "src" / "pkg" / "main.py").write_text("")
+    folder = str(tmp_path / "src" / "pkg")
+
+    assert scan_tree(folder, ignore=load_ignore_rules(folder))[folder] == [("api.gen.py", False), ("main.py", False)]
+    assert scan_tree(folder, ignore=load_ignore_rules(folder, base=str(tmp_path)))[folder] == [("main.py", False)]
@@ -0,0 +1,53 @@
+import os
+
+from listing_cache import ListingCache
+from tree_walker import scan_tree
+
+
+def age(path, seconds):
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns - seconds * 1_000_000_000))
+
+
+def test_unchanged_directories_are_not_read_again(tmp_path):
+    (tmp_path / "sub").mkdir()
+    (tmp_path / "sub" / "a.py").write_text("")
+    age(tmp_path / "sub", 60)
+    age(tmp_path, 60)
+    cache = ListingCache()
+    root = str(tmp_path)
+
+    first = scan_tree(root, {".py"}, listing_cache=cache)
+    assert scan_tree(root, {".py"}, listing_cache=cache) == first
+    assert (cache.hits, cache.misses) == (2, 2)
+
+    (tmp_path / "sub" / "b.py").write_text("")
+    age(tmp_path / "sub", 30)
+    listings = scan_tree(root, {".py"}, listing_cache=cache)
+    assert listings[os.path.join(root, "sub")] == [("a.py", False), ("b.py", False)]
+    assert cache.invalidations == 1
+
+
+def test_freshly_changed_directories_are_not_cached(tmp_path):
+    (tmp_path / "a.py").write_text("")
+    cache = ListingCache()
+
+    scan_tree(str(tmp_path), listing_cache=cache)
+    scan_tree(str(tmp_path), listing_cache=cache)
+
+    assert cache.hits == 0 and cache.stats()["directories"] == 0
+
+
+def test_least_recently_used_directories_are_evicted(tmp_path):
+    for name in ("a", "b", "c"):
+        (tmp_path / name).mkdir()
+        (tmp_path / name / "x.py").write_text("")
+        (tmp_path / name / "y.py").write_text("")
+        age(tmp_path / name, 60)
+    cache = ListingCache(max_entries=4)
+
+    for name in ("a", "b", "a", "c"):
+        cache.scandir(str(tmp_path / name))
+
+    assert cache.evictions == 1
+    assert cache.scandir(str(tmp_path / "a")) and cache.hits == 2
@@ -0,0 +1,50 @@
+import shutil
+
+from conftest import touch_dir
+from fs_watcher import PollingWatcher
+from live_tree import LiveTree
+
+
+def test_refresh_splices_changes_and_keeps_the_selection(tmp_path):
+    for d in ("src/old", "src/pkg"):
+        (tmp_path / d).mkdir(parents=True)
+    for f in ("src/old/x.py", "src/pkg/a.py", "src/pkg/b.py", "z.py"):
+        (tmp_path / f).write_text("")
+    live = LiveTree(str(tmp_path), {".py"}, watcher=PollingWatcher())
+    table, selection = live.table, live.selection
+    a, z = table.find("src/pkg/a.py"), table.find("z.py")
+    selection.set(a, True)
+    selection.set(z, True)
+    assert live.refresh() is None
+
+    shutil.rmtree(tmp_path / "src" / "old")
+    (tmp_path / "src" / "new").mkdir()
+    (tmp_path / "src" / "new" / "n.py").write_text("")
+    (tmp_path / "src" / "pkg" / "c.py").write_text("")
+    touch_dir(tmp_path / "src", 1)
+    touch_dir(tmp_path / "src" / "pkg", 1)
+    remap = live.refresh()
+
+    table = live.table
+    assert [table.rel_path(node) for node in range(len(table))] == [
+        "", "src", "src/new", "src/new/n.py", "src/pkg", "src/pkg/a.py", "src/pkg/b.py", "src/pkg/c.py", "z.py"]
+    assert (remap(a), remap(z)) == (table.find("src/pkg/a.py"), table.find("z.py"))
+    assert [table.rel_path(node) for node in selection.selected_files()] == ["src/pkg/a.py", "z.py"]
+    assert selection.counts(0) == (2, 5)
+    assert str(tmp_path / "src" / "old") not in live.listings
+    assert str(tmp_path / "src" / "new") in live.watcher.watched()
+    live.close()
+
+
+def test_new_ignore_file_rescans_below_it(tmp_path):
+    (tmp_path / "src").mkdir()
+    (tmp_path / "src" / "main.py").write_text("")
+    (tmp_path / "src" / "gen.py").write_text("")
+    live = LiveTree(str(tmp_path), {".py"}, watcher=PollingWatcher())
+
+    (tmp_path / "src" / ".contextignore").write_text("gen.py\n")
+    live.refresh()
+
+    assert live.listings[str(tmp_path / "src")] == [("main.py", False)]
+    assert live.table.find("src/gen.py") is None
+    live.close()
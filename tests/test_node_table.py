@@ -0,0 +1,57 @@
+import os
+import pickle
+
+from node_table import NodeTable
+from tree_walker import scan_tree
+
+
+def make_table(tmp_path):
+    for d in ("src/pkg", "docs"):
+        (tmp_path / d).mkdir(parents=True)
+    for f in ("src/pkg/a.py", "src/b.py", "docs/index.md", "setup.py"):
+        (tmp_path / f).write_text("")
+    root = str(tmp_path)
+    return NodeTable.from_listings(root, scan_tree(root))
+
+
+def test_nodes_are_in_preorder_with_contiguous_subtrees(tmp_path):
+    table = make_table(tmp_path)
+
+    assert [table.rel_path(i) for i in range(len(table))] == [
+        "", "docs", os.path.join("docs", "index.md"), "setup.py", "src", os.path.join("src", "b.py"),
+        os.path.join("src", "pkg"), os.path.join("src", "pkg", "a.py"),
+    ]
+    src = table.find("src")
+    assert (src, table.subtree_end[src]) == (4, 8)
+    assert [table.name(child) for child in table.children()] == ["docs", "setup.py", "src"]
+    assert table.isdir(src) and not table.isdir(table.find(str(tmp_path / "setup.py")))
+
+
+def test_paths_and_lookups(tmp_path):
+    table = make_table(tmp_path)
+    src = table.find("src")
+
+    assert list(table.iter_paths(src)) == [(i, table.abs_path(i)) for i in range(src, table.subtree_end[src])]
+    assert table.abs_path(table.find(os.path.join("src", "pkg", "a.py"))) == str(tmp_path / "src" / "pkg" / "a.py")
+    assert table.find("src/missing.py") is None
+    assert table.find(str(tmp_path)) == 0
+
+
+def test_table_survives_a_pickle_round_trip(tmp_path):
+    table = make_table(tmp_path)
+
+    copy = pickle.loads(pickle.dumps(table))
+
+    assert [copy.abs_path(i) for i in range(len(copy))] == [table.abs_path(i) for i in range(len(table))]
+
+
+def test_search_matches_names_in_tree_order(tmp_path):
+    make_table(tmp_path)
+    (tmp_path / "docs" / "Setup.md").write_text("")
+    root = str(tmp_path)
+    table = NodeTable.from_listings(root, scan_tree(root))
+
+    assert [table.rel_path(node) for node in table.search("SETUP")] == [os.path.join("docs", "Setup.md"), "setup.py"]
+    assert [table.rel_path(node) for node in table.search(".py")] == [
+        "setup.py", os.path.join("src", "b.py"), os.path.join("src", "pkg", "a.py")]
+    assert table.search("") == [] and table.search("nothing") == []
@@ -0,0 +1,57 @@
+import os
+
+from outline import Outline, OutlineCache, Outliner, python_outline
+
+SOURCE = '''"""Module docs."""
+import os
+
+
+def helper(x, y=1):
+    """Help."""
+    total = x + y
+    return total
+
+
+class Thing(Base):
+    """A thing."""
+
+    def method(self):
+        return 1
+'''
+
+
+def test_python_outline_keeps_signatures_and_docstrings():
+    outline = python_outline(SOURCE)
+
+    assert outline.splitlines()[:2] == ['"""Module docs."""', "import os"]
+    assert "def helper(x, y=1):\n    \"\"\"Help.\"\"\"" in outline
+    assert "class Thing(Base):" in outline and "def method(self):\n        ..." in outline
+    assert "total" not in outline and "return 1" not in outline
+
+
+def test_unparsable_files_are_not_outlined():
+    assert python_outline("def broken(:\n") is None
+    assert Outliner(["."]).outline("broken.py", "def broken(:\n") == "def broken(:\n"
+
+
+def test_closest_path_decides(tmp_path):
+    outliner = Outliner([str(tmp_path)], [str(tmp_path / "keep")])
+
+    assert outliner.wants(str(tmp_path / "a.py"))
+    assert not outliner.wants(str(tmp_path / "keep" / "b.py"))
+    assert not outliner.wants(str(tmp_path / "notes.md"))
+    assert isinstance(outliner.outline(str(tmp_path / "a.py"), SOURCE), Outline)
+
+
+def test_outlines_are_cached_by_content(tmp_path):
+    db = str(tmp_path / "outlines.sqlite")
+    with OutlineCache(db) as cache:
+        outliner = Outliner(["."], cache=cache)
+        outliner.outline("a.py", SOURCE)
+        # Same text under another name: same entry
+        outliner.outline("b.py", SOURCE)
+        assert (cache.misses, cache.hits) == (1, 1)
+
+    with OutlineCache(db) as cache:
+        assert Outliner(["."], cache=cache).outline("a.py", SOURCE) == python_outline(SOURCE)
+        assert (cache.misses, cache.hits) == (0, 1)
@@ -0,0 +1,296 @@
+import json
+import os
+import sys
+
+import pytest
+
+from diff_scope import DiffScope
+import print_files
+
+
+def test_tree_and_contents(repo, run_print_files):
+    out = run_print_files(repo)
+
+    tree, contents = out.split("FILE CONTENTS", 1)
+    assert tree.splitlines()[:3] == ["scripts/", "├── a.py", "└── b.py"]
+    assert "FILE: scripts/a.py\n```python\ndef a():\n    return 1\n" in contents
+    assert "FILE: scripts/b.py" in contents
+
+
+def test_rerun_reuses_cached_blocks_until_a_file_changes(repo, run_print_files):
+    first = run_print_files(repo)
+    assert (repo / ".files_explanation_cache.sqlite").exists()
+    assert run_print_files(repo) == first
+
+    (repo / "scripts" / "a.py").write_text("def a():\n    return 10\n")
+    assert "return 10" in run_print_files(repo)
+
+
+def test_tokens_are_shown_in_the_tree(repo, run_print_files):
+    out = run_print_files(repo, "--tokens")
+
+    assert "├── a.py (8 tokens)" in out
+    assert "Total: ~16 tokens in 2 files" in out
+
+
+def test_max_tokens_omits_what_does_not_fit(repo, run_print_files):
+    (repo / "scripts" / "big.py").write_text("x = 1\n" * 200)
+
+    out = run_print_files(repo, "--max-tokens", "100")
+
+    assert "big.py (" in out and "tokens, omitted)" in out
+    assert "FILE: scripts/big.py" not in out
+    assert "FILE: scripts/a.py" in out and "FILE: scripts/b.py" in out
+
+
+def test_own_output_and_caches_are_not_walked(repo, run_print_files, monkeypatch):
+    run_print_files(repo, "--tokens", paths=["."])
+    assert (repo / print_files.token_cache_file).exists()
+    (repo / "files_explanation.notes.txt").write_text("kept\n")
+
+    out = run_print_files(repo, "--tokens", paths=["."])
+    assert print_files.token_cache_file not in out
+    assert "files_explanation.notes.txt" in out
+
+    # An earlier output written inside the tree
+    (repo / "files_explanation.txt").write_text("old output\n")
+    monkeypatch.setattr(print_files, "file_explanation_output_file", "files_explanation.txt")
+    monkeypatch.setattr(sys, "argv", ["print_files.py"])
+    print_files.all_files.clear()
+    print_files.main()
+    out = (repo / "files_explanation.txt").read_text()
+    assert "old output" not in out
+    assert "files_explanation.notes.txt" in out
+
+
+def test_large_and_binary_files(repo, run_print_files):
+    (repo / "scripts" / "big.txt").write_text("".join(f"line {i}\n" for i in range(1000)))
+    (repo / "scripts" / "blob.json").write_bytes(b"\0" * 16)
+
+    out = run_print_files(repo, "--large-file-bytes", "1000")
+    assert "FILE: scripts/blob.json\n```json\n(binary file, 16 bytes, skipped)\n```" in out
+    assert "bytes elided" in out and "line 999" in out
+
+    out = run_print_files(repo, "--large-file-bytes", "1000", "--large-files", "stream")
+    assert "bytes elided" not in out and "line 500\n" in out
+
+
+def test_ignore_files_are_honoured_unless_disabled(repo, run_print_files):
+    (repo / ".gitignore").write_text("b.py\n")
+
+    assert "b.py" not in run_print_files(repo)
+    assert "FILE: scripts/b.py" in run_print_files(repo, "--no-ignore-files")
+
+
+def test_output_to_stdout(repo, run_print_files, capsys):
+    written = run_print_files(repo)
+    capsys.readouterr()
+
+    assert run_print_files(repo, "--output", "-") is None
+    assert capsys.readouterr().out == written
+
+
+def test_rerun_over_clean_files_reads_nothing(repo, run_print_files, monkeypatch):
+    first = run_print_files(repo)
+    loaded = []
+    load_file = print_files.load_file
+    monkeypatch.setattr(print_files, "load_file", lambda fpath, *args, **kwargs: loaded.append(fpath) or
+                        load_file(fpath, *args, **kwargs))
+
+    assert run_print_files(repo) == first
+    assert loaded == []
+
+
+def test_rev_reads_the_commit_not_the_working_tree(repo, run_print_files):
+    (repo / "scripts" / "a.py").write_text("def a():\n    return 10\n")
+    (repo / "scripts" / "c.py").write_text("untracked\n")
+
+    out = run_print_files(repo, "--rev", "HEAD")
+    assert "return 1\n" in out and "return 10" not in out
+    assert "c.py" not in out
+    # The working tree itself is still what a plain run shows
+    assert "return 10" in run_print_files(repo)
+
+
+def test_unknown_rev_is_an_error(repo, run_print_files):
+    with pytest.raises(SystemExit, match="git: Unknown revision"):
+        run_print_files(repo, "--rev", "no-such-branch")
+
+
+def test_diff_lists_only_changed_files(repo, run_print_files):
+    (repo / "scripts" / "a.py").write_text("def a():\n    return 3\n")
+
+    out = run_print_files(repo, "--diff", "HEAD")
+    tree, contents = out.split("FILE CONTENTS", 1)
+    assert tree.splitlines()[:2] == ["scripts/", "└── a.py"]
+    assert "FILE: scripts/a.py" in contents and "return 3" in contents
+    assert "b.py" not in out
+
+    out = run_print_files(repo, "--diff", "HEAD", "--hunks", "0")
+    assert "```diff\n@@ -2 +2 @@ def a():\n-    return 1\n+    return 3\n```" in out
+
+
+def test_diff_with_dot_root(repo, run_print_files):
+    (repo / "scripts" / "a.py").write_text("def a():\n    return 3\n")
+    (repo / "scripts" / "new.py").write_text("def new():\n    pass\n")
+
+    out = run_print_files(repo, "--diff", "HEAD", paths=["."])
+
+    tree, contents = out.split("FILE CONTENTS", 1)
+    assert "scripts" in tree and "a.py" in tree and "new.py" in tree and "README.md" in tree
+    assert "b.py" not in tree
+    assert "FILE: ./scripts/a.py" in contents and "return 3" in contents
+    assert "FILE: ./scripts/new.py" in contents
+    assert "FILE: ./scripts/b.py" not in contents
+
+
+def test_outline_and_full_paths(repo, run_print_files):
+    (repo / "scripts" / "b.py").write_text('def b():\n    """B."""\n    return 2\n')
+
+    out = run_print_files(repo, "--outline", ".", "--full", "scripts/a.py")
+
+    assert "FILE: scripts/a.py\n```python\ndef a():\n    return 1\n" in out
+    assert 'FILE: scripts/b.py (outline)\n```python\ndef b():\n    """B."""\n```' in out
+    assert (repo / ".files_explanation_outlines.sqlite").exists()
+    # The plain run doesn't reuse the outlined block from the cache
+    assert "return 2" in run_print_files(repo)
+
+
+def test_identical_files_are_printed_once(repo, run_print_files):
+    body = "def shared():\n    return 'the same body in more than one place'\n"
+    (repo / "scripts" / "c.py").write_text(body)
+    (repo / "scripts" / "d.py").write_text(body)
+
+    out = run_print_files(repo)
+    assert "└── d.py (identical to scripts/c.py)" in out
+    assert "FILE: scripts/d.py (identical to scripts/c.py)\n" in out
+    assert out.count("the same body") == 1
+
+    assert run_print_files(repo, "--no-dedupe").count("the same body") == 2
+
+
+def test_shards_and_manifest(repo, run_print_files, tmp_path):
+    (repo / "scripts" / "c.py").write_text("def c():\n    return 'x' * 200\n" * 20)
+
+    assert run_print_files(repo, "--shard-bytes", "400") is None
+
+    parts = sorted(tmp_path.glob("files_explanation.part*.txt"))
+    with open(tmp_path / "files_explanation.manifest.json", encoding="utf-8") as f:
+        manifest = json.load(f)
+    assert [shard["path"] for shard in manifest["shards"]] == [str(part) for part in parts]
+    assert len(parts) > 1
+    assert parts[0].read_text().startswith(f"========== PART 1 OF {len(parts)} ==========")
+    for shard in manifest["shards"]:
+        data = open(shard["path"], "rb").read()
+        for entry in shard["files"]:
+            block = data[entry["offset"]:entry["offset"] + entry["length"]]
+            assert block.startswith(f"FILE: {entry['file']}".encode())
+
+
+def test_shards_with_dot_root(repo, run_print_files, tmp_path):
+    (repo / "scripts" / "c.py").write_text("def c():\n    return 'x' * 200\n" * 20)
+
+    assert run_print_files(repo, "--shard-bytes", "1200", paths=["."]) is None
+
+    parts = sorted(tmp_path.glob("files_explanation.part*.txt"))
+    assert len(parts) > 1
+    for part in parts:
+        tree, contents = part.read_text().split("FILE CONTENTS", 1)
+        printed = [line.split("FILE: ", 1)[1] for line in contents.splitlines() if line.startswith("FILE: ")]
+        assert printed
+        for fpath in printed:
+            # Every file in the part is in its tree excerpt, under its folder
+            assert os.path.basename(fpath) in tree
+            if fpath.startswith("./scripts/"):
+                assert "scripts" in tree
+
+
+def test_own_parts_and_manifest_are_not_walked(repo, monkeypatch):
+    monkeypatch.chdir(repo)
+    monkeypatch.setattr(print_files, "paths", ["."])
+    for name in ("files_explanation.part001.txt", "files_explanation.manifest.json"):
+        (repo / name).write_text("old output\n")
+    (repo / "files_explanation.partial.txt").write_text("kept\n")
+    monkeypatch.setattr(print_files, "file_explanation_output_file", "files_explanation.txt")
+    monkeypatch.setattr(sys, "argv", ["print_files.py"])
+    print_files.all_files.clear()
+    print_files.main()
+
+    out = (repo / "files_explanation.txt").read_text()
+    assert "old output" not in out
+    assert "files_explanation.partial.txt" in out
+
+
+def test_diff_hunks_are_made_once_per_file(repo, run_print_files, tmp_path, monkeypatch):
+    (repo / "scripts" / "a.py").write_text("def a():\n    return 3\n")
+    made = []
+    original = DiffScope.hunks
+    monkeypatch.setattr(DiffScope, "hunks", lambda self, path: made.append(path) or original(self, path))
+
+    run_print_files(repo, "--diff", "HEAD", "--hunks", "1", "--shard-bytes", "100000", paths=["."])
+
+    assert len(made) == len(set(made)) == 2
+    assert "+    return 3" in (tmp_path / "files_explanation.part001.txt").read_text()
+
+
+def test_query_keeps_the_best_matches(repo, run_print_files):
+    (repo / "scripts" / "uploader.py").write_text("def retry_upload():\n    # retry the upload\n    pass\n")
+
+    out = run_print_files(repo, "--query", "retry upload", "--top-k", "1")
+
+    tree, contents = out.split("FILE CONTENTS", 1)
+    assert tree.splitlines()[:2] == ["scripts/", "└── uploader.py"]
+    assert "FILE: scripts/uploader.py" in contents and "FILE: scripts/a.py" not in contents
+    assert (repo / ".files_explanation_index.sqlite").exists()
+
+    assert "(no files match --query 'nothing here')" in run_print_files(repo, "--query", "nothing here")
+
+
+def test_query_tree_excerpt_with_dot_root(repo, run_print_files):
+    (repo / "scripts" / "uploader.py").write_text("def retry_upload():\n    # retry the upload\n    pass\n")
+
+    out = run_print_files(repo, "--query", "retry upload", "--top-k", "1", paths=["."])
+
+    tree, contents = out.split("FILE CONTENTS", 1)
+    assert "FILE: ./scripts/uploader.py" in contents
+    assert "FILE: ./scripts/a.py" not in contents
+    assert tree.splitlines()[0] == "./"
+    assert "scripts" in tree and "uploader.py" in tree
+    assert "a.py" not in tree
+
+
+def test_query_alternating_rev_and_working_tree_indexes_once(repo, run_print_files, monkeypatch):
+    reindexed = []
+    update = print_files.SearchIndex.update
+    monkeypatch.setattr(print_files.SearchIndex, "update",
+                        lambda self, *args, **kwargs: reindexed.append(update(self, *args, **kwargs)))
+
+    for argv in (["--rev", "HEAD"], [], ["--rev", "HEAD"], []):
+        run_print_files(repo, "--query", "return", *argv, paths=["."])
+
+    # a.py and b.py from the commit; a.py, b.py and README.md from the working tree
+    assert reindexed == [2, 3, 0, 0]
+
+
+def test_stats_on_stderr(repo, run_print_files, capsys):
+    first = run_print_files(repo)
+    capsys.readouterr()
+
+    second = run_print_files(repo, "--stats", "json")
+
+    stats = json.loads(capsys.readouterr().err)
+    assert "walk" in stats["phases"] and "write" in stats["phases"]
+    assert "read" not in stats["operations"]
+    assert stats["caches"]["content"]["misses"] == 0
+    assert second == first
+
+    run_print_files(repo, "--stats")
+    assert capsys.readouterr().err.startswith("Run stats (")
+
+
+def test_rev_reports_its_reads_to_stats(repo, run_print_files, capsys):
+    run_print_files(repo, "--rev", "HEAD", "--stats", "json")
+
+    stats = json.loads(capsys.readouterr().err)
+    assert stats["counters"]["bytes_read"] == len("def a():\n    return 1\n") + len("def b():\n    return 2\n")
+    assert stats["operations"]["read"]["count"] == 2
@@ -0,0 +1,131 @@
+import json
+import multiprocessing
+import os
+
+import pytest
+
+import print_files
+import print_files_batch
+
+# The print_files globals run_job sets for each repo
+JOB_GLOBALS = ("paths", "exclude_paths", "token_cache_file", "outline_cache_file", "search_index_file")
+
+
+@pytest.fixture
+def in_process(monkeypatch):
+    """
+    Let run_job run in this process: the globals it sets are undone
+    afterwards, and nothing is cached across tests.
+    """
+    monkeypatch.setattr(print_files, "content_cache_file", None)
+    for name in JOB_GLOBALS:
+        monkeypatch.setattr(print_files, name, getattr(print_files, name))
+
+
+def write_manifest(path, manifest):
+    path.write_text(json.dumps(manifest))
+    return print_files_batch.load_manifest(str(path))
+
+
+def test_load_manifest(tmp_path):
+    jobs, output_dir, cache_dir = write_manifest(tmp_path / "repos.json", {
+        "output_dir": "contexts",
+        "options": ["--tokens"],
+        "repos": ["a/app", {"root": "b/app", "paths": ["src"], "options": ["--no-dedupe"]}],
+    })
+
+    assert output_dir == str(tmp_path / "contexts") and cache_dir == str(tmp_path / "contexts" / ".cache")
+    # Two repos named "app" don't share an output
+    assert [job["name"] for job in jobs] == ["app", "app-2"]
+    assert jobs[0]["root"] == str(tmp_path / "a" / "app") and jobs[0]["paths"] == ["."]
+    assert jobs[1]["paths"] == ["src"]
+    assert jobs[1]["argv"] == ["--tokens", "--no-dedupe", "--output", str(tmp_path / "contexts" / "app-2.txt")]
+
+
+def test_batch_writes_every_repo_and_a_summary(repo, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    jobs, output_dir, cache_dir = write_manifest(tmp_path / "repos.json", {"output_dir": "contexts", "repos": [
+        {"root": str(repo), "name": "one"},
+        {"root": str(repo), "name": "two", "paths": ["scripts"]},
+        {"root": str(tmp_path / "missing"), "name": "missing"},
+    ]})
+
+    summary = print_files_batch.run_batch(jobs, output_dir, cache_dir, workers=2)
+
+    outcomes = {result["name"]: result["ok"] for result in summary["results"]}
+    assert outcomes == {"one": True, "two": True, "missing": False}
+    assert "FILE: ./README.md" in (tmp_path / "contexts" / "one.txt").read_text()
+    assert "README.md" not in (tmp_path / "contexts" / "two.txt").read_text()
+    assert json.loads((tmp_path / "contexts" / "summary.json").read_text())["failed"] == 1
+    assert os.path.exists(tmp_path / "contexts" / ".cache" / "content.sqlite")
+
+
+def test_batch_skips_output_and_cache_dirs_inside_the_repo(repo, monkeypatch, in_process):
+    monkeypatch.chdir(repo)
+    jobs, output_dir, cache_dir = write_manifest(repo / "repos.json", {"output_dir": "contexts", "repos": ["."]})
+    (repo / "contexts" / ".cache").mkdir(parents=True)
+    (repo / "contexts" / "notes.txt").write_text("an earlier output\n")
+    (repo / "contexts" / ".cache" / "repo.tokens.json").write_text("{}\n")
+
+    result = print_files_batch.run_job(jobs[0], cache_dir)
+
+    assert result["ok"], result
+    out = (repo / "contexts" / "repo.txt").read_text()
+    assert "FILE: ./scripts/a.py" in out
+    assert "── contexts" not in out and "an earlier output" not in out and "tokens.json" not in out
+
+
+def test_batch_counts_the_files_written(repo, tmp_path, monkeypatch, in_process):
+    shared = "def shared():\n    return 'the same in both files, long enough to deduplicate'\n"
+    (repo / "scripts" / "one.py").write_text(shared)
+    (repo / "scripts" / "two.py").write_text(shared)
+    (repo / "scripts" / "blob.txt").write_bytes(b"\0\1\2" * 100)
+    monkeypatch.chdir(tmp_path)  # run_job moves into the repo
+    jobs, output_dir, cache_dir = write_manifest(tmp_path / "repos.json",
+                                                 {"output_dir": "contexts", "repos": [str(repo)]})
+    os.makedirs(cache_dir)
+
+    result = print_files_batch.run_job(jobs[0], cache_dir)
+
+    # README.md, a.py, b.py and one.py: not the copy of one.py, nor the binary file
+    assert result["ok"], result
+    assert result["files"] == 4
+
+
+def test_batch_keeps_stats_and_rejects_profile(repo, tmp_path, monkeypatch, in_process):
+    monkeypatch.chdir(tmp_path)  # run_job moves into the repo
+    jobs, output_dir, cache_dir = write_manifest(tmp_path / "repos.json", {"output_dir": "contexts", "repos": [
+        {"root": str(repo), "name": "stats", "options": ["--stats", "json"]},
+        {"root": str(repo), "name": "profile", "options": ["--profile", "run.prof"]},
+    ]})
+    os.makedirs(cache_dir)
+
+    assert print_files_batch.check_job(jobs[0]) is None
+    assert "--profile" in print_files_batch.check_job(jobs[1])
+    result = print_files_batch.run_job(jobs[0], cache_dir)
+    assert result["ok"], result
+    assert "walk" in result["stats"]["phases"]
+    assert result["stats"]["counters"]["files_written"] == 3
+
+
+@pytest.mark.skipif(multiprocessing.get_start_method() != "fork", reason="the patched run_job must reach the workers")
+def test_batch_survives_a_worker_dying(repo, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    run_job = print_files_batch.run_job
+
+    def dying_run_job(job, cache_dir):
+        if job["name"] == "crash":
+            os._exit(1)
+        return run_job(job, cache_dir)
+    # Pickled by name, so the workers (forked after this) look it up in the module
+    dying_run_job.__module__, dying_run_job.__qualname__ = "print_files_batch", "run_job"
+    monkeypatch.setattr(print_files_batch, "run_job", dying_run_job)
+    jobs, output_dir, cache_dir = write_manifest(tmp_path / "repos.json", {
+        "output_dir": "contexts", "cache_dir": "cache",
+        "repos": [{"root": str(repo), "name": name} for name in ("one", "crash", "two", "three")]})
+
+    summary = print_files_batch.run_batch(jobs, output_dir, cache_dir, workers=2)
+
+    outcomes = {result["name"]: result["ok"] for result in summary["results"]}
+    assert outcomes == {"one": True, "crash": False, "two": True, "three": True}
+    assert json.loads((tmp_path / "contexts" / "summary.json").read_text())["failed"] == 1
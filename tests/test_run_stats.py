@@ -0,0 +1,68 @@
+import threading
+
+import run_stats
+from run_stats import RunStats
+from tree_walker import scan_tree
+
+
+class Hits:
+    hits = 3
+    misses = 1
+
+
+def test_phases_counters_and_slowest_files():
+    stats = RunStats(slowest=2)
+    with stats.phase("walk"):
+        pass
+    with stats.phase("walk"):
+        pass
+    stats.add("bytes_read", 10)
+    for seconds, path in ((0.1, "a.py"), (0.3, "b.py"), (0.2, "c.py"), (0.05, "a.py")):
+        stats.record("read", seconds, path)
+    stats.watch_cache("content", Hits())
+
+    data = stats.as_dict()
+    assert data["phases"]["walk"]["count"] == 2
+    assert data["counters"] == {"bytes_read": 10}
+    assert data["operations"]["read"]["count"] == 4
+    assert data["caches"]["content"] == {"hits": 3, "misses": 1, "hit_rate": 0.75}
+    assert [entry["path"] for entry in data["slowest_files"]] == ["b.py", "c.py"]
+    assert "75% hits (3 of 4)" in stats.format_summary()
+
+
+def test_reports_go_nowhere_unless_collecting():
+    stats = RunStats()
+    run_stats.add("ignored")
+    with run_stats.collecting(stats):
+        run_stats.add("counted")
+        run_stats.record("read", 0.1)
+    run_stats.add("ignored")
+
+    assert stats.counters == {"counted": 1}
+    assert run_stats.active() is None
+
+
+def test_concurrent_runs_keep_their_own_stats(tmp_path):
+    for name in ("one", "two"):
+        (tmp_path / name / "sub").mkdir(parents=True)
+        (tmp_path / name / "sub" / "a.py").write_text("x = 1\n")
+    stats = {"one": RunStats(), "two": RunStats()}
+    both_collecting = threading.Barrier(2)
+
+    def run(name):
+        with run_stats.collecting(stats[name]):
+            both_collecting.wait()
+            run_stats.add(name)
+            # Listings are read on scan_tree's own pool
+            scan_tree(str(tmp_path / name), workers=4)
+
+    threads = [threading.Thread(target=run, args=(name,)) for name in stats]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert stats["one"].counters["one"] == 1 and "two" not in stats["one"].counters
+    assert stats["two"].counters["two"] == 1 and "one" not in stats["two"].counters
+    assert stats["one"].counters["dirs_visited"] == stats["two"].counters["dirs_visited"] == 2
+    assert run_stats.active() is None
@@ -0,0 +1,49 @@
+import os
+
+from search_index import SearchIndex, pick_top, tokenize
+
+
+def test_identifiers_are_split_and_stemmed():
+    terms = tokenize("uploadRetryCount upload_retry_count uploader retries")
+
+    assert {"upload", "retry", "count", "uploadretrycount"} <= set(terms)
+    assert terms.count("upload") == 3 and terms.count("retry") == 3
+
+
+def test_best_match_first(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "uploader.py").write_text("def retry_upload():\n    # retry the upload\n    pass\n")
+    (tmp_path / "parser.py").write_text("def parse(text):\n    return text.split()\n")
+    (tmp_path / "notes.md").write_text("Retry once.\n")
+    files = ["uploader.py", "parser.py", "notes.md"]
+
+    with SearchIndex(":memory:") as index:
+        assert index.update(files) == 3
+        ranked = index.search("retry logic in the uploader", files)
+
+    assert [path for path, _ in ranked] == ["uploader.py", "notes.md"]
+
+
+def test_update_reads_only_changed_files_and_prunes(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    for name in ("a.py", "b.py"):
+        (tmp_path / name).write_text(f"def {name[0]}():\n    pass\n")
+    db = str(tmp_path / "index.sqlite")
+    with SearchIndex(db) as index:
+        assert index.update(["a.py", "b.py"], prune=["."]) == 2
+
+    (tmp_path / "a.py").write_text("def changed():\n    pass\n")
+    os.remove(tmp_path / "b.py")
+    with SearchIndex(db) as index:
+        assert index.update(["a.py"], prune=["."]) == 1
+        assert index.search("changed", ["a.py"])[0][0] == "a.py"
+        assert index._conn.execute("SELECT COUNT(*) FROM docs").fetchone()[0] == 1
+
+
+def test_pick_top_within_a_budget():
+    ranked = [("a", 3.0), ("b", 2.0), ("c", 1.0), ("d", 0.5)]
+    sizes = {"a": 50, "b": 80, "c": 30, "d": 10}
+
+    assert pick_top(ranked, 2) == ["a", "b"]
+    # b doesn't fit after a, so the next ones that do are taken instead
+    assert pick_top(ranked, 3, 100, sizes.get) == ["a", "c", "d"]
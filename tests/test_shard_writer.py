@@ -0,0 +1,44 @@
+import json
+import os
+
+from file_sniffer import RawFile
+from shard_writer import manifest_path, plan_shards, shard_paths, write_manifest, write_shard
+
+
+def test_plan_keeps_folders_together_where_they_fit():
+    sizes = {"a/1": 40, "a/2": 40, "b/1": 30, "b/2": 30, "c/1": 150}
+
+    shards = plan_shards(list(sizes), sizes.get, 100)
+
+    # b/ moves to a part of its own rather than straddling; c/1 is over the cap, alone
+    assert shards == [["a/1", "a/2"], ["b/1", "b/2"], ["c/1"]]
+
+
+def test_a_folder_too_big_for_any_part_is_split():
+    sizes = {"a/1": 60, "a/2": 60, "a/3": 60}
+
+    assert plan_shards(list(sizes), sizes.get, 100) == [["a/1"], ["a/2"], ["a/3"]]
+
+
+def test_paths_next_to_the_output():
+    assert shard_paths("out/context.txt", 2) == ["out/context.part001.txt", "out/context.part002.txt"]
+    assert shard_paths("context.txt", 1000)[-1] == "context.part1000.txt"
+    assert manifest_path("out/context.txt") == "out/context.manifest.json"
+
+
+def test_offsets_point_at_each_block(tmp_path):
+    path = str(tmp_path / "part.txt")
+    raw = RawFile("b.py", 6, b"b = 2\n")
+
+    shard = write_shard(path, ["HEADER\n"], [("a.py", "FILE: a.py\n"), ("a.py", "é = 1\n"), ("b.py", raw)])
+
+    with open(path, "rb") as f:
+        data = f.read()
+    assert shard["bytes"] == len(data)
+    blocks = {entry["file"]: data[entry["offset"]:entry["offset"] + entry["length"]] for entry in shard["files"]}
+    assert blocks == {"a.py": "FILE: a.py\né = 1\n".encode("utf-8"), "b.py": b"b = 2\n"}
+
+    manifest = write_manifest(str(tmp_path / "m.json"), [shard], 100, "bytes")
+    with open(tmp_path / "m.json", encoding="utf-8") as f:
+        assert json.load(f) == manifest
+    assert manifest["shards"][0]["index"] == 1 and not os.path.exists(str(tmp_path / "m.json.tmp"))
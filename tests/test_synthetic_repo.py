@@ -0,0 +1,40 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+from synthetic_repo import make_synthetic_repo
+
+SMALL = {"entries": 200, "depth": 3, "fanout": 8, "median_bytes": 256, "max_bytes": 4096}
+
+
+def tree_bytes(root):
+    contents = {}
+    for dir_path, _, names in os.walk(root):
+        for name in names:
+            path = os.path.join(dir_path, name)
+            with open(path, "rb") as f:
+                contents[os.path.relpath(path, root)] = f.read()
+    return contents
+
+
+def test_same_seed_same_tree(tmp_path):
+    first = make_synthetic_repo(str(tmp_path / "one"), **SMALL)
+    second = make_synthetic_repo(str(tmp_path / "two"), **SMALL)
+
+    assert first["files"] + first["dirs"] == SMALL["entries"]
+    assert {key: value for key, value in first.items() if key != "seconds"} == \
+        {key: value for key, value in second.items() if key != "seconds"}
+    assert tree_bytes(tmp_path / "one") == tree_bytes(tmp_path / "two")
+
+    make_synthetic_repo(str(tmp_path / "three"), seed=2, **SMALL)
+    assert tree_bytes(tmp_path / "three") != tree_bytes(tmp_path / "one")
+
+
+def test_print_files_over_a_synthetic_repo(tmp_path, run_print_files):
+    root = tmp_path / "synthetic"
+    made = make_synthetic_repo(str(root), binary_ratio=0.1, **SMALL)
+
+    out = run_print_files(root, "--tokens", paths=["."])
+
+    assert made["binary"] and "(binary file," in out
+    assert made["duplicates"] and "(identical to " in out
@@ -0,0 +1,44 @@
+from token_budget import TokenCounter, approx_token_count, fit_to_budget
+
+
+def test_approx_counts_words_and_punctuation():
+    assert approx_token_count("") == 0
+    assert approx_token_count("def a():") == 1 + 1 + 3
+    assert approx_token_count("internationalization") == 5
+
+
+def test_greedy_fit_keeps_higher_priorities_first():
+    items = [("a", 50, 1), ("b", 60, 2), ("c", 30, 2), ("d", 10, 1)]
+
+    assert fit_to_budget(items, 100) == {"b", "c", "d"}
+    assert fit_to_budget(items, None) == {"a", "b", "c", "d"}
+
+
+def test_knapsack_fit_beats_greedy_on_total_priority():
+    items = [("big", 60, 3), ("x", 50, 2), ("y", 50, 2)]
+
+    assert fit_to_budget(items, 100, "greedy") == {"big"}
+    assert fit_to_budget(items, 100, "knapsack") == {"x", "y"}
+
+
+def test_counts_are_cached_until_the_file_changes(tmp_path):
+    path = tmp_path / "a.py"
+    path.write_text("one two three\n")
+    cache_file = str(tmp_path / "tokens.json")
+    reads = []
+
+    def read(p):
+        reads.append(p)
+        with open(p, encoding="utf-8") as f:
+            return f.read()
+
+    counter = TokenCounter(cache_file=cache_file)
+    assert counter.count_files([str(path)], read=read) == {str(path): approx_token_count("one two three\n")}
+    counter.save()
+    TokenCounter(cache_file=cache_file).count_files([str(path)], read=read)
+    assert len(reads) == 1
+
+    path.write_text("one two three four five\n")
+    counts = TokenCounter(cache_file=cache_file).count_files([str(path)], read=read)
+    assert counts == {str(path): approx_token_count("one two three four five\n")}
+    assert len(reads) == 2
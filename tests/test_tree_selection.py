@@ -0,0 +1,54 @@
+from node_table import NodeTable
+from tree_selection import CHECKED, PARTIAL, UNCHECKED, TreeSelection
+from tree_walker import scan_tree
+
+
+def make_table(tmp_path):
+    for d in ("src/pkg", "empty"):
+        (tmp_path / d).mkdir(parents=True)
+    for f in ("src/pkg/a.py", "src/b.py", "setup.py"):
+        (tmp_path / f).write_text("")
+    root = str(tmp_path)
+    return NodeTable.from_listings(root, scan_tree(root))
+
+
+def test_folder_states_follow_their_leaves(tmp_path):
+    table = make_table(tmp_path)
+    selection = TreeSelection(table)
+    src, pkg = table.find("src"), table.find("src/pkg")
+
+    selection.set(table.find("src/pkg/a.py"), True)
+    assert [selection.state(node) for node in (0, src, pkg)] == [PARTIAL, PARTIAL, CHECKED]
+    assert selection.counts(src) == (1, 2)
+
+    selection.set(src, True)
+    assert selection.state(src) == CHECKED and selection.counts(0) == (2, 4)
+    selection.set(pkg, False)
+    assert selection.state(pkg) == UNCHECKED and selection.state(src) == PARTIAL
+    assert not selection.shows(table.find("empty"))
+
+
+def test_selected_leaves_skip_unselected_subtrees(tmp_path):
+    table = make_table(tmp_path)
+    selection = TreeSelection(table)
+
+    selection.set(table.find("src"), True)
+    selection.set(table.find("empty"), True)
+
+    assert [table.rel_path(node) for node in selection.selected_leaves()] == ["empty", "src/b.py", "src/pkg/a.py"]
+    assert [table.rel_path(node) for node in selection.selected_files()] == ["src/b.py", "src/pkg/a.py"]
+
+
+def test_selection_carries_over_to_a_rescan(tmp_path):
+    selection = TreeSelection(make_table(tmp_path))
+    selection.set(selection.table.find("src"), True)
+    (tmp_path / "src" / "b.py").unlink()
+    (tmp_path / "src" / "c.py").write_text("")
+    root = str(tmp_path)
+
+    rescanned = TreeSelection(NodeTable.from_listings(root, scan_tree(root)))
+    rescanned.carry_over(selection)
+
+    table = rescanned.table
+    assert [table.rel_path(node) for node in rescanned.selected_files()] == ["src/pkg/a.py"]
+    assert rescanned.state(table.find("src")) == PARTIAL
@@ -0,0 +1,51 @@
+import os
+
+from tree_walker import file_extension, iter_tree, list_directory, scan_tree
+
+
+def make_tree(root):
+    for d in ("a/b/c", "a/d", "e", "__pycache__"):
+        (root / d).mkdir(parents=True)
+    for f in ("a/one.py", "a/b/two.py", "a/b/c/three.py", "a/b/skip.bin", "e/four.md", "__pycache__/x.py", "top.py"):
+        (root / f).write_text("x\n")
+
+
+def test_parallel_and_serial_scans_agree(tmp_path):
+    make_tree(tmp_path)
+    root = str(tmp_path)
+
+    serial = scan_tree(root, {".py", ".md"}, {"__pycache__"}, workers=1)
+    parallel = scan_tree(root, {".py", ".md"}, {"__pycache__"}, workers=8)
+
+    assert serial == parallel
+    assert serial[root] == [("a", True), ("e", True), ("top.py", False)]
+    assert serial[os.path.join(root, "a", "b")] == [("c", True), ("two.py", False)]
+    assert os.path.join(root, "__pycache__") not in serial
+
+
+def test_unreadable_directory_lists_as_empty(tmp_path):
+    assert list_directory(str(tmp_path / "missing")) == []
+
+
+def test_last_shown_entry_closes_the_branch(tmp_path):
+    make_tree(tmp_path)
+    root = str(tmp_path)
+
+    lines = [prefix + name for prefix, name, path, is_dir in iter_tree(scan_tree(root, {".py"}, {"__pycache__"}), root)]
+
+    assert lines == [
+        "├── a",
+        "│   ├── b",
+        "│   │   ├── c",
+        "│   │   │   └── three.py",
+        "│   │   └── two.py",
+        "│   ├── d",
+        "│   └── one.py",
+        "├── e",
+        "└── top.py",
+    ]
+
+
+def test_file_extension_matches_splitext():
+    for name in ("a.py", "archive.tar.gz", ".bashrc", "..hidden.py", "noext", "trailing.", "...", ".a.b"):
+        assert file_extension(name) == os.path.splitext(name)[1]
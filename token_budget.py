@@ -0,0 +1,204 @@
+"""
+Token estimation and fitting a selection of files into a context window.
+
+The default tokenizer is a fast regex approximation (roughly 4 characters
+per token for words, one token per punctuation mark). It's close enough to
+real BPE counts to tell whether a context will fit. Other tokenizers can be
+plugged in with register_tokenizer(), and "tiktoken:<encoding>" is available
+when tiktoken is installed.
+
+Per-file counts are cached by (size, mtime, inode), in memory and optionally
+in a small JSON file, so only files that changed get recounted.
+"""
+import json
+import math
+import os
+import re
+
+from file_reader import iter_file_contents, read_text
+
+_WORD_RE = re.compile(r"\w+")
+_PUNCT_RE = re.compile(r"[^\w\s]")
+
+# Above this many (files x budget buckets) the knapsack fit falls back to greedy
+KNAPSACK_MAX_CELLS = 4_000_000
+
+
+def approx_token_count(text):
+    words = _WORD_RE.findall(text)
+    word_chars = sum(map(len, words))
+    return (word_chars + 3 * len(words)) // 4 + len(_PUNCT_RE.findall(text))
+
+
+_TOKENIZERS = {
+    "approx": approx_token_count,
+}
+
+
+def register_tokenizer(name, count_fn):
+    """
+    Make 'count_fn' (str -> int) available under 'name'.
+    """
+    _TOKENIZERS[name] = count_fn
+
+
+def get_tokenizer(name="approx"):
+    """
+    Return a str -> int token counting function.
+    'name' is a registered tokenizer, or "tiktoken:<encoding>" (e.g. "tiktoken:cl100k_base").
+    """
+    if name in _TOKENIZERS:
+        return _TOKENIZERS[name]
+    if name.startswith("tiktoken:"):
+        try:
+            import tiktoken
+        except ImportError:
+            raise ImportError(f"Tokenizer '{name}' needs tiktoken (pip install tiktoken)")
+        encoding = tiktoken.get_encoding(name.split(":", 1)[1])
+        count_fn = lambda text: len(encoding.encode(text, disallowed_special=()))
+        register_tokenizer(name, count_fn)
+        return count_fn
+    raise ValueError(f"Unknown tokenizer: {name}")
+
+
+class TokenCounter:
+    """
+    Per-file token counts, cached by stat metadata.
+    'cache_file' (optional) is a JSON file the counts are loaded from and saved to.
+    'variant' names anything else that changes the counted text (e.g. how large
+    files are truncated); a cache file saved under another variant is ignored.
+    """
+
+    def __init__(self, tokenizer="approx", cache_file=None, variant=""):
+        self.tokenizer = tokenizer
+        self.variant = variant
+        self.count_text = get_tokenizer(tokenizer)
+        self.cache_file = cache_file
+        self._cache = {}  # abs path -> [size, mtime_ns, inode, count]
+        self._dirty = False
+        self.hits = 0
+        self.misses = 0
+        if cache_file and os.path.exists(cache_file):
+            try:
+                with open(cache_file, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                if data.get("tokenizer") == tokenizer and data.get("variant", "") == variant:
+                    self._cache = data.get("counts", {})
+            except (OSError, ValueError):
+                pass
+
+    def _lookup(self, abs_path, st):
+        entry = self._cache.get(abs_path)
+        if entry is not None and entry[:3] == [st.st_size, st.st_mtime_ns, st.st_ino]:
+            return entry[3]
+        return None
+
+    def _count_content(self, content):
+        if isinstance(content, str):
+            return self.count_text(content)
+        # Anything else is an iterable of text chunks (e.g. a streamed large file)
+        return sum(self.count_text(chunk) for chunk in content)
+
+    def count_files(self, paths, read=read_text, stat=os.stat):
+        """
+        Return {path: token count}. Only files whose stat changed are read,
+        and those are read concurrently. 'read' returns the text of a file,
+        or an iterable of text chunks; 'stat' stands in for os.stat (e.g.
+        GitTree.stat when the files come from a commit).
+        """
+        counts = {}
+        stats = {}
+        stale = []
+        for path in paths:
+            try:
+                st = stat(path)
+            except OSError:
+                counts[path] = 0
+                continue
+            cached = self._lookup(os.path.abspath(path), st)
+            if cached is None:
+                stats[path] = st
+                stale.append(path)
+                self.misses += 1
+            else:
+                counts[path] = cached
+                self.hits += 1
+
+        count_one = lambda path: self._count_content(read(path))
+        sizes = lambda path: stats[path].st_size
+        for path, n in iter_file_contents(stale, read=count_one, size_of=sizes):
+            st = stats[path]
+            self._cache[os.path.abspath(path)] = [st.st_size, st.st_mtime_ns, st.st_ino, n]
+            self._dirty = True
+            counts[path] = n
+        return counts
+
+    def save(self):
+        if not self.cache_file or not self._dirty:
+            return
+        tmp = self.cache_file + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"tokenizer": self.tokenizer, "variant": self.variant, "counts": self._cache}, f)
+        os.replace(tmp, self.cache_file)
+        self._dirty = False
+
+
+def fit_to_budget(items, max_tokens, strategy="greedy"):
+    """
+    Choose which items to keep within 'max_tokens'.
+    'items' is a list of (key, tokens, priority); higher priority is more important.
+    - greedy: highest priority first, smaller files first within a priority,
+      skipping anything that no longer fits.
+    - knapsack: maximise the total priority of the kept items (0/1 knapsack on
+      token counts rounded to budget buckets). Falls back to greedy when the
+      table would be too large.
+    Returns the set of kept keys.
+    """
+    if max_tokens is None:
+        return {key for key, _, _ in items}
+    if strategy == "knapsack":
+        chosen = _fit_knapsack(items, max_tokens)
+        if chosen is not None:
+            return chosen
+    elif strategy != "greedy":
+        raise ValueError(f"Unknown fit strategy: {strategy}")
+
+    chosen = set()
+    used = 0
+    for key, tokens, _ in sorted(items, key=lambda item: (-item[2], item[1])):
+        if used + tokens <= max_tokens:
+            chosen.add(key)
+            used += tokens
+    return chosen
+
+
+def _fit_knapsack(items, max_tokens):
+    if max_tokens <= 0:
+        return set()
+    buckets = min(max_tokens, 2000)
+    scale = max_tokens / buckets
+    candidates = [(key, math.ceil(tokens / scale), priority)
+                  for key, tokens, priority in items if tokens <= max_tokens]
+    if len(candidates) * (buckets + 1) > KNAPSACK_MAX_CELLS:
+        return None
+
+    # best[w] = best total priority using capacity w; keep[i][w] records the choices
+    best = [0] * (buckets + 1)
+    keep = []
+    for _, weight, value in candidates:
+        took = bytearray(buckets + 1)
+        for w in range(buckets, weight - 1, -1):
+            with_item = best[w - weight] + value
+            if with_item > best[w]:
+                best[w] = with_item
+                took[w] = 1
+        keep.append(took)
+
+    chosen = set()
+    w = buckets
+    for i in range(len(candidates) - 1, -1, -1):
+        if keep[i][w]:
+            key, weight, _ = candidates[i]
+            chosen.add(key)
+            w -= weight
+    return chosen
@@ -0,0 +1,166 @@
+"""
+Tri-state selection over a NodeTable (see node_table.py).
+
+Only leaves (files and empty folders) carry a selected bit; a folder's state
+follows from how many of the leaves below it are selected. Each node keeps
+that count next to the precomputed number of leaves under it (for a leaf,
+the count is its own 0/1 bit). A folder is "checked" when all of its leaves
+are selected and "partial" when only some are.
+
+Because table ids are in pre-order, checking or unchecking a folder is a
+slice assignment over its id range rather than a walk over its children,
+and a toggle only has to adjust the counts of its ancestors, which is
+O(depth). Listing the selection skips every subtree whose count is 0, so it
+costs about as much as the selection itself, not the whole tree.
+"""
+import itertools
+from array import array
+
+from node_table import NO_NODE
+
+CHECKED = "checked"
+PARTIAL = "partial"
+UNCHECKED = "unchecked"
+
+
+def _zeros(n):
+    return array("i", bytes(array("i").itemsize * n))
+
+
+class TreeSelection:
+
+    def __init__(self, table):
+        self.table = table
+        leaves = bytes(1 if not is_dir or first == NO_NODE else 0
+                       for is_dir, first in zip(table.dir_flags, table.first_child))
+        prefix = array("i", itertools.accumulate(leaves, initial=0))
+        # Leaves in [i, subtree_end[i]) for every node, straight from the pre-order layout
+        self.total = array("i", (prefix[end] - prefix[i] for i, end in enumerate(table.subtree_end)))
+        self.count = _zeros(len(table))
+
+    def set(self, node, value):
+        """
+        Check (value=True) or uncheck 'node' and everything below it.
+        """
+        end = self.table.subtree_end[node]
+        before = self.count[node]
+        if value:
+            self.count[node:end] = self.total[node:end]
+        else:
+            self.count[node:end] = _zeros(end - node)
+        delta = self.count[node] - before
+        if delta:
+            parent = self.table.parent
+            node = parent[node]
+            while node != NO_NODE:
+                self.count[node] += delta
+                node = parent[node]
+
+    def clear(self):
+        self.set(0, False)
+
+    def state(self, node):
+        selected = self.count[node]
+        if selected == 0:
+            return UNCHECKED
+        return CHECKED if selected == self.total[node] else PARTIAL
+
+    def is_checked(self, node):
+        return self.count[node] > 0 and self.count[node] == self.total[node]
+
+    def counts(self, node):
+        """
+        (selected leaves, total leaves) under 'node'.
+        """
+        return self.count[node], self.total[node]
+
+    def shows(self, node):
+        """
+        Whether 'node' belongs in a tree of the selected items.
+        """
+        return self.count[node] > 0
+
+    def selected_leaves(self):
+        """
+        Ids of the selected files and empty folders, in tree order.
+        """
+        count, total, end_of = self.count, self.total, self.table.subtree_end
+        i, n = 0, len(self.table)
+        while i < n:
+            if count[i] == 0:
+                i = end_of[i]
+            elif count[i] == total[i]:
+                end = end_of[i]
+                yield from (j for j in range(i, end) if end_of[j] == j + 1)
+                i = end
+            else:
+                i += 1
+
+    def selected_files(self):
+        """
+        Ids of the selected files, in tree order.
+        """
+        dir_flags = self.table.dir_flags
+        return [node for node in self.selected_leaves() if not dir_flags[node]]
+
+    def replace_children(self, node, forest):
+        """
+        NodeTable.replace_children() on the selection's table, keeping the
+        selection of every node that is still there. New nodes come in
+        unselected, except under an empty folder that was checked. Costs
+        O(size of node's subtree + depth) on top of the table splice.
+        Returns the table's remap(old_id) function.
+        """
+        table = self.table
+        start, old_end = node + 1, table.subtree_end[node]
+        end_of = table.subtree_end
+        kept = [j for j in range(start, old_end) if self.count[j] and end_of[j] == j + 1]
+        was_leaf = old_end == start
+        was_checked_leaf = was_leaf and self.count[node] == 1
+
+        remap = table.replace_children(node, forest)
+        end_of, parent = table.subtree_end, table.parent
+        new_end = end_of[node]
+        leaves = bytes(1 if end_of[j] == j + 1 else 0 for j in range(start, new_end))
+        prefix = array("i", itertools.accumulate(leaves, initial=0))
+        total = array("i", (prefix[end_of[j] - start] - prefix[j - start] for j in range(start, new_end)))
+        if was_checked_leaf:
+            count = array("i", total)
+        else:
+            count = _zeros(new_end - start)
+            for old_id in kept:
+                new_id = remap(old_id)
+                if new_id is not None and end_of[new_id] == new_id + 1:
+                    count[new_id - start] = 1
+            for j in range(new_end - 1, start - 1, -1):
+                p = parent[j]
+                if p >= start:
+                    count[p - start] += count[j - start]
+        self.total[start:old_end] = total
+        self.count[start:old_end] = count
+
+        children = list(table.children(node))
+        new_total = sum(self.total[c] for c in children) if children else 1
+        if children:
+            new_count = sum(self.count[c] for c in children)
+        else:
+            new_count = self.count[node] if was_leaf else 0
+        d_total, d_count = new_total - self.total[node], new_count - self.count[node]
+        while node != NO_NODE:
+            self.total[node] += d_total
+            self.count[node] += d_count
+            node = parent[node]
+        return remap
+
+    def carry_over(self, old):
+        """
+        Re-apply another selection (e.g. from before a rescan) by path.
+        Paths that no longer exist are dropped.
+        """
+        old_table = old.table
+        wanted = {old_table.abs_path(node) for node in old.selected_leaves()}
+        if not wanted:
+            return
+        for node, path in self.table.iter_paths():
+            if path in wanted:
+                self.set(node, True)
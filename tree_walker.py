@@ -0,0 +1,227 @@
+"""
+Shared directory walker for print_files.py and the two apps.
+
+Each directory is read once with os.scandir, and the file/dir decision comes
+from the DirEntry itself, so there is no extra stat per entry. Directory reads
+are fanned out across a thread pool (this is what helps on network-backed
+disks), and the result is a plain {dir_path: sorted entries} map. Callers
+render from that map in sorted order, so the output is the same no matter how
+the reads were scheduled.
+
+A listing_cache.ListingCache can be passed in to reuse listings of
+directories that haven't changed since they were last read.
+
+With an IgnoreRules object (see ignore_rules.py), .gitignore/.contextignore
+patterns are applied while listing, so ignored directories are pruned before
+we descend into them rather than filtered out afterwards.
+
+Listings and what they kept or excluded are reported to the active
+run_stats.RunStats, if any.
+"""
+import os
+import queue
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import run_stats
+
+DEFAULT_WORKERS = min(32, (os.cpu_count() or 1) * 4)
+
+
+def file_extension(name):
+    """
+    os.path.splitext(name)[1] for a bare file name, without the generic path
+    handling (this runs once per file on every walk).
+    """
+    dot = name.rfind(".")
+    # Like splitext, dots at the very start of a name don't begin an extension
+    if dot <= 0 or name.count(".", 0, dot) == dot:
+        return ""
+    return name[dot:]
+
+
+def scandir_entries(path):
+    """
+    [(name, is_dir), ...] for one directory, unsorted and unfiltered.
+    Unreadable directories give an empty list.
+    """
+    start = time.perf_counter()
+    raw = []
+    try:
+        with os.scandir(path) as it:
+            for entry in it:
+                try:
+                    is_dir = entry.is_dir()
+                except OSError:
+                    is_dir = False
+                raw.append((entry.name, is_dir))
+    except OSError:
+        run_stats.add("dirs_unreadable")
+    run_stats.record("list", time.perf_counter() - start)
+    return raw
+
+
+def list_directory(path, allowed_extensions=None, exclude_dirs=(), ignore=None, listing_cache=None):
+    """
+    Read a single directory.
+    Returns a sorted list of (name, is_dir) tuples. Names in 'exclude_dirs'
+    are dropped, and files are only kept if their extension is in
+    'allowed_extensions' (None keeps every file). Unreadable directories
+    give an empty list.
+    """
+    return read_directory(path, allowed_extensions, exclude_dirs, ignore, listing_cache)[0]
+
+
+def read_directory(path, allowed_extensions, exclude_dirs, ignore, listing_cache=None):
+    """
+    list_directory(), plus the ignore rules in effect inside 'path'
+    (its own ignore files added), for passing down to its subdirectories.
+    With a listing cache, the filtered result is memoized too, per version
+    of the directory and per set of filters.
+    """
+    if listing_cache is None:
+        raw = scandir_entries(path)
+        if ignore is not None:
+            ignore = ignore.with_local_files(path, {name for name, _ in raw})
+        entries = _filter_entries(raw, allowed_extensions, exclude_dirs, ignore)
+        _report_listing(raw, entries)
+        return entries, ignore
+
+    listing = listing_cache.listing(path)
+    if ignore is not None:
+        ignore = ignore.with_local_files(path, listing.names)
+    key = (
+        frozenset(allowed_extensions) if allowed_extensions is not None else None,
+        frozenset(exclude_dirs),
+        ignore.chain if ignore is not None else None,
+    )
+    entries = listing.filtered.get(key)
+    if entries is None:
+        entries = _filter_entries(listing.entries, allowed_extensions, exclude_dirs, ignore)
+        listing.filtered[key] = entries
+    _report_listing(listing.entries, entries)
+    return entries, ignore
+
+
+def _report_listing(raw, entries):
+    stats = run_stats.active()
+    if stats is not None:
+        files = sum(1 for _, is_dir in entries if not is_dir)
+        stats.add("dirs_visited")
+        stats.add("files_visited", files)
+        stats.add("entries_excluded", len(raw) - len(entries))
+
+
+def _filter_entries(raw, allowed_extensions, exclude_dirs, ignore):
+    entries = []
+    for name, is_dir in raw:
+        if name in exclude_dirs:
+            continue
+        if not is_dir and allowed_extensions is not None:
+            if file_extension(name).lower() not in allowed_extensions:
+                continue
+        if ignore is not None and ignore.is_ignored(name, is_dir):
+            continue
+        entries.append((name, is_dir))
+    entries.sort()
+    return entries
+
+
+def scan_tree(root, allowed_extensions=None, exclude_dirs=(), workers=None, ignore=None,
+              listing_cache=None):
+    """
+    Walk everything under 'root'.
+    Returns {dir_path: [(name, is_dir), ...]} for every directory reached.
+    Child paths are built with os.path.join(parent, name), exactly like the
+    old recursive walkers, so keys line up with the paths they produced.
+    'ignore' is the IgnoreRules for root's entries (None disables ignore files).
+    """
+    workers = workers or DEFAULT_WORKERS
+    listings = {}
+
+    if workers <= 1:
+        stack = [(root, ignore)]
+        while stack:
+            path, rules = stack.pop()
+            entries, rules = read_directory(path, allowed_extensions, exclude_dirs, rules, listing_cache)
+            listings[path] = entries
+            stack.extend((os.path.join(path, name), rules and rules.descend(name))
+                         for name, is_dir in entries if is_dir)
+        return listings
+
+    results = queue.SimpleQueue()
+
+    @run_stats.carried
+    def read_one(path, rules):
+        try:
+            entries, rules = read_directory(path, allowed_extensions, exclude_dirs, rules, listing_cache)
+            results.put((path, entries, rules, None))
+        except BaseException as e:
+            results.put((path, None, None, e))
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pool.submit(read_one, root, ignore)
+        outstanding = 1
+        while outstanding:
+            path, entries, rules, error = results.get()
+            outstanding -= 1
+            if error is not None:
+                raise error
+            listings[path] = entries
+            for name, is_dir in entries:
+                if is_dir:
+                    pool.submit(read_one, os.path.join(path, name), rules and rules.descend(name))
+                    outstanding += 1
+
+    return listings
+
+
+def filter_paths(root, paths, allowed_extensions=None, exclude_dirs=(), ignore=None, listing_cache=None):
+    """
+    The files among 'paths' (below 'root') that scan_tree(root, ...) with
+    the same arguments would reach, in the order given. Only the directories
+    leading to them are listed, so this costs about as much as the number of
+    paths, not the size of the tree.
+    """
+    read = {}  # dir path -> (entries, rules), memoized across paths
+
+    def entries_of(dir_path, rules):
+        if dir_path not in read:
+            entries, rules = read_directory(dir_path, allowed_extensions, exclude_dirs, rules, listing_cache)
+            read[dir_path] = (set(entries), rules)
+        return read[dir_path]
+
+    kept = []
+    for path in paths:
+        rel = os.path.relpath(path, root)
+        if rel == os.curdir or rel == os.pardir or rel.startswith(os.pardir + os.sep):
+            continue
+        parts = rel.split(os.sep)
+        current, rules = root, ignore
+        for depth, name in enumerate(parts):
+            entries, rules = entries_of(current, rules)
+            is_dir = depth < len(parts) - 1
+            if (name, is_dir) not in entries:
+                break
+            rules = rules and rules.descend(name)
+            current = os.path.join(current, name)
+        else:
+            kept.append(path)
+    return kept
+
+
+def iter_tree(listings, root, prefix=""):
+    """
+    Yield (line_prefix, name, path, is_dir) for every entry below 'root',
+    depth first and in sorted order. 'line_prefix' already includes the
+    '├── ' / '└── ' connector, so a caller only has to append the name.
+    """
+    entries = listings.get(root, [])
+    last = len(entries) - 1
+    for i, (name, is_dir) in enumerate(entries):
+        path = os.path.join(root, name)
+        connector = "└── " if i == last else "├── "
+        yield prefix + connector, name, path, is_dir
+        if is_dir:
+            child_prefix = prefix + ("    " if i == last else "│   ")
+            yield from iter_tree(listings, path, child_prefix)